@@ -0,0 +1,188 @@
+"""
+异步视图（ASGI）
+
+在ASGI服务器（如uvicorn）下，Django默认把所有同步视图放到同一个线程中执行，
+一个耗时的上传或复制就会阻塞所有其他请求。这里的视图把views.py中的处理逻辑
+放到有界线程池中执行，事件循环本身不做任何阻塞的文件系统操作；
+流式响应（文件下载、打包下载、流式列目录）逐块在线程池中读取并异步发送，
+慢速连接在等待网络时不占用线程。
+
+请求体一般由Django的ASGIHandler异步读取（超过FILE_UPLOAD_MAX_MEMORY_SIZE时暂存到临时文件），
+视图在线程池中读取时不会阻塞事件循环。分块上传的PUT请求（STREAMING_BODY_ROUTES）
+由StreamingBodyASGIHandler边接收边交给视图写入数据文件，不在临时文件中暂存整个分块。
+
+gfinder/asgi.py默认启用这些视图（GFINDER_ASYNC_VIEWS）。
+"""
+import re
+import asyncio
+import functools
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+
+from . import views
+
+_executor = None
+_executor_lock = threading.Lock()
+_END = object()
+
+# 请求体边接收边由视图读取的请求：(方法, 路径)
+STREAMING_BODY_ROUTES = (
+    ('PUT', re.compile(r'^/api/upload/session/[^/]+$')),
+)
+
+_streaming_body = contextvars.ContextVar('gfinder_streaming_body', default=None)
+
+
+def get_executor():
+    """获取执行阻塞文件系统操作的有界线程池"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'GFINDER_ASYNC_WORKERS', 32),
+                    thread_name_prefix='gfinder-io'
+                )
+    return _executor
+
+
+async def run_blocking(func, *args, **kwargs):
+    """在线程池中执行阻塞函数"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), functools.partial(func, *args, **kwargs))
+
+
+async def _aiter_blocking(iterator):
+    """逐块在线程池中读取同步迭代器"""
+    while True:
+        chunk = await run_blocking(next, iterator, _END)
+        if chunk is _END:
+            return
+        yield chunk
+
+
+def _make_async_streaming(response):
+    """把同步的流式响应体转换为异步迭代器"""
+    if response.streaming and not response.is_async:
+        response.streaming_content = _aiter_blocking(iter(response.streaming_content))
+    return response
+
+
+class StreamingBody:
+    """
+    逐块从ASGI连接接收的请求体
+
+    视图在线程池中调用read()，由事件循环接收数据后交给读取线程。
+    """
+
+    def __init__(self, receive, loop):
+        self._receive = receive
+        self._loop = loop
+        self._buffer = bytearray()
+        self._more = True
+        self._finished = asyncio.Event()
+        self.disconnected = False
+
+    async def _read(self, size):
+        while self._more and (size < 0 or len(self._buffer) < size):
+            message = await self._receive()
+            if message['type'] == 'http.disconnect':
+                self.disconnected = True
+                self._more = False
+                break
+            self._buffer += message.get('body', b'')
+            self._more = message.get('more_body', False)
+        if not self._more:
+            self._finished.set()
+        if size < 0 or size > len(self._buffer):
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def read(self, size=-1):
+        """读取最多size个字节，请求体结束或连接断开后返回空"""
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            # 在事件循环中等待自身会死锁
+            raise RuntimeError("流式请求体只能在线程池中读取")
+        return asyncio.run_coroutine_threadsafe(self._read(-1 if size is None else size), self._loop).result()
+
+    async def receive_after_body(self):
+        """请求体接收完后才把连接交给Django检测断开，避免与read()争抢消息"""
+        await self._finished.wait()
+        if self.disconnected:
+            return {'type': 'http.disconnect'}
+        return await self._receive()
+
+    def close(self):
+        pass
+
+
+def _is_streaming_route(scope):
+    return any(
+        scope['method'] == method and pattern.match(scope['path'])
+        for method, pattern in STREAMING_BODY_ROUTES
+    )
+
+
+class StreamingBodyASGIHandler(ASGIHandler):
+    """STREAMING_BODY_ROUTES中的请求不预先读取请求体，其余请求与ASGIHandler相同"""
+
+    async def handle(self, scope, receive, send):
+        if not _is_streaming_route(scope):
+            return await super().handle(scope, receive, send)
+        body = StreamingBody(receive, asyncio.get_running_loop())
+        token = _streaming_body.set(body)
+        try:
+            return await super().handle(scope, body.receive_after_body, send)
+        finally:
+            _streaming_body.reset(token)
+
+    async def read_body(self, receive):
+        body = _streaming_body.get()
+        if body is not None:
+            return body
+        return await super().read_body(receive)
+
+
+def async_view(view):
+    """将同步视图包装为在线程池中执行的异步视图"""
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        response = await run_blocking(view, request, *args, **kwargs)
+        return _make_async_streaming(response)
+    return wrapper
+
+
+list_dir = async_view(views.list_dir)
+search_files = async_view(views.search_files)
+biggest_folders = async_view(views.biggest_folders)
+file_operations = async_view(views.file_operations)
+upload_file = async_view(views.upload_file)
+upload_instant = async_view(views.upload_instant)
+upload_session_create = async_view(views.upload_session_create)
+upload_session = async_view(views.upload_session)
+upload_session_commit = async_view(views.upload_session_commit)
+download_file = async_view(views.download_file)
+download_archive = async_view(views.download_archive)
+preview_file = async_view(views.preview_file)
+preview_text_window = async_view(views.preview_text_window)
+get_thumbnail = async_view(views.get_thumbnail)
+prefetch_thumbnails = async_view(views.prefetch_thumbnails)
+save_file = async_view(views.save_file)
+move_item = async_view(views.move_item)
+copy_item = async_view(views.copy_item)
+batch_operations = async_view(views.batch_operations)
+list_jobs = async_view(views.list_jobs)
+job_status = async_view(views.job_status)
+cancel_job = async_view(views.cancel_job)
+get_system_info = async_view(views.get_system_info)
+metrics = async_view(views.metrics)
@@ -0,0 +1,243 @@
+"""
+响应压缩
+
+按请求的Accept-Encoding协商zstd、brotli或gzip压缩API的JSON响应和文本预览。
+- 只压缩文本类内容；图片、压缩包、视频等已压缩的内容原样发送
+- 文件下载（FileResponse、附件和交给前端代理发送的响应）不压缩，保留Content-Length、
+  断点续传和sendfile零拷贝
+- 小于GFINDER_COMPRESSION_MIN_SIZE的响应不压缩，压缩后没有变小时发送原文
+- 流式响应（流式列目录）逐块压缩，每块后刷新压缩器，客户端可以边收边解析
+- 压缩后的ETag改为弱ETag（与原文内容不同），并去掉Accept-Ranges
+
+brotli和zstd分别需要安装Brotli和zstandard，未安装时只使用gzip。
+异步模式下压缩在线程池中执行，不阻塞事件循环。
+"""
+import zlib
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import FileResponse
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# 各编码的压缩级别：动态内容优先考虑速度
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+ZSTD_LEVEL = 3
+
+# 服务器的偏好顺序，客户端权重相同时使用靠前的编码
+_PREFERENCE = ('zstd', 'br', 'gzip')
+
+# 除text/*以外可以压缩的类型
+COMPRESSIBLE_TYPES = {
+    'application/json', 'application/x-ndjson', 'application/javascript', 'application/xml',
+    'application/x-yaml', 'application/yaml', 'application/x-sh', 'application/sql',
+    'application/toml', 'image/svg+xml',
+}
+
+
+def available_encodings():
+    """服务器支持的压缩编码，按偏好排序"""
+    encodings = []
+    for encoding in _PREFERENCE:
+        if encoding == 'zstd' and zstandard is None:
+            continue
+        if encoding == 'br' and brotli is None:
+            continue
+        encodings.append(encoding)
+    return encodings
+
+
+def negotiate(accept_encoding, encodings=None):
+    """
+    根据Accept-Encoding选择压缩编码
+
+    Returns:
+        编码名，客户端不接受任何可用编码时为None
+    """
+    if not accept_encoding:
+        return None
+    weights = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        weight = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name] = weight
+    default = weights.get('*', 0.0)
+    best = None
+    best_weight = 0.0
+    for encoding in encodings if encodings is not None else available_encodings():
+        weight = weights.get(encoding, default)
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+class StreamCompressor:
+    """统一gzip/brotli/zstd的流式压缩接口"""
+
+    def __init__(self, encoding, level=None):
+        self.encoding = encoding
+        if encoding == 'gzip':
+            # wbits=31输出gzip格式
+            self._obj = zlib.compressobj(level or GZIP_LEVEL, zlib.DEFLATED, 31)
+        elif encoding == 'br':
+            self._obj = brotli.Compressor(quality=level or BROTLI_QUALITY)
+        elif encoding == 'zstd':
+            self._obj = zstandard.ZstdCompressor(level=level or ZSTD_LEVEL).compressobj()
+        else:
+            raise ValueError(f"不支持的压缩编码: {encoding}")
+
+    def compress(self, data):
+        if self.encoding == 'br':
+            return self._obj.process(data)
+        return self._obj.compress(data)
+
+    def flush(self):
+        """输出目前为止的全部压缩数据，客户端可以立即解压"""
+        if self.encoding == 'gzip':
+            return self._obj.flush(zlib.Z_SYNC_FLUSH)
+        if self.encoding == 'br':
+            return self._obj.flush()
+        return self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        if self.encoding == 'br':
+            return self._obj.finish()
+        return self._obj.flush()
+
+
+def compress_bytes(encoding, data, level=None):
+    """一次性压缩完整数据"""
+    compressor = StreamCompressor(encoding, level)
+    return compressor.compress(data) + compressor.finish()
+
+
+def compress_chunks(encoding, chunks, level=None):
+    """逐块压缩同步迭代器，每块输出后刷新"""
+    compressor = StreamCompressor(encoding, level)
+    for chunk in chunks:
+        if chunk:
+            yield compressor.compress(chunk) + compressor.flush()
+    yield compressor.finish()
+
+
+async def acompress_chunks(encoding, chunks):
+    """逐块压缩异步迭代器，压缩在线程池中执行"""
+    from .async_views import run_blocking
+    compressor = StreamCompressor(encoding)
+
+    def compress(chunk):
+        return compressor.compress(chunk) + compressor.flush()
+
+    async for chunk in chunks:
+        if chunk:
+            yield await run_blocking(compress, chunk)
+    yield compressor.finish()
+
+
+def is_compressible(content_type):
+    media_type = content_type.split(';', 1)[0].strip().lower()
+    return media_type.startswith('text/') or media_type in COMPRESSIBLE_TYPES
+
+
+class CompressionMiddleware:
+    """按Accept-Encoding压缩响应，同时支持同步和异步请求处理"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        response = self.get_response(request)
+        encoding = self._select(request, response)
+        if encoding is None:
+            return response
+        if response.streaming:
+            response.streaming_content = compress_chunks(encoding, response.streaming_content)
+            self._finish(response, encoding, None)
+        else:
+            self._finish(response, encoding, compress_bytes(encoding, response.content))
+        return response
+
+    async def __acall__(self, request):
+        from .async_views import run_blocking
+        response = await self.get_response(request)
+        encoding = self._select(request, response)
+        if encoding is None:
+            return response
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = acompress_chunks(encoding, response.streaming_content)
+            else:
+                response.streaming_content = compress_chunks(encoding, response.streaming_content)
+            self._finish(response, encoding, None)
+        else:
+            self._finish(response, encoding, await run_blocking(compress_bytes, encoding, response.content))
+        return response
+
+    def _select(self, request, response):
+        """判断是否压缩，返回使用的编码"""
+        if not getattr(settings, 'GFINDER_COMPRESSION', True):
+            return None
+        if request.method == 'HEAD' or response.status_code != 200:
+            return None
+        if response.has_header('Content-Encoding') or response.has_header('X-Accel-Redirect') or \
+                response.has_header('X-Sendfile'):
+            return None
+        # 文件下载原样发送：压缩会去掉Content-Length和Accept-Ranges（无法续传、显示进度）并绕过sendfile
+        if isinstance(response, FileResponse) or \
+                response.get('Content-Disposition', '').lower().startswith('attachment'):
+            return None
+        if not is_compressible(response.get('Content-Type', '')):
+            return None
+        min_size = getattr(settings, 'GFINDER_COMPRESSION_MIN_SIZE', 1024)
+        if response.streaming:
+            length = response.get('Content-Length')
+            if length is not None and int(length) < min_size:
+                return None
+        elif len(response.content) < min_size:
+            return None
+        # 客户端和缓存需要按Accept-Encoding区分响应，不压缩时也要设置
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return negotiate(request.headers.get('Accept-Encoding', ''))
+
+    def _finish(self, response, encoding, content):
+        """设置压缩后的内容和响应头；content为None表示流式响应"""
+        if content is not None:
+            if len(content) >= len(response.content):
+                # 压缩后没有变小
+                return
+            response.content = content
+            response.headers['Content-Length'] = str(len(content))
+        else:
+            del response.headers['Content-Length']
+        response.headers['Content-Encoding'] = encoding
+        del response.headers['Accept-Ranges']
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
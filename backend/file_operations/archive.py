@@ -0,0 +1,271 @@
+"""
+流式打包下载
+
+将选中的文件和文件夹边读取边打包成ZIP（存储或deflate压缩）或TAR（可gzip压缩），
+以生成器逐块输出。不使用临时文件，也不在内存中保留文件内容，
+内存占用与归档大小无关；大文件和大量条目自动使用ZIP64。
+
+目录和文件都通过存储后端相对目录fd打开，打包期间条目被替换为符号链接也不会读到根目录以外。
+"""
+import os
+import stat
+import time
+import zlib
+import logging
+import tarfile
+import zipfile
+
+from .file_utils import is_valid_path, is_valid_name
+from .storage import get_storage
+
+logger = logging.getLogger(__name__)
+
+# 每次从磁盘读取的块大小
+CHUNK_SIZE = 256 * 1024
+
+# 支持的归档格式：(扩展名, MIME类型)
+ARCHIVE_FORMATS = {
+    'zip': ('.zip', 'application/zip'),
+    'tar': ('.tar', 'application/x-tar'),
+    'tgz': ('.tar.gz', 'application/gzip'),
+}
+
+ZIP_COMPRESSION = {
+    'store': zipfile.ZIP_STORED,
+    'deflate': zipfile.ZIP_DEFLATED,
+}
+
+# ZIP格式能表示的最早时间
+_ZIP_MIN_TIME = time.mktime((1980, 1, 1, 0, 0, 0, 0, 0, -1))
+
+
+class _StreamBuffer:
+    """只写缓冲区，生成器每写入一块后立即取走数据"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def resolve_selection(path, names):
+    """
+    校验选中的条目，返回[(归档内名称, stat结果)]
+
+    选中的符号链接在根目录内展开，指向根目录以外时报错。
+
+    Args:
+        path: 条目所在目录（相对根目录）
+        names: 条目名称列表
+    """
+    if not names:
+        raise ValueError("没有选择要下载的文件")
+    storage = get_storage()
+    selection = []
+    for name in names:
+        if not is_valid_name(name) or not is_valid_path(path):
+            raise ValueError(f"路径不合法: {name}")
+        try:
+            stat_info = storage.stat(path, name, follow=True)
+        except (FileNotFoundError, NotADirectoryError):
+            raise FileNotFoundError(f"文件或目录不存在: {name}")
+        selection.append((name, stat_info))
+    return selection
+
+
+def archive_filename(path, names, archive_format):
+    """生成下载文件名：单个条目用其名称，否则用所在目录名"""
+    if len(names) == 1:
+        base = names[0]
+    else:
+        base = os.path.basename(path.strip('/')) or 'download'
+    return base + ARCHIVE_FORMATS[archive_format][0]
+
+
+def _entry_location(path, arcname):
+    """归档内名称对应的(所在目录, 文件名)，都相对根目录"""
+    parent, _, name = arcname.rpartition('/')
+    return path + '/' + parent, name
+
+
+def _link_target_stat(path, name):
+    """目录树中的符号链接指向根目录下的普通文件时返回其stat结果，否则返回None"""
+    try:
+        stat_info = get_storage().stat(path, name, follow=True)
+    except (ValueError, OSError):
+        return None
+    return stat_info if stat.S_ISREG(stat_info.st_mode) else None
+
+
+def iter_entries(selection, path=''):
+    """
+    遍历选中的条目，生成(归档内名称, stat结果, 是否目录)
+
+    目录通过存储后端的目录fd读取，不跟随指向目录的符号链接，避免循环；
+    指向文件的符号链接在根目录内展开后按其内容打包，指向根目录以外的跳过。
+    path为选中条目所在的目录（相对根目录）。
+    """
+    storage = get_storage()
+    for arcname, stat_info in selection:
+        if not stat.S_ISDIR(stat_info.st_mode):
+            yield arcname, stat_info, False
+            continue
+
+        stack = [(arcname, stat_info)]
+        while stack:
+            dir_arcname, dir_stat = stack.pop()
+            yield dir_arcname, dir_stat, True
+            dir_path = path + '/' + dir_arcname
+            try:
+                with storage.directory(dir_path) as directory, directory.scandir() as it:
+                    children = sorted(it, key=lambda e: e.name, reverse=True)
+            except (OSError, ValueError) as e:
+                logger.error(f"打包时读取目录失败: {str(e)}")
+                continue
+            for entry in children:
+                child_arcname = dir_arcname + '/' + entry.name
+                try:
+                    if entry.is_symlink():
+                        target_stat = _link_target_stat(dir_path, entry.name)
+                        if target_stat is not None:
+                            yield child_arcname, target_stat, False
+                    elif entry.is_dir(follow_symlinks=False):
+                        stack.append((child_arcname, entry.stat(follow_symlinks=False)))
+                    elif entry.is_file(follow_symlinks=False):
+                        yield child_arcname, entry.stat(follow_symlinks=False), False
+                except OSError:
+                    # 条目在遍历期间被删除
+                    continue
+
+
+def _open_entry(path, arcname):
+    """通过存储后端打开条目（符号链接在根目录内展开），无法读取时记录错误并返回None"""
+    try:
+        return get_storage().open(*_entry_location(path, arcname), 'rb')
+    except (OSError, ValueError) as e:
+        logger.error(f"打包时读取文件失败: {str(e)}")
+        return None
+
+
+def _read_chunks(file_obj, size):
+    """读取文件的前size个字节；文件在打包期间变短时以0补齐，保证归档结构正确"""
+    remaining = size
+    while remaining > 0:
+        data = file_obj.read(min(CHUNK_SIZE, remaining))
+        if not data:
+            data = b'\0' * min(CHUNK_SIZE, remaining)
+        remaining -= len(data)
+        yield data
+
+
+def zip_stream(entries, path='', compression='deflate'):
+    """以ZIP格式流式输出，path为条目所在的目录"""
+    compress_type = ZIP_COMPRESSION[compression]
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', compression=compress_type, allowZip64=True) as zf:
+        for arcname, stat_info, is_dir in entries:
+            date_time = time.localtime(max(stat_info.st_mtime, _ZIP_MIN_TIME))[:6]
+            if is_dir:
+                zinfo = zipfile.ZipInfo(arcname + '/', date_time)
+                zinfo.external_attr = (stat_info.st_mode & 0xFFFF) << 16 | 0x10
+                zf.writestr(zinfo, b'', compress_type=zipfile.ZIP_STORED)
+            else:
+                src = _open_entry(path, arcname)
+                if src is None:
+                    continue
+                zinfo = zipfile.ZipInfo(arcname, date_time)
+                zinfo.external_attr = (stat_info.st_mode & 0xFFFF) << 16
+                zinfo.compress_type = compress_type
+                # 预先给出大小，超过4GB的文件自动使用ZIP64扩展
+                zinfo.file_size = stat_info.st_size
+                with src, zf.open(zinfo, 'w') as dest:
+                    for data in _read_chunks(src, stat_info.st_size):
+                        dest.write(data)
+                        chunk = buffer.drain()
+                        if chunk:
+                            yield chunk
+            chunk = buffer.drain()
+            if chunk:
+                yield chunk
+    # 中央目录在关闭时写入
+    chunk = buffer.drain()
+    if chunk:
+        yield chunk
+
+
+def tar_stream(entries, path='', gzip_output=False):
+    """以TAR格式流式输出，path为条目所在的目录，gzip_output为True时输出.tar.gz"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip_output else None
+    written = 0
+
+    def emit(data):
+        nonlocal written
+        written += len(data)
+        return compressor.compress(data) if compressor else data
+
+    for arcname, stat_info, is_dir in entries:
+        tarinfo = tarfile.TarInfo(arcname)
+        tarinfo.mtime = int(stat_info.st_mtime)
+        tarinfo.mode = stat.S_IMODE(stat_info.st_mode)
+        src = None
+        if is_dir:
+            tarinfo.type = tarfile.DIRTYPE
+        else:
+            src = _open_entry(path, arcname)
+            if src is None:
+                continue
+            tarinfo.size = stat_info.st_size
+
+        # PAX格式支持超长和非ASCII文件名以及超过8GB的文件
+        chunk = emit(tarinfo.tobuf(tarfile.PAX_FORMAT, 'utf-8', 'surrogateescape'))
+        if chunk:
+            yield chunk
+        if src is not None:
+            with src:
+                for data in _read_chunks(src, tarinfo.size):
+                    chunk = emit(data)
+                    if chunk:
+                        yield chunk
+            padding = -tarinfo.size % tarfile.BLOCKSIZE
+            if padding:
+                chunk = emit(b'\0' * padding)
+                if chunk:
+                    yield chunk
+
+    # 结束标记为两个空块，整体补齐到记录大小
+    end = b'\0' * (2 * tarfile.BLOCKSIZE)
+    end += b'\0' * (-(written + len(end)) % tarfile.RECORDSIZE)
+    chunk = emit(end)
+    if compressor:
+        chunk += compressor.flush()
+    yield chunk
+
+
+def archive_stream(path, names, archive_format='zip', compression='deflate'):
+    """
+    打包选中的条目
+
+    在开始输出前完成参数和路径校验，错误以异常抛出。
+
+    Returns:
+        生成器，逐块输出归档内容
+    """
+    if archive_format not in ARCHIVE_FORMATS:
+        raise ValueError(f"不支持的归档格式: {archive_format}")
+    if compression not in ZIP_COMPRESSION:
+        raise ValueError(f"不支持的压缩方式: {compression}")
+    selection = resolve_selection(path, names)
+    entries = iter_entries(selection, path)
+    if archive_format == 'zip':
+        return zip_stream(entries, path, compression)
+    return tar_stream(entries, path, gzip_output=archive_format == 'tgz')
@@ -0,0 +1,240 @@
+"""
+批量文件操作
+
+一次请求提交多个删除、移动、复制、重命名、新建操作：先校验全部操作，有不合法的操作时整批拒绝；
+然后按涉及的路径把操作分组，路径相同或互为祖先的操作（如先新建目录再移入文件）
+归入同一组并按提交顺序执行，不同组之间互不影响，在有界线程池中并发执行。
+每个操作单独返回结果，某个操作失败不影响其他操作。
+"""
+import os
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from .file_utils import (
+    is_valid_path, is_valid_name, create_directory, create_file, rename_item,
+    delete_item, move_entry, copy_entry, entry_exists, check_transfer_paths, target_inside_source,
+)
+from .jobs import get_job_manager
+
+logger = logging.getLogger(__name__)
+
+# 一次最多提交的操作数
+BATCH_MAX_OPERATIONS = 10000
+
+# 各操作的参数：(名称字段, 参数字段)，名称字段必须是单个文件名
+OPERATIONS = {
+    'delete': (('name',), ('path', 'name')),
+    'create_directory': (('name',), ('path', 'name')),
+    'create_file': (('name',), ('path', 'name', 'content')),
+    'rename': (('old_name', 'new_name'), ('path', 'old_name', 'new_name')),
+    'move': (('source_name',), ('source_path', 'source_name', 'target_path')),
+    'copy': (('source_name',), ('source_path', 'source_name', 'target_path')),
+}
+
+# 可以转为后台任务执行的操作
+BACKGROUND_OPERATIONS = ('delete', 'move', 'copy')
+
+
+def _join(path, name):
+    return os.path.normpath(os.path.join(path.strip('/'), name)).replace(os.sep, '/')
+
+
+def _validate(operation):
+    """
+    校验单个操作
+
+    Returns:
+        (操作类型, 参数字典, 操作涉及的相对路径列表)
+    """
+    if not isinstance(operation, dict):
+        raise ValueError("操作必须是对象")
+    op_type = operation.get('operation')
+    if op_type not in OPERATIONS:
+        raise ValueError(f"不支持的操作: {op_type}")
+    name_fields, fields = OPERATIONS[op_type]
+    params = {}
+    for field in fields:
+        value = operation.get(field, '')
+        if not isinstance(value, str):
+            raise ValueError(f"{field}必须是字符串")
+        params[field] = value
+    for field in name_fields:
+        name = params[field]
+        if not is_valid_name(name):
+            raise ValueError(f"文件名不合法: {name}")
+
+    if op_type in ('move', 'copy'):
+        if not is_valid_path(params['source_path']) or not is_valid_path(params['target_path']):
+            raise ValueError("路径不合法")
+        # 执行前拒绝移动/复制到自身下级，避免后台任务把目录复制进自身
+        if target_inside_source(params['source_path'], params['source_name'], params['target_path']):
+            raise ValueError("不能移动或复制到自身或其子文件夹中")
+        touched = [
+            _join(params['source_path'], params['source_name']),
+            _join(params['target_path'], params['source_name']),
+        ]
+    else:
+        if not is_valid_path(params['path']):
+            raise ValueError("路径不合法")
+        touched = [_join(params['path'], params[field]) for field in name_fields]
+    params['background'] = bool(operation.get('background')) and op_type in BACKGROUND_OPERATIONS
+    return op_type, params, touched
+
+
+def validate_operations(operations):
+    """
+    校验全部操作
+
+    Returns:
+        (操作列表[(类型, 参数)], 各操作涉及的路径, 错误列表[{'index', 'error'}])
+    """
+    if not isinstance(operations, list) or not operations:
+        raise ValueError("operations必须是非空列表")
+    if len(operations) > BATCH_MAX_OPERATIONS:
+        raise ValueError(f"一次最多提交{BATCH_MAX_OPERATIONS}个操作")
+    validated = []
+    touched = []
+    errors = []
+    for index, operation in enumerate(operations):
+        try:
+            op_type, params, paths = _validate(operation)
+        except ValueError as e:
+            errors.append({'index': index, 'error': str(e)})
+            continue
+        validated.append((op_type, params))
+        touched.append(paths)
+    return validated, touched, errors
+
+
+def conflict_groups(touched):
+    """
+    按涉及的路径分组
+
+    路径相同或互为祖先的操作有依赖，归入同一组（并查集）。
+
+    Returns:
+        组列表，每组为操作序号的升序列表
+    """
+    parent = list(range(len(touched)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(i, j):
+        ri, rj = find(i), find(j)
+        if ri != rj:
+            parent[max(ri, rj)] = min(ri, rj)
+
+    # 路径 -> 涉及该路径的一个操作（涉及同一路径的操作已在同一组）
+    exact = {}
+    # 路径 -> 涉及其下级路径的操作
+    under = {}
+    for i, paths in enumerate(touched):
+        for path in paths:
+            parts = path.split('/')
+            prefixes = ['/'.join(parts[:k]) for k in range(1, len(parts) + 1)]
+            for prefix in prefixes:
+                if prefix in exact:
+                    union(i, exact[prefix])
+            if path in under:
+                for j in under[path]:
+                    union(i, j)
+                # 这些操作已经合并到一组，保留一个即可
+                under[path] = [i]
+            exact.setdefault(path, i)
+            for prefix in prefixes[:-1]:
+                under.setdefault(prefix, []).append(i)
+
+    groups = {}
+    for i in range(len(touched)):
+        groups.setdefault(find(i), []).append(i)
+    return list(groups.values())
+
+
+def _status_for(error):
+    if isinstance(error, FileNotFoundError):
+        return 404
+    if isinstance(error, (FileExistsError, IsADirectoryError, NotADirectoryError, ValueError)):
+        return 400
+    return 500
+
+
+def _execute(op_type, params):
+    """执行单个操作，返回结果字典"""
+    if params['background']:
+        if op_type == 'delete':
+            if not entry_exists(params['path'], params['name']):
+                raise FileNotFoundError(f"文件或目录不存在: {params['name']}")
+            job_params = {'path': params['path'], 'name': params['name']}
+        else:
+            check_transfer_paths(params['source_path'], params['source_name'], params['target_path'])
+            job_params = {key: params[key] for key in ('source_path', 'source_name', 'target_path')}
+        return {'job': get_job_manager().submit(op_type, job_params)}
+
+    if op_type == 'delete':
+        return {'result': delete_item(params['path'], params['name'])}
+    if op_type == 'create_directory':
+        return {'result': create_directory(params['path'], params['name'])}
+    if op_type == 'create_file':
+        return {'result': create_file(params['path'], params['name'], params['content'])}
+    if op_type == 'rename':
+        return {'result': rename_item(params['path'], params['old_name'], params['new_name'])}
+    if op_type == 'move':
+        return {'result': move_entry(params['source_path'], params['source_name'], params['target_path'])}
+    return {'result': copy_entry(params['source_path'], params['source_name'], params['target_path'])}
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=max(1, getattr(settings, 'GFINDER_BATCH_WORKERS', 8)),
+                    thread_name_prefix='gfinder-batch',
+                )
+    return _executor
+
+
+def run_batch(operations, touched):
+    """
+    执行已校验的操作
+
+    Args:
+        operations: validate_operations返回的操作列表
+        touched: 各操作涉及的路径
+
+    Returns:
+        与operations顺序对应的结果列表，每项包含index、success，以及result/job或error/status
+    """
+    results = [None] * len(operations)
+
+    def run_group(group):
+        for index in group:
+            op_type, params = operations[index]
+            try:
+                results[index] = dict(_execute(op_type, params), index=index, success=True)
+            except Exception as e:
+                status = _status_for(e)
+                if status == 500:
+                    logger.error(f"批量操作错误 {op_type}: {str(e)}")
+                results[index] = {'index': index, 'success': False, 'error': str(e), 'status': status}
+
+    groups = conflict_groups(touched)
+    if len(groups) == 1:
+        run_group(groups[0])
+    else:
+        # 等待全部组完成；run_group自身捕获了操作的异常
+        for future in [_get_executor().submit(run_group, group) for group in groups]:
+            future.result()
+    return results
@@ -0,0 +1,215 @@
+"""
+内容哈希索引和秒传
+
+记录根目录下文件内容的SHA-256。哈希在上传时计算（普通上传边接收边计算，分块上传在提交时计算），
+不需要额外读取已有文件。客户端上传前先提交文件大小和SHA-256，索引中存在相同内容的文件时，
+服务器直接在本地创建目标文件（硬链接，或reflink/内核复制），无需再传输数据。
+
+索引中的每条记录同时保存文件的(st_dev, st_ino, st_size, st_mtime_ns)，
+查找时与文件当前的stat比较，文件被修改、移动或删除后记录失效并被清除。
+查找、链接和复制都通过存储后端相对目录fd进行，不会经由替换进来的符号链接离开根目录。
+"""
+import os
+import re
+import stat
+import sqlite3
+import logging
+import threading
+
+from django.conf import settings
+
+from .file_utils import get_state_directory, is_valid_path, is_valid_name, invalidate_directory
+from .storage import get_storage
+from .copy_engine import copy_file_obj
+
+logger = logging.getLogger(__name__)
+
+_SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+
+# 每次查找最多检查的候选文件数
+MAX_CANDIDATES = 16
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS content (
+    path TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    dev INTEGER NOT NULL,
+    ino INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS content_hash ON content(sha256, size);
+'''
+
+
+def _signature(stat_info):
+    return (stat_info.st_dev, stat_info.st_ino, stat_info.st_size, stat_info.st_mtime_ns)
+
+
+def _split(rel_path):
+    """相对根目录的路径拆分为(所在目录, 文件名)"""
+    parent, _, name = rel_path.rpartition('/')
+    return parent, name
+
+
+class ContentIndex:
+    """内容哈希索引，SQLite存储，多个进程可以同时读写"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(_SCHEMA)
+
+    def _connect(self):
+        """获取当前线程的数据库连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def record(self, rel_path, sha256, stat_info):
+        """记录文件的内容哈希"""
+        dev, ino, size, mtime_ns = _signature(stat_info)
+        self._connect().execute(
+            'INSERT OR REPLACE INTO content (path, sha256, size, dev, ino, mtime_ns) VALUES (?, ?, ?, ?, ?, ?)',
+            (rel_path, sha256, size, dev, ino, mtime_ns),
+        )
+
+    def find(self, sha256, size):
+        """
+        查找内容相同且未被修改的文件
+
+        Returns:
+            文件相对根目录的路径，不存在时为None
+        """
+        conn = self._connect()
+        rows = conn.execute(
+            'SELECT path, dev, ino, size, mtime_ns FROM content WHERE sha256 = ? AND size = ? LIMIT ?',
+            (sha256, size, MAX_CANDIDATES),
+        ).fetchall()
+        stale = []
+        found = None
+        storage = get_storage()
+        for rel_path, *recorded in rows:
+            try:
+                stat_info = storage.stat(*_split(rel_path))
+            except (OSError, ValueError):
+                stale.append(rel_path)
+                continue
+            if stat.S_ISREG(stat_info.st_mode) and _signature(stat_info) == tuple(recorded):
+                found = rel_path
+                break
+            stale.append(rel_path)
+        if stale:
+            conn.executemany('DELETE FROM content WHERE path = ?', [(rel_path,) for rel_path in stale])
+        return found
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_content_index():
+    """获取进程内共享的内容哈希索引，未启用秒传或存储不是单个本地目录时返回None"""
+    global _index
+    if not getattr(settings, 'GFINDER_INSTANT_UPLOAD', True):
+        return None
+    if get_storage().root_dir is None:
+        return None
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = ContentIndex(os.path.join(get_state_directory('content'), 'index.sqlite3'))
+    return _index
+
+
+def record_content_hash(path, filename, sha256):
+    """上传完成后记录文件的内容哈希；索引出错不影响上传结果"""
+    index = get_content_index()
+    if index is None:
+        return
+    rel_path = '/'.join(part for part in (path.strip('/'), filename) if part)
+    try:
+        index.record(rel_path, sha256, get_storage().stat(path, filename))
+    except (OSError, ValueError, sqlite3.Error) as e:
+        logger.warning(f"记录内容哈希失败 {rel_path}: {str(e)}")
+
+
+def _link_or_copy(storage, source, path, tmp_name):
+    """在path下创建与source内容相同的文件tmp_name，返回使用的方式"""
+    if getattr(settings, 'GFINDER_INSTANT_UPLOAD_HARDLINK', False):
+        try:
+            storage.link(*_split(source), path, tmp_name)
+            return 'hardlink'
+        except OSError:
+            # 跨文件系统或文件系统不支持硬链接
+            pass
+    with storage.open(*_split(source), 'rb', follow=False) as fsrc, storage.open(path, tmp_name, 'xb') as fdst:
+        copy_file_obj(fsrc, fdst)
+        source_stat = storage.fstat(fsrc)
+        # 与copy_file一样保留权限和时间
+        if os.chmod in os.supports_fd:
+            os.chmod(fdst.fileno(), stat.S_IMODE(source_stat.st_mode))
+        if os.utime in os.supports_fd:
+            os.utime(fdst.fileno(), ns=(source_stat.st_atime_ns, source_stat.st_mtime_ns))
+    return 'copy'
+
+
+def instant_upload(path, filename, size, sha256):
+    """
+    秒传：已有相同内容的文件时直接在服务器上创建目标文件
+
+    Args:
+        path: 目标目录（相对根目录）
+        filename: 目标文件名，已存在时覆盖（与普通上传一致）
+        size: 文件大小
+        sha256: 文件内容的SHA-256（十六进制）
+
+    Returns:
+        dict: instant为False时客户端需要正常上传
+    """
+    if not is_valid_name(filename) or not is_valid_path(path):
+        raise ValueError("路径不合法")
+    sha256 = (sha256 or '').strip().lower()
+    if not _SHA256_RE.match(sha256):
+        raise ValueError("sha256格式不正确")
+    size = int(size)
+    if size < 0:
+        raise ValueError("文件大小不合法")
+
+    storage = get_storage()
+    with storage.directory(path):
+        pass
+
+    index = get_content_index()
+    source = index.find(sha256, size) if index is not None else None
+    if source is None:
+        return {'instant': False}
+
+    source_stat = storage.stat(*_split(source))
+    try:
+        target_stat = storage.stat(path, filename)
+    except FileNotFoundError:
+        target_stat = None
+    if target_stat is not None and \
+            (target_stat.st_dev, target_stat.st_ino) == (source_stat.st_dev, source_stat.st_ino):
+        return {'instant': True, 'filename': filename, 'size': size, 'method': 'existing'}
+
+    tmp_name = f'.{filename}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        method = _link_or_copy(storage, source, path, tmp_name)
+        storage.rename(path, tmp_name, filename)
+    except BaseException:
+        try:
+            storage.remove(path, tmp_name)
+        except FileNotFoundError:
+            pass
+        raise
+    finally:
+        invalidate_directory(path)
+    record_content_hash(path, filename, sha256)
+    return {'instant': True, 'filename': filename, 'size': size, 'method': method}
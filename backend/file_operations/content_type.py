@@ -0,0 +1,225 @@
+"""
+文件内容类型检测
+
+mimetypes.guess_type只看扩展名，没有扩展名或扩展名不对的文件得不到正确的类型。
+这里用libmagic（python-magic）检测文件开头的几KB，结果按(st_dev, st_ino, st_mtime_ns, st_size)
+缓存在内存LRU中，文件未修改时不会重复读取文件头。
+
+libmagic对纯文本只能给出text/plain这样的笼统结果，此时如果扩展名给出了更具体的类型
+（如.css、.js）则使用扩展名的类型。未安装python-magic时退回到按扩展名判断。
+
+批量检测时只读取普通文件，未命中缓存的文件在线程池中并发读取文件头。
+"""
+import stat
+import logging
+import mimetypes
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from .storage import get_storage
+from ..metrics import cache_result
+
+try:
+    import magic
+except ImportError:  # python-magic未安装或找不到libmagic
+    magic = None
+
+logger = logging.getLogger(__name__)
+
+# 读取文件开头的字节数
+SNIFF_BYTES = 8192
+
+# libmagic给出这些笼统的类型时，优先使用扩展名的类型
+GENERIC_TYPES = {'text/plain', 'application/octet-stream', 'application/x-empty', 'inode/x-empty'}
+
+# 可以按文本预览的非text/*类型
+TEXT_APPLICATION_TYPES = {
+    'application/json', 'application/xml', 'application/javascript', 'application/x-javascript',
+    'application/x-yaml', 'application/yaml', 'application/x-sh', 'application/x-shellscript',
+    'application/sql', 'application/toml', 'image/svg+xml',
+}
+
+
+def available():
+    """是否可以使用libmagic检测内容"""
+    return magic is not None
+
+
+def preview_kind(mimetype):
+    """根据MIME类型判断预览方式：'text' / 'image' / 'pdf'，不支持预览时为None"""
+    if not mimetype:
+        return None
+    if mimetype.startswith('text/') or mimetype in TEXT_APPLICATION_TYPES:
+        return 'text'
+    if mimetype.startswith('image/'):
+        return 'image'
+    if mimetype == 'application/pdf':
+        return 'pdf'
+    return None
+
+
+class ContentTypeDetector:
+    """
+    带缓存的内容类型检测
+
+    Args:
+        max_entries: 缓存的检测结果数
+        workers: 批量检测的线程数
+    """
+
+    def __init__(self, max_entries=100000, workers=8):
+        self.max_entries = max_entries
+        self.workers = max(1, workers)
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        # libmagic的句柄不能在线程间共享，每个线程使用自己的句柄
+        self._local = threading.local()
+        self._executor = None
+
+    def _magic(self):
+        handle = getattr(self._local, 'magic', None)
+        if handle is None:
+            handle = self._local.magic = magic.Magic(mime=True)
+        return handle
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix='gfinder-mime'
+                )
+            return self._executor
+
+    @staticmethod
+    def _cache_key(stat_info):
+        return (stat_info.st_dev, stat_info.st_ino, stat_info.st_mtime_ns, stat_info.st_size)
+
+    def _cached(self, key):
+        with self._lock:
+            mimetype = self._entries.get(key)
+            if mimetype is not None:
+                self._entries.move_to_end(key)
+        cache_result('content_type', mimetype is not None)
+        return mimetype
+
+    def _store(self, key, mimetype):
+        with self._lock:
+            self._entries[key] = mimetype
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _sniff(self, storage, path, name):
+        """
+        通过存储后端打开文件读取文件头交给libmagic，不是普通文件或无法读取时返回None
+
+        存储后端经目录fd打开文件（只读时带O_NONBLOCK），不会因FIFO等特殊文件阻塞，
+        也不会跟随指向根目录以外的符号链接。
+        """
+        try:
+            with storage.open(path, name, 'rb') as f:
+                if not stat.S_ISREG(storage.fstat(f).st_mode):
+                    return None
+                head = f.read(SNIFF_BYTES)
+        except (OSError, ValueError):
+            return None
+        return self._from_buffer(head, name)
+
+    def _from_buffer(self, head, name):
+        try:
+            return self._magic().from_buffer(head)
+        except Exception as e:
+            logger.warning(f"检测文件类型失败 {name}: {str(e)}")
+            return None
+
+    @staticmethod
+    def _combine(guessed, sniffed):
+        if sniffed is None or (sniffed in GENERIC_TYPES and guessed):
+            return guessed
+        return sniffed
+
+    def detect_file(self, file_obj, name, stat_info):
+        """
+        检测已打开文件的MIME类型，读取文件头后回到开头
+
+        Args:
+            file_obj: 以二进制方式打开的文件
+            name: 文件名，用于按扩展名判断
+            stat_info: 存储后端给出的stat结果，用作缓存键
+        """
+        guessed, _ = mimetypes.guess_type(name)
+        if magic is None:
+            return guessed
+        key = self._cache_key(stat_info)
+        sniffed = self._cached(key)
+        if sniffed is None:
+            head = file_obj.read(SNIFF_BYTES)
+            file_obj.seek(0)
+            sniffed = self._from_buffer(head, name)
+            if sniffed is not None:
+                self._store(key, sniffed)
+        return self._combine(guessed, sniffed)
+
+    def detect_many(self, path, names):
+        """
+        批量检测目录path下的文件：命中缓存的直接返回，其余文件在线程池中并发读取文件头
+
+        只读取普通文件，其他类型的条目按扩展名判断。
+
+        Returns:
+            与names顺序对应的MIME类型列表
+        """
+        results = [mimetypes.guess_type(name)[0] for name in names]
+        if magic is None:
+            return results
+        storage = get_storage()
+        misses = []
+        for i, name in enumerate(names):
+            try:
+                stat_info = storage.stat(path, name, follow=True)
+            except (OSError, ValueError):
+                continue
+            if not stat.S_ISREG(stat_info.st_mode):
+                continue
+            key = self._cache_key(stat_info)
+            sniffed = self._cached(key)
+            if sniffed is None:
+                misses.append((i, name, key))
+            else:
+                results[i] = self._combine(results[i], sniffed)
+        if len(misses) > 1:
+            sniffed_types = self._get_executor().map(
+                lambda name: self._sniff(storage, path, name), [name for _, name, _ in misses]
+            )
+        else:
+            sniffed_types = [self._sniff(storage, path, name) for _, name, _ in misses]
+        for (i, _, key), sniffed in zip(misses, sniffed_types):
+            if sniffed is not None:
+                self._store(key, sniffed)
+            results[i] = self._combine(results[i], sniffed)
+        return results
+
+
+_detector = None
+_detector_lock = threading.Lock()
+
+
+def get_content_type_detector():
+    """获取进程内共享的内容类型检测器"""
+    global _detector
+    if _detector is None:
+        with _detector_lock:
+            if _detector is None:
+                _detector = ContentTypeDetector(
+                    max_entries=getattr(settings, 'GFINDER_MIME_CACHE_SIZE', 100000),
+                    workers=getattr(settings, 'GFINDER_MIME_WORKERS', 8),
+                )
+    return _detector
+
+
+def detect_file_content_type(file_obj, name, stat_info):
+    """检测已打开文件的MIME类型"""
+    return get_content_type_detector().detect_file(file_obj, name, stat_info)
@@ -0,0 +1,192 @@
+"""
+目录元数据缓存
+
+缓存list_directory的结果，按目录完整路径索引，LRU淘汰。
+每次命中都会用目录的(st_dev, st_ino, st_mtime_ns)校验，目录内增删改名会使缓存失效；
+inotify可用时还会监视已缓存的目录，目录内文件内容或属性的修改也会立即失效。
+写操作（上传、移动、复制、删除等）完成后应调用invalidate/invalidate_tree主动清除。
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from . import fs_events
+from ..metrics import fs_timer, cache_result
+
+# 目录mtime距当前时间小于该值时不缓存，避免文件系统时间戳精度不足导致漏检修改
+RACY_WINDOW = 1.0
+
+
+def directory_signature(target_dir):
+    """获取目录的校验签名（target_dir可以是路径或目录fd）"""
+    with fs_timer('stat'):
+        stat_info = os.stat(target_dir)
+    return (stat_info.st_dev, stat_info.st_ino, stat_info.st_mtime_ns)
+
+
+def compute_etag(items):
+    """根据目录条目计算强ETag"""
+    payload = json.dumps(items, ensure_ascii=False).encode('utf-8')
+    return '"%s"' % hashlib.sha1(payload).hexdigest()
+
+
+class _CacheEntry:
+    __slots__ = ('signature', 'items', 'etag', 'stored_at')
+
+    def __init__(self, signature, items, etag, stored_at):
+        self.signature = signature
+        self.items = items
+        self.etag = etag
+        self.stored_at = stored_at
+
+
+class DirectoryCache:
+    """
+    有界LRU目录缓存
+
+    Args:
+        max_entries: 最多缓存的目录数
+        max_items: 所有目录条目总数上限
+        ttl: 缓存最长有效秒数，用于兜底未通过inotify观察到的外部修改
+        use_inotify: inotify可用时是否监视已缓存目录
+    """
+
+    def __init__(self, max_entries=256, max_items=1000000, ttl=30, use_inotify=True):
+        self.max_entries = max_entries
+        self.max_items = max_items
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._total_items = 0
+        self._watcher = None
+        if use_inotify and fs_events.available():
+            self._watcher = fs_events.InotifyWatcher(self._on_event, name='gfinder-dircache')
+
+    def get(self, target_dir, signature=None):
+        """
+        获取仍然有效的缓存，返回(条目列表, ETag)或None
+
+        signature为返回目录当前签名的函数（如已打开目录的fstat），默认按路径stat。
+        """
+        with self._lock:
+            entry = self._entries.get(target_dir)
+            if entry is not None:
+                self._entries.move_to_end(target_dir)
+        if entry is None:
+            cache_result('directory', False)
+            return None
+
+        valid = time.monotonic() - entry.stored_at < self.ttl
+        if valid:
+            try:
+                current = signature() if signature is not None else directory_signature(target_dir)
+                valid = current == entry.signature
+            except OSError:
+                valid = False
+        if not valid:
+            self._discard(target_dir, entry)
+            cache_result('directory', False)
+            return None
+
+        cache_result('directory', True)
+        return entry.items, entry.etag
+
+    def put(self, target_dir, signature, items):
+        """
+        缓存目录内容，返回ETag
+
+        signature应在读取目录之前获取，这样读取期间发生的修改会在下次校验时被发现。
+        """
+        etag = compute_etag(items)
+        if time.time() - signature[2] / 1e9 < RACY_WINDOW:
+            return etag
+        if len(items) > self.max_items:
+            return etag
+
+        entry = _CacheEntry(signature, items, etag, time.monotonic())
+        evicted = []
+        with self._lock:
+            old = self._entries.pop(target_dir, None)
+            if old is not None:
+                self._total_items -= len(old.items)
+            self._entries[target_dir] = entry
+            self._total_items += len(items)
+            while self._entries and (len(self._entries) > self.max_entries or
+                                     self._total_items > self.max_items):
+                key, removed = self._entries.popitem(last=False)
+                self._total_items -= len(removed.items)
+                evicted.append(key)
+
+        # 只监视本地目录（内存存储等的缓存键不是文件系统路径）
+        if self._watcher is not None:
+            for key in evicted:
+                self._watcher.remove_watch(key)
+            if target_dir not in evicted and os.path.isabs(target_dir):
+                # 无法监视（如达到监视数上限）时仍依靠签名和ttl校验
+                self._watcher.add_watch(target_dir)
+        return etag
+
+    def invalidate(self, target_dir):
+        """清除目录及其父目录的缓存（父目录列表中包含该目录的修改时间）"""
+        target_dir = os.path.normpath(target_dir)
+        for key in (target_dir, os.path.dirname(target_dir)):
+            self._discard(key)
+
+    def invalidate_tree(self, target_dir):
+        """清除目录、其父目录以及所有子目录的缓存"""
+        target_dir = os.path.normpath(target_dir)
+        prefix = target_dir.rstrip(os.sep) + os.sep
+        with self._lock:
+            keys = [key for key in self._entries if key.startswith(prefix)]
+        for key in keys:
+            self._discard(key)
+        self.invalidate(target_dir)
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            keys = list(self._entries)
+        for key in keys:
+            self._discard(key)
+
+    def _discard(self, target_dir, expected=None):
+        """移除缓存条目；指定expected时仅当条目未被替换才移除"""
+        with self._lock:
+            entry = self._entries.get(target_dir)
+            if entry is None or (expected is not None and entry is not expected):
+                return
+            del self._entries[target_dir]
+            self._total_items -= len(entry.items)
+        if self._watcher is not None:
+            self._watcher.remove_watch(target_dir)
+
+    def _on_event(self, dir_path, name, mask):
+        if dir_path is None:
+            # 事件队列溢出，无法确定哪些目录发生了变化
+            self.clear()
+            return
+        self._discard(dir_path)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_directory_cache():
+    """获取进程内共享的目录缓存"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = DirectoryCache(
+                    max_entries=getattr(settings, 'GFINDER_LIST_CACHE_SIZE', 256),
+                    max_items=getattr(settings, 'GFINDER_LIST_CACHE_MAX_ITEMS', 1000000),
+                    ttl=getattr(settings, 'GFINDER_LIST_CACHE_TTL', 30),
+                    use_inotify=getattr(settings, 'GFINDER_LIST_CACHE_INOTIFY', True),
+                )
+    return _cache
@@ -0,0 +1,258 @@
+"""
+文件保存：增量修改和原子写入
+
+保存时先写入同目录下的临时文件，fsync后重命名覆盖原文件，写入过程中崩溃不会留下被截断的文件。
+
+每个版本用内容的SHA-1表示。客户端可以只提交相对某个版本（base_version）的修改：
+- 字节范围：{"offset": 起始字节, "length": 替换的字节数, "text": 新内容}
+- 行范围：{"line": 起始行号(从1开始), "count": 替换的行数, "text": 新内容（含换行符）}
+所有修改的位置都相对于base_version，互不重叠；base_version与当前文件不一致时拒绝保存，
+客户端应重新读取。保存后返回新版本，客户端可以继续基于新版本提交增量修改。
+修改可以带上被替换的原内容"old_text"，与文件中该范围的字节不一致时同样拒绝保存。
+行号只按\n划分，\r和\r\n中的\r属于行的内容。
+
+增量保存通过mmap读取原文件，未修改的部分分块复制到临时文件，内存占用与文件大小无关；
+行号到字节偏移的转换使用按当前内容新建的行索引（与复制文件的开销同一量级），
+不依赖可能过期的缓存。
+"""
+import os
+import mmap
+import hashlib
+import threading
+from collections import OrderedDict
+
+# 复制未修改部分时每次写入的字节数
+COPY_CHUNK_SIZE = 1024 * 1024
+# 缓存的文件版本数
+VERSION_CACHE_SIZE = 1024
+# 一次保存最多包含的修改数
+MAX_EDITS = 10000
+
+
+class VersionConflictError(Exception):
+    """文件已被修改，与客户端的基础版本不一致"""
+
+    def __init__(self, current_version):
+        super().__init__("文件已被修改，请重新加载后再保存")
+        self.current_version = current_version
+
+
+_versions = OrderedDict()
+_versions_lock = threading.Lock()
+
+
+def _identity(stat_info):
+    return (stat_info.st_dev, stat_info.st_ino, stat_info.st_size, stat_info.st_mtime_ns)
+
+
+def _remember_version(stat_info, version):
+    with _versions_lock:
+        _versions[_identity(stat_info)] = version
+        _versions.move_to_end(_identity(stat_info))
+        while len(_versions) > VERSION_CACHE_SIZE:
+            _versions.popitem(last=False)
+
+
+def file_version(file_path):
+    """文件当前的版本（内容的SHA-1），按inode、大小和修改时间缓存"""
+    with open(file_path, 'rb') as f:
+        return _version_of(f)
+
+
+def stream_version(f, stat_info):
+    """已打开文件的版本，stat_info由存储后端给出（用于没有本地路径的存储后端）"""
+    return _version_of(f, stat_info)
+
+
+def _version_of(f, stat_info=None, mm=None):
+    stat_info = stat_info or os.fstat(f.fileno())
+    with _versions_lock:
+        version = _versions.get(_identity(stat_info))
+    if version is not None:
+        return version
+    digest = hashlib.sha1()
+    if mm is not None:
+        digest.update(mm)
+    else:
+        for chunk in iter(lambda: f.read(COPY_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    version = digest.hexdigest()
+    _remember_version(stat_info, version)
+    return version
+
+
+class _AtomicWriter:
+    """写入临时文件并计算版本，commit时fsync后重命名覆盖目标文件"""
+
+    def __init__(self, file_path):
+        # 目标是符号链接时替换链接指向的文件，保留链接本身
+        self.file_path = os.path.realpath(file_path)
+        directory, name = os.path.split(self.file_path)
+        self.tmp_path = os.path.join(directory, f'.{name}.{os.getpid()}.{threading.get_ident()}.tmp')
+        self.digest = hashlib.sha1()
+        self.size = 0
+        self._file = open(self.tmp_path, 'wb')
+
+    def write(self, data):
+        self._file.write(data)
+        self.digest.update(data)
+        self.size += len(data)
+
+    def copy_from(self, mm, start, end):
+        """分块复制原文件中未修改的部分"""
+        for position in range(start, end, COPY_CHUNK_SIZE):
+            self.write(mm[position:min(position + COPY_CHUNK_SIZE, end)])
+
+    def commit(self):
+        try:
+            # 保留原文件的权限
+            mode = os.stat(self.file_path).st_mode
+            os.chmod(self._file.fileno(), mode & 0o7777)
+        except FileNotFoundError:
+            pass
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self.tmp_path, self.file_path)
+        _fsync_directory(os.path.dirname(self.file_path))
+        version = self.digest.hexdigest()
+        _remember_version(os.stat(self.file_path), version)
+        return version
+
+    def discard(self):
+        self._file.close()
+        try:
+            os.remove(self.tmp_path)
+        except FileNotFoundError:
+            pass
+
+
+def _fsync_directory(directory):
+    """重命名后同步目录，确保新的目录项落盘（Windows不支持，忽略）"""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def write_file_atomic(file_path, data, base_version=None):
+    """
+    原子地写入完整内容
+
+    Args:
+        base_version: 可选，文件存在时要求当前版本与之一致
+
+    Returns:
+        (新版本, 字节数)
+    """
+    if base_version is not None and os.path.exists(file_path):
+        current = file_version(file_path)
+        if current != base_version:
+            raise VersionConflictError(current)
+    writer = _AtomicWriter(file_path)
+    try:
+        writer.write(data)
+        return writer.commit(), writer.size
+    except BaseException:
+        writer.discard()
+        raise
+
+
+def _int_field(edit, name, minimum=0):
+    value = edit.get(name)
+    if not isinstance(value, int) or isinstance(value, bool) or value < minimum:
+        raise ValueError(f"{name}必须是不小于{minimum}的整数")
+    return value
+
+
+def _resolve_edits(edits, stat_info, mm, current_version):
+    """把修改转换为按位置排序的字节范围[(start, end, 新内容字节)]，并检查是否重叠"""
+    if not isinstance(edits, list) or not edits:
+        raise ValueError("edits必须是非空列表")
+    if len(edits) > MAX_EDITS:
+        raise ValueError(f"一次最多提交{MAX_EDITS}处修改")
+    size = stat_info.st_size
+    index = None
+    ranges = []
+    for edit in edits:
+        if not isinstance(edit, dict) or not isinstance(edit.get('text', ''), str):
+            raise ValueError("修改必须是包含text字符串的对象")
+        if not isinstance(edit.get('old_text', ''), str):
+            raise ValueError("old_text必须是字符串")
+        if 'line' in edit:
+            line = _int_field(edit, 'line', 1)
+            count = _int_field(edit, 'count') if 'count' in edit else 0
+            if mm is not None and index is None:
+                # text_preview依赖file_utils，延迟导入避免循环
+                from .text_preview import LineIndex
+                index = LineIndex(_identity(stat_info))
+                index.extend(mm, size)
+            newlines = index.newlines if index is not None else 0
+            total_lines = newlines + (1 if size and mm[size - 1] != 0x0A else 0)
+            if line > total_lines + 1:
+                raise ValueError(f"行号超出范围: {line}（共{total_lines}行）")
+
+            def line_start(k):
+                # 第k行（从0开始）的起始偏移，超过最后一个换行符时为文件末尾
+                if k == 0:
+                    return 0
+                return index.line_offset(mm, k) if k <= newlines else size
+
+            start, end = line_start(line - 1), line_start(line - 1 + count)
+        else:
+            start = _int_field(edit, 'offset')
+            end = start + (_int_field(edit, 'length') if 'length' in edit else 0)
+            if end > size:
+                raise ValueError(f"字节范围超出文件大小: {start}-{end}（共{size}字节）")
+        if 'old_text' in edit and (mm[start:end] if mm is not None else b'') != edit['old_text'].encode('utf-8'):
+            raise VersionConflictError(current_version)
+        ranges.append((start, end, edit.get('text', '').encode('utf-8')))
+
+    # 稳定排序，同一位置的多个插入按提交顺序
+    ranges.sort(key=lambda item: (item[0], item[1]))
+    for previous, current in zip(ranges, ranges[1:]):
+        if current[0] < previous[1]:
+            raise ValueError("修改的范围有重叠")
+    return ranges
+
+
+def apply_edits(file_path, edits, base_version):
+    """
+    在服务器端应用相对base_version的增量修改，原子地写回
+
+    Returns:
+        (新版本, 字节数)
+    """
+    if not base_version:
+        raise ValueError("增量保存需要base_version")
+    with open(file_path, 'rb') as f:
+        stat_info = os.fstat(f.fileno())
+        # 空文件无法mmap
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if stat_info.st_size else None
+        try:
+            current = _version_of(f, stat_info, mm) if mm is not None else hashlib.sha1().hexdigest()
+            if current != base_version:
+                raise VersionConflictError(current)
+            ranges = _resolve_edits(edits, stat_info, mm, current)
+
+            writer = _AtomicWriter(file_path)
+            try:
+                position = 0
+                for start, end, data in ranges:
+                    writer.copy_from(mm, position, start)
+                    writer.write(data)
+                    position = end
+                writer.copy_from(mm, position, stat_info.st_size)
+                return writer.commit(), writer.size
+            except BaseException:
+                writer.discard()
+                raise
+        finally:
+            if mm is not None:
+                mm.close()
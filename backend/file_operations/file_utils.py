@@ -1,165 +1,490 @@
+import io
 import os
-import shutil
-import platform
+import json
+import stat
+import heapq
+import hashlib
+import base64
 import datetime
 import mimetypes
+from operator import itemgetter
 
-def get_root_directory():
-    """获取根目录，根据系统类型"""
-    system = platform.system()
-    if system == 'Windows':
-        root_dir = 'd:\\data'
-    else:  # Linux, Darwin等
-        root_dir = '/var/opt/gfinder/data'
-    
-    # 如果目录不存在则创建
-    if not os.path.exists(root_dir):
-        os.makedirs(root_dir, exist_ok=True)
+from django.conf import settings
+
+from .dir_cache import get_directory_cache, compute_etag
+from .search_index import get_search_index, mark_changed as mark_search_index_changed
+from .content_type import get_content_type_detector
+from .file_edits import write_file_atomic, apply_edits, stream_version, VersionConflictError
+from .path_resolver import split_path, check_name, InvalidPathError
+from .storage import get_storage, get_root_directory
+from ..metrics import fs_timer, LISTING_ENTRIES
+
+# 分页列目录的默认和最大每页条数
+LIST_PAGE_DEFAULT_LIMIT = 500
+LIST_PAGE_MAX_LIMIT = 5000
+# 流式列目录时每批检测内容类型的条目数
+DETECT_BATCH_SIZE = 256
+
+def get_state_directory(*parts):
+    """
+    获取GFinder内部状态目录（上传会话等），不存在则创建
     
-    return root_dir
+    默认位于根目录旁的gfinder_state目录，与数据在同一文件系统上，又不会出现在文件列表中。
+    """
+    state_dir = getattr(settings, 'GFINDER_STATE_DIR', None)
+    if not state_dir:
+        root_dir = get_root_directory().rstrip('\\/')
+        state_dir = os.path.join(os.path.dirname(root_dir), 'gfinder_state')
+    state_dir = os.path.join(state_dir, *parts)
+    os.makedirs(state_dir, exist_ok=True)
+    return state_dir
 
 def is_valid_path(path):
-    """验证路径是否合法（防止路径穿越攻击）"""
-    if not path:
-        return True  # 空路径视为根目录
+    """验证路径是否合法（防止路径穿越攻击），空路径视为根目录"""
+    try:
+        split_path(path)
+    except InvalidPathError:
+        return False
+    return True
+
+def is_valid_name(name):
+    """验证文件名是否合法（不能包含路径分隔符）"""
+    try:
+        check_name(name)
+    except InvalidPathError:
+        return False
+    return True
+
+def _lstat(storage, path, name):
+    """条目本身（不跟随符号链接）的stat信息，不存在时返回None"""
+    try:
+        return storage.stat(path, name)
+    except FileNotFoundError:
+        return None
+
+def _entry_is_dir(entry):
+    """判断DirEntry是否为目录（多数平台下无需额外系统调用）"""
+    try:
+        return entry.is_dir()
+    except OSError:
+        return False
+
+def _entry_info(entry, is_dir=None):
+    """根据DirEntry生成条目信息，复用scandir缓存的类型和stat数据"""
+    if is_dir is None:
+        is_dir = _entry_is_dir(entry)
+    try:
+        stat_info = entry.stat()
+    except OSError:
+        # 失效的符号链接等，使用链接本身的信息
+        stat_info = entry.stat(follow_symlinks=False)
     
-    # 标准化路径，去除.和..
-    normalized_path = os.path.normpath(path)
+    # 获取MIME类型
+    mimetype = None
+    if not is_dir:
+        mimetype, _ = mimetypes.guess_type(entry.name)
     
-    # 确保路径不会超出根目录
-    if normalized_path.startswith('..') or '/../' in normalized_path:
-        return False
+    return {
+        'name': entry.name,
+        'is_dir': is_dir,
+        'size': stat_info.st_size if not is_dir else 0,
+        'modified': datetime.datetime.fromtimestamp(stat_info.st_mtime).strftime('%Y-%m-%d %H:%M:%S'),
+        'mimetype': mimetype,
+    }
+
+def _sort_key(name, is_dir):
+    """排序键：文件夹在前，文件在后，然后按名称排序"""
+    return (not is_dir, name.lower(), name)
+
+def encode_list_cursor(key):
+    """将排序键编码为分页游标"""
+    raw = json.dumps(list(key), ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_list_cursor(cursor):
+    """解析分页游标，返回排序键"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        is_file, lower_name, name = json.loads(raw.decode('utf-8'))
+        return (bool(is_file), str(lower_name), str(name))
+    except (ValueError, TypeError):
+        raise ValueError("无效的分页游标")
+
+def get_directory_listing(path, detect_types=False):
+    """
+    列出目录内容，返回(条目列表, ETag)
     
-    return True
+    结果来自目录元数据缓存，返回的列表可能被多个请求共享，调用方不应修改。
+    detect_types为True时mimetype按文件内容检测（见add_content_types）。
+    """
+    storage = get_storage()
+    target_dir = storage.join(path)
+    cache = get_directory_cache()
+    with storage.directory(path) as directory:
+        cached = cache.get(target_dir, directory.signature)
+        if cached is None:
+            # 先取签名再读取目录，读取期间的修改会在下次校验时被发现
+            signature = directory.signature()
+            items = []
+            with fs_timer('listdir'), directory.scandir() as it:
+                for entry in it:
+                    items.append(_entry_info(entry))
+    if cached is not None:
+        items, etag = add_folder_sizes(path, *cached)
+        if detect_types:
+            items, etag = add_content_types(path, items, etag)
+        return items, etag
+    LISTING_ENTRIES.observe(len(items))
+    
+    # 排序：文件夹在前，文件在后，然后按名称排序
+    items.sort(key=lambda x: _sort_key(x['name'], x['is_dir']))
+    
+    etag = cache.put(target_dir, signature, items)
+    items, etag = add_folder_sizes(path, items, etag)
+    if detect_types:
+        items, etag = add_content_types(path, items, etag)
+    return items, etag
+
+def get_folder_sizes(path):
+    """目录下各文件夹的递归大小{名称: (字节数, 文件数)}，来自搜索索引的汇总，索引未启用时为空"""
+    index = get_search_index()
+    if index is None:
+        return {}
+    return index.folder_sizes(path)
+
+def add_folder_sizes(path, items, etag=None):
+    """
+    用递归大小填充文件夹条目的size和file_count，返回(新条目列表, ETag)
+    
+    不修改传入的条目（可能来自共享的缓存）；文件夹大小变化时ETag随之变化。
+    """
+    sizes = get_folder_sizes(path)
+    if not sizes:
+        return items, etag
+    result = []
+    for item in items:
+        if item['is_dir'] and item['name'] in sizes:
+            size, file_count = sizes[item['name']]
+            item = dict(item, size=size, file_count=file_count)
+        result.append(item)
+    if etag is not None:
+        etag = compute_etag([etag, sorted(sizes.items())])
+    return result, etag
+
+def add_content_types(path, items, etag=None):
+    """
+    用按内容检测的MIME类型替换文件条目的mimetype，返回(新条目列表, ETag)
+    
+    检测结果按文件的inode和修改时间缓存，未修改的文件不会重复读取文件头；
+    不修改传入的条目。ETag与未检测时的列表不同。
+    """
+    positions = [i for i, item in enumerate(items) if not item['is_dir']]
+    types = get_content_type_detector().detect_many(path, [items[i]['name'] for i in positions])
+    result = list(items)
+    for i, mimetype in zip(positions, types):
+        if mimetype != result[i]['mimetype']:
+            result[i] = dict(result[i], mimetype=mimetype)
+    if etag is not None:
+        etag = compute_etag([etag, 'content-type'])
+    return result, etag
 
 def list_directory(path):
     """列出目录内容"""
-    root_dir = get_root_directory()
-    target_dir = os.path.join(root_dir, path.strip('/'))
+    return get_directory_listing(path)[0]
+
+def list_directory_page(path, limit=LIST_PAGE_DEFAULT_LIMIT, cursor=None, detect_types=False):
+    """
+    分页列出目录内容
     
-    if not os.path.exists(target_dir):
-        if path == '':  # 如果是根目录不存在，则创建
-            os.makedirs(target_dir, exist_ok=True)
-        else:
-            raise FileNotFoundError(f"目录不存在: {path}")
+    只对当前页的条目调用stat，游标记录上一页最后一个条目的排序键，
+    因此翻页期间目录发生增删也不会重复或遗漏条目。
+    """
+    limit = max(1, min(int(limit), LIST_PAGE_MAX_LIMIT))
+    after = decode_list_cursor(cursor) if cursor else None
+    total = 0
+    
+    def candidates(it):
+        nonlocal total
+        for entry in it:
+            total += 1
+            is_dir = _entry_is_dir(entry)
+            key = _sort_key(entry.name, is_dir)
+            if after is None or key > after:
+                yield key, is_dir, entry
     
-    items = []
-    for item in os.listdir(target_dir):
-        item_path = os.path.join(target_dir, item)
-        stat_info = os.stat(item_path)
-        is_dir = os.path.isdir(item_path)
+    with get_storage().directory(path) as directory:
+        with fs_timer('listdir'), directory.scandir() as it:
+            # 只保留最小的limit+1个，无需对整个目录排序
+            page = heapq.nsmallest(limit + 1, candidates(it), key=itemgetter(0))
         
-        # 获取MIME类型
-        mimetype = None
-        if not is_dir:
-            mimetype, _ = mimetypes.guess_type(item_path)
+        next_cursor = None
+        if len(page) > limit:
+            page = page[:limit]
+            next_cursor = encode_list_cursor(page[-1][0])
         
-        items.append({
-            'name': item,
-            'is_dir': is_dir,
-            'size': stat_info.st_size if not is_dir else 0,
-            'modified': datetime.datetime.fromtimestamp(stat_info.st_mtime).strftime('%Y-%m-%d %H:%M:%S'),
-            'mimetype': mimetype,
-        })
+        # 本地存储的DirEntry相对目录fd调用stat，需在目录关闭前完成
+        entries = [_entry_info(entry, is_dir) for _, is_dir, entry in page]
+    LISTING_ENTRIES.observe(total)
     
-    # 排序：文件夹在前，文件在后，然后按名称排序
-    items.sort(key=lambda x: (not x['is_dir'], x['name'].lower()))
+    items = add_folder_sizes(path, entries)[0]
+    if detect_types:
+        items = add_content_types(path, items)[0]
+    return {
+        'items': items,
+        'next_cursor': next_cursor,
+        'total': total,
+    }
+
+def iter_directory(path, detect_types=False):
+    """按磁盘顺序逐条生成目录内容（不排序），用于流式输出"""
+    storage = get_storage()
+    # 目录不存在时立即报错，而不是在开始输出之后
+    with storage.directory(path):
+        pass
+    sizes = get_folder_sizes(path)
+    
+    def generate():
+        with storage.directory(path) as directory, directory.scandir() as it:
+            for entry in it:
+                try:
+                    item = _entry_info(entry)
+                    if item['is_dir'] and entry.name in sizes:
+                        item['size'], item['file_count'] = sizes[entry.name]
+                    yield item
+                except OSError:
+                    # 条目在遍历期间被删除
+                    continue
+    
+    def generate_detected():
+        # 分批检测，批内未命中缓存的文件并发读取文件头
+        batch = []
+        for item in generate():
+            batch.append(item)
+            if len(batch) >= DETECT_BATCH_SIZE:
+                yield from add_content_types(path, batch)[0]
+                batch = []
+        if batch:
+            yield from add_content_types(path, batch)[0]
     
-    return items
+    return generate_detected() if detect_types else generate()
+
+def invalidate_directory(path):
+    """写操作后清除目录（及其父目录）的列表缓存，并通知搜索索引"""
+    get_directory_cache().invalidate(get_storage().join(path))
+    mark_search_index_changed(path)
+
+def invalidate_tree(path, name):
+    """删除或移动目录后清除该目录树下所有列表缓存，并通知搜索索引"""
+    get_directory_cache().invalidate_tree(get_storage().join(path, name))
+    mark_search_index_changed(path.strip('/') + '/' + name, recursive=True)
+    mark_search_index_changed(path)
 
 def create_directory(path, name):
     """创建新目录"""
-    root_dir = get_root_directory()
-    parent_dir = os.path.join(root_dir, path.strip('/'))
-    new_dir = os.path.join(parent_dir, name)
-    
-    if os.path.exists(new_dir):
+    try:
+        get_storage().mkdir(path, name)
+    except FileExistsError:
         raise FileExistsError(f"目录已存在: {name}")
     
-    os.makedirs(new_dir, exist_ok=True)
+    invalidate_directory(path)
     return {'name': name, 'is_dir': True}
 
 def rename_item(path, old_name, new_name):
     """重命名文件或目录"""
-    root_dir = get_root_directory()
-    parent_dir = os.path.join(root_dir, path.strip('/'))
-    old_path = os.path.join(parent_dir, old_name)
-    new_path = os.path.join(parent_dir, new_name)
+    storage = get_storage()
+    check_name(new_name)
     
-    if not os.path.exists(old_path):
+    if _lstat(storage, path, old_name) is None:
         raise FileNotFoundError(f"文件或目录不存在: {old_name}")
     
-    if os.path.exists(new_path):
+    if _lstat(storage, path, new_name) is not None:
         raise FileExistsError(f"目标名称已存在: {new_name}")
     
-    os.rename(old_path, new_path)
-    is_dir = os.path.isdir(new_path)
+    storage.rename(path, old_name, new_name)
+    stat_info = storage.stat(path, new_name)
+    is_dir = stat.S_ISDIR(stat_info.st_mode)
+    if is_dir:
+        invalidate_tree(path, old_name)
+    invalidate_directory(path)
     
     return {
         'name': new_name,
         'is_dir': is_dir,
-        'size': 0 if is_dir else os.path.getsize(new_path)
+        'size': 0 if is_dir else stat_info.st_size
     }
 
+def entry_exists(path, name):
+    """目录下的条目（包括失效的符号链接）是否存在"""
+    try:
+        return _lstat(get_storage(), path, name) is not None
+    except NotADirectoryError:
+        return False
+
 def delete_item(path, name):
     """删除文件或目录"""
-    root_dir = get_root_directory()
-    parent_dir = os.path.join(root_dir, path.strip('/'))
-    target_path = os.path.join(parent_dir, name)
-    
-    if not os.path.exists(target_path):
+    storage = get_storage()
+    stat_info = _lstat(storage, path, name)
+    if stat_info is None:
         raise FileNotFoundError(f"文件或目录不存在: {name}")
     
-    if os.path.isdir(target_path):
-        shutil.rmtree(target_path)
+    # 指向目录的符号链接只删除链接本身
+    if stat.S_ISDIR(stat_info.st_mode):
+        try:
+            with fs_timer('rmtree'):
+                storage.rmtree(path, name)
+        finally:
+            invalidate_tree(path, name)
     else:
-        os.remove(target_path)
+        storage.remove(path, name)
+        invalidate_directory(path)
     
     return {'name': name}
 
+def check_transfer_paths(source_path, source_name, target_path):
+    """检查移动/复制的源存在且目标不存在，返回源的stat信息"""
+    storage = get_storage()
+    stat_info = _lstat(storage, source_path, source_name)
+    if stat_info is None:
+        raise FileNotFoundError("源文件或文件夹不存在")
+    
+    if _lstat(storage, target_path, source_name) is not None:
+        raise FileExistsError("目标位置已存在同名文件或文件夹")
+    
+    check_not_inside(source_path, source_name, target_path)
+    return stat_info
+
+def target_inside_source(source_path, source_name, target_path):
+    """目标目录是否为源本身或其下级（按路径组件比较，不展开符号链接）"""
+    source = split_path(source_path) + (check_name(source_name),)
+    return split_path(target_path)[:len(source)] == source
+
+def check_not_inside(source_path, source_name, target_path):
+    """检查目标目录不在源文件夹中，否则移动/复制会进入自身"""
+    if target_inside_source(source_path, source_name, target_path):
+        raise InvalidPathError("不能移动或复制到自身或其子文件夹中")
+    # 目标路径可能经过指向源文件夹的符号链接，比较展开后的本地路径
+    storage = get_storage()
+    try:
+        source = storage.local_path(source_path, source_name)
+        target = storage.local_path(target_path, follow=True)
+    except io.UnsupportedOperation:
+        return
+    if os.path.commonpath([source, target]) == source:
+        raise InvalidPathError("不能移动或复制到自身或其子文件夹中")
+
+def move_entry(source_path, source_name, target_path):
+    """移动文件或目录到目标目录"""
+    is_dir = stat.S_ISDIR(check_transfer_paths(source_path, source_name, target_path).st_mode)
+    try:
+        with fs_timer('move'):
+            get_storage().move(source_path, source_name, target_path)
+    finally:
+        if is_dir:
+            invalidate_tree(source_path, source_name)
+            invalidate_tree(target_path, source_name)
+        invalidate_directory(source_path)
+        invalidate_directory(target_path)
+    return {'name': source_name}
+
+def copy_entry(source_path, source_name, target_path):
+    """复制文件或目录到目标目录"""
+    check_transfer_paths(source_path, source_name, target_path)
+    try:
+        get_storage().copy(source_path, source_name, target_path)
+    finally:
+        invalidate_directory(target_path)
+    return {'name': source_name}
+
 def get_file_content(path, filename):
     """获取文件内容"""
-    root_dir = get_root_directory()
-    file_path = os.path.join(root_dir, path.strip('/'), filename)
-    
-    if not os.path.exists(file_path):
+    storage = get_storage()
+    try:
+        f = storage.open(path, filename, 'rb')
+    except (FileNotFoundError, NotADirectoryError):
         raise FileNotFoundError(f"文件不存在: {filename}")
     
-    if not os.path.isfile(file_path):
-        raise IsADirectoryError(f"不是一个文件: {filename}")
+    with f:
+        stat_info = storage.fstat(f)
+        if not stat.S_ISREG(stat_info.st_mode):
+            raise IsADirectoryError(f"不是一个文件: {filename}")
+        
+        # 检查文件大小，如果过大可能需要特殊处理
+        if stat_info.st_size > 10 * 1024 * 1024:  # 10MB
+            raise ValueError("文件过大，无法预览")
+        
+        # 按字节解码，保留\r和\r\n：增量保存的位置是相对原始字节计算的
+        try:
+            return f.read().decode('utf-8')
+        except UnicodeDecodeError:
+            # 如果不是文本文件，返回二进制文件提示
+            return "二进制文件，无法直接预览内容"
+
+def save_file_content(path, filename, content, base_version=None):
+    """
+    保存文件内容（原子写入）
     
-    # 检查文件大小，如果过大可能需要特殊处理
-    file_size = os.path.getsize(file_path)
-    if file_size > 10 * 1024 * 1024:  # 10MB
-        raise ValueError("文件过大，无法预览")
+    base_version不为空时要求文件当前版本与之一致，否则抛出VersionConflictError。
+    返回结果中的version为保存后的版本。
+    """
+    storage = get_storage()
+    data = content.encode('utf-8')
+    try:
+        file_path = storage.local_path(path, filename)
+    except io.UnsupportedOperation:
+        file_path = None
     
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return f.read()
-    except UnicodeDecodeError:
-        # 如果不是文本文件，返回二进制文件提示
-        return "二进制文件，无法直接预览内容"
+        if file_path is None:
+            version, size = _write_to_storage(storage, path, filename, data, base_version)
+        else:
+            version, size = write_file_atomic(file_path, data, base_version)
+    finally:
+        invalidate_directory(path)
+    return {'name': filename, 'version': version, 'size': size}
+
+def _write_to_storage(storage, path, filename, data, base_version):
+    """没有本地路径的存储后端：检查版本后整体写入（后端在关闭时一次性替换内容）"""
+    if base_version is not None:
+        try:
+            with storage.open(path, filename, 'rb') as f:
+                current = stream_version(f, storage.fstat(f))
+        except FileNotFoundError:
+            current = base_version
+        if current != base_version:
+            raise VersionConflictError(current)
+    with storage.open(path, filename, 'wb', follow=False) as f:
+        f.write(data)
+    return hashlib.sha1(data).hexdigest(), len(data)
 
-def save_file_content(path, filename, content):
-    """保存文件内容"""
-    root_dir = get_root_directory()
-    file_path = os.path.join(root_dir, path.strip('/'), filename)
+def save_file_edits(path, filename, edits, base_version):
+    """
+    应用相对base_version的增量修改（见file_edits模块）并原子写入
     
-    with open(file_path, 'w', encoding='utf-8') as f:
-        f.write(content)
+    返回结果中的version为保存后的版本。
+    """
+    file_path = get_storage().local_path(path, filename)
+    
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"文件不存在: {filename}")
+    
+    if not os.path.isfile(file_path):
+        raise IsADirectoryError(f"不是一个文件: {filename}")
     
-    return {'name': filename}
+    try:
+        version, size = apply_edits(file_path, edits, base_version)
+    finally:
+        invalidate_directory(path)
+    return {'name': filename, 'version': version, 'size': size}
 
 def create_file(path, name, content=""):
     """创建新文件"""
-    root_dir = get_root_directory()
-    parent_dir = os.path.join(root_dir, path.strip('/'))
-    file_path = os.path.join(parent_dir, name)
-    
-    if os.path.exists(file_path):
+    try:
+        f = get_storage().open(path, name, 'x', follow=False)
+    except FileExistsError:
         raise FileExistsError(f"文件已存在: {name}")
     
-    with open(file_path, 'w', encoding='utf-8') as f:
+    with f:
         f.write(content)
     
-    return {'name': name, 'is_dir': False} 
\ No newline at end of file
+    invalidate_directory(path)
+    return {'name': name, 'is_dir': False}
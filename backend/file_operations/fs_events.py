@@ -0,0 +1,166 @@
+"""
+文件系统事件监听
+
+基于Linux inotify（通过ctypes调用libc，无需第三方依赖）。
+其他平台或inotify不可用时，available()返回False，调用方应退回到轮询/校验方式。
+"""
+import os
+import sys
+import struct
+import ctypes
+import ctypes.util
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# inotify事件掩码，取自<sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+
+# 目录内容发生变化时关心的事件
+CHANGE_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+               IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+
+_EVENT_HEADER = struct.Struct('iIII')
+_READ_SIZE = 64 * 1024
+
+_libc = None
+_libc_loaded = False
+
+
+def _load_libc():
+    """加载支持inotify的libc，不支持时返回None"""
+    global _libc, _libc_loaded
+    if _libc_loaded:
+        return _libc
+    _libc_loaded = True
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+    except OSError:
+        return None
+    if not hasattr(libc, 'inotify_init1'):
+        return None
+    _libc = libc
+    return _libc
+
+
+def available():
+    """当前平台是否支持inotify"""
+    return _load_libc() is not None
+
+
+class InotifyWatcher:
+    """
+    目录监视器
+
+    每个被监视的目录发生变化时调用 callback(dir_path, name, mask)，
+    name为目录内发生变化的条目名（目录自身的事件为None）。
+    事件队列溢出时以 callback(None, None, IN_Q_OVERFLOW) 通知调用方丢弃全部状态。
+    回调在后台线程中执行，需自行保证线程安全。
+    """
+
+    def __init__(self, callback, name='gfinder-inotify'):
+        self._callback = callback
+        self._name = name
+        self._lock = threading.Lock()
+        self._wd_to_path = {}
+        self._path_to_wd = {}
+        self._fd = None
+        self._libc = None
+
+    def _ensure_started(self):
+        """首次使用时创建inotify实例和读取线程"""
+        if self._fd is not None:
+            return True
+        libc = _load_libc()
+        if libc is None:
+            return False
+        fd = libc.inotify_init1(IN_CLOEXEC)
+        if fd < 0:
+            logger.warning(f"inotify初始化失败: {os.strerror(ctypes.get_errno())}")
+            return False
+        self._libc = libc
+        self._fd = fd
+        thread = threading.Thread(target=self._run, name=self._name, daemon=True)
+        thread.start()
+        return True
+
+    def add_watch(self, path, mask=CHANGE_MASK):
+        """监视目录，成功返回True（已在监视中也返回True）"""
+        with self._lock:
+            if path in self._path_to_wd:
+                return True
+            if not self._ensure_started():
+                return False
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), mask | IN_ONLYDIR)
+            if wd < 0:
+                # 常见原因是达到fs.inotify.max_user_watches上限
+                return False
+            self._wd_to_path[wd] = path
+            self._path_to_wd[path] = wd
+            return True
+
+    def remove_watch(self, path):
+        """取消对目录的监视"""
+        with self._lock:
+            wd = self._path_to_wd.pop(path, None)
+            if wd is None:
+                return
+            self._wd_to_path.pop(wd, None)
+            self._libc.inotify_rm_watch(self._fd, wd)
+
+    def is_watched(self, path):
+        """目录是否正在被监视"""
+        with self._lock:
+            return path in self._path_to_wd
+
+    def _run(self):
+        """读取并分发inotify事件"""
+        while True:
+            try:
+                data = os.read(self._fd, _READ_SIZE)
+            except OSError as e:
+                logger.error(f"读取inotify事件失败: {str(e)}")
+                return
+
+            offset = 0
+            while offset + _EVENT_HEADER.size <= len(data):
+                wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+                start = offset + _EVENT_HEADER.size
+                name = data[start:start + length].rstrip(b'\0')
+                offset = start + length
+
+                if mask & IN_Q_OVERFLOW:
+                    self._dispatch(None, None, mask)
+                    continue
+
+                with self._lock:
+                    path = self._wd_to_path.get(wd)
+                    if mask & IN_IGNORED and path is not None:
+                        # 目录被删除或监视被移除
+                        self._wd_to_path.pop(wd, None)
+                        self._path_to_wd.pop(path, None)
+                if path is None:
+                    continue
+                self._dispatch(path, os.fsdecode(name) if name else None, mask)
+
+    def _dispatch(self, path, name, mask):
+        try:
+            self._callback(path, name, mask)
+        except Exception:
+            logger.exception("处理文件系统事件出错")
@@ -0,0 +1,465 @@
+"""
+后台任务
+
+大目录的复制、移动（跨设备时退化为复制+删除）和删除可能耗时很久，
+在请求中同步执行会导致代理超时并长期占用工作线程。这里把它们作为后台任务
+放到线程池中执行，接口立即返回任务ID，通过任务状态接口查询进度、速度和剩余时间，
+并可以取消。
+
+任务状态以JSON文件保存在状态目录的jobs子目录中，多个工作进程都能查询和取消。
+运行中的任务持有对应.lock文件的文件锁，进程退出后锁自动释放；
+重启后首次使用任务管理器时，未完成且无人持有锁的任务会被重新执行：
+复制会跳过已完整复制的文件，移动和删除会从中断处继续。
+
+任务在开始执行时重新检查源存在、目标不存在（提交后目标可能已被创建），
+复制先写入目标目录中属于该任务的临时名称，完成后以不覆盖的方式重命名到目标，
+不会覆盖或合并已有的数据；取消或失败时只删除该临时目标。
+"""
+import os
+import json
+import errno
+import time
+import shutil
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from . import copy_engine
+from ..metrics import fs_timer
+from .file_utils import get_state_directory, invalidate_tree, check_not_inside, check_transfer_paths
+from .storage import get_storage
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+JOB_TYPES = ('copy', 'move', 'delete')
+ACTIVE_STATES = ('pending', 'running')
+FINISHED_STATES = ('completed', 'failed', 'cancelled')
+
+# 进度写盘和检查取消标记的最小间隔（秒）
+PERSIST_INTERVAL = 0.5
+# 清理已结束任务记录的最小间隔（秒）
+CLEANUP_INTERVAL = 600
+
+
+class JobCancelled(Exception):
+    """任务被取消"""
+
+
+class Job:
+    """任务状态"""
+
+    FIELDS = ('id', 'type', 'params', 'status', 'bytes_total', 'bytes_done', 'files_total',
+              'files_done', 'created', 'started', 'finished', 'error')
+
+    def __init__(self, job_id, job_type, params, **state):
+        self.id = job_id
+        self.type = job_type
+        self.params = params
+        self.status = state.get('status', 'pending')
+        self.bytes_total = state.get('bytes_total', 0)
+        self.bytes_done = state.get('bytes_done', 0)
+        self.files_total = state.get('files_total', 0)
+        self.files_done = state.get('files_done', 0)
+        self.created = state.get('created', time.time())
+        self.started = state.get('started')
+        self.finished = state.get('finished')
+        self.error = state.get('error')
+        self.cancel_requested = False
+        # 由recover()重新执行的中断任务
+        self.resumed = False
+        self.manager = None
+        self._last_persist = 0.0
+
+    @classmethod
+    def from_dict(cls, data):
+        state = {key: data.get(key) for key in cls.FIELDS[3:] if data.get(key) is not None}
+        return cls(data['id'], data['type'], data['params'], **state)
+
+    def to_dict(self):
+        data = {key: getattr(self, key) for key in self.FIELDS}
+        return with_rates(data)
+
+    def advance(self, nbytes=0, files=0):
+        """更新进度；定期写盘并检查是否被取消"""
+        self.bytes_done += nbytes
+        self.files_done += files
+        now = time.monotonic()
+        if now - self._last_persist >= PERSIST_INTERVAL:
+            self._last_persist = now
+            if self.manager is not None:
+                if self.manager.cancel_marker_exists(self.id):
+                    self.cancel_requested = True
+                self.manager.save(self)
+        if self.cancel_requested:
+            raise JobCancelled()
+
+
+def with_rates(data):
+    """根据已完成量计算速度和预计剩余时间"""
+    data = dict(data)
+    throughput = None
+    eta = None
+    if data.get('started'):
+        elapsed = (data.get('finished') or time.time()) - data['started']
+        if elapsed > 0:
+            throughput = data['bytes_done'] / elapsed
+        if data['status'] == 'running' and throughput:
+            eta = max(data['bytes_total'] - data['bytes_done'], 0) / throughput
+    data['throughput'] = throughput
+    data['eta'] = eta
+    return data
+
+
+def _scan(path):
+    """统计路径下的文件总字节数和文件数"""
+    if not os.path.isdir(path) or os.path.islink(path):
+        try:
+            return os.path.getsize(path), 1
+        except OSError:
+            return 0, 0
+    total_bytes = total_files = 0
+    for dirpath, dirnames, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total_bytes += os.lstat(os.path.join(dirpath, name)).st_size
+            except OSError:
+                continue
+            total_files += 1
+    return total_bytes, total_files
+
+
+def _already_copied(src, dst, src_stat):
+    """目标已是相同的文件（用于恢复中断的任务）"""
+    try:
+        dst_stat = os.stat(dst)
+    except FileNotFoundError:
+        return False
+    return dst_stat.st_size == src_stat.st_size and int(dst_stat.st_mtime) == int(src_stat.st_mtime)
+
+
+def _copy_tree(src, dst, job):
+    """用并行复制引擎复制目录树，跳过已完整复制的文件"""
+    copy_engine.copy_tree(src, dst, progress=job.advance, skip=_already_copied)
+
+
+def _remove_tree(path, job=None):
+    """自底向上删除目录树；指定job时报告进度并响应取消"""
+    if not os.path.isdir(path) or os.path.islink(path):
+        size = os.lstat(path).st_size
+        os.remove(path)
+        if job is not None:
+            job.advance(size, 1)
+        return
+    for dirpath, dirnames, filenames in os.walk(path, topdown=False):
+        for name in filenames:
+            file_path = os.path.join(dirpath, name)
+            try:
+                size = os.lstat(file_path).st_size
+                os.remove(file_path)
+            except FileNotFoundError:
+                continue
+            if job is not None:
+                job.advance(size, 1)
+        for name in dirnames:
+            dir_path = os.path.join(dirpath, name)
+            if os.path.islink(dir_path):
+                os.remove(dir_path)
+            else:
+                os.rmdir(dir_path)
+    os.rmdir(path)
+
+
+def _partial_path(target, job):
+    """复制过程中使用的临时目标：目标目录中以任务ID命名的隐藏条目，恢复的任务继续使用"""
+    return os.path.join(os.path.dirname(target), f'.gfinder-{job.id}.partial')
+
+
+def _discard_partial(path):
+    """删除任务自己的不完整临时目标"""
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.lexists(path):
+        os.remove(path)
+
+
+def _resolve(relative_path, name):
+    return get_storage().local_path(relative_path, name)
+
+
+def _copy_into_place(source, target, job):
+    """复制到临时目标，完成后不覆盖地重命名为target；取消或失败时删除临时目标"""
+    partial = _partial_path(target, job)
+    try:
+        _copy_tree(source, partial, job)
+        copy_engine.rename_noreplace(partial, target)
+    except BaseException:
+        _discard_partial(partial)
+        raise
+
+
+def run_copy(job):
+    params = job.params
+    source = _resolve(params['source_path'], params['source_name'])
+    target = _resolve(params['target_path'], params['source_name'])
+    try:
+        if job.resumed and not os.path.lexists(_partial_path(target, job)) and os.path.lexists(target):
+            # 恢复的任务：上次已经重命名到目标
+            return
+        check_transfer_paths(params['source_path'], params['source_name'], params['target_path'])
+        job.bytes_total, job.files_total = _scan(source)
+        job.manager.save(job)
+        _copy_into_place(source, target, job)
+    finally:
+        invalidate_tree(params['target_path'], params['source_name'])
+
+
+def run_move(job):
+    params = job.params
+    source = _resolve(params['source_path'], params['source_name'])
+    target = _resolve(params['target_path'], params['source_name'])
+    try:
+        if job.resumed and not os.path.lexists(source) and os.path.lexists(target):
+            # 恢复的任务：上次已经完成
+            return
+        check_transfer_paths(params['source_path'], params['source_name'], params['target_path'])
+        job.bytes_total, job.files_total = _scan(source)
+        job.manager.save(job)
+        try:
+            copy_engine.rename_noreplace(source, target)
+            job.bytes_done, job.files_done = job.bytes_total, job.files_total
+            return
+        except OSError as e:
+            # 只有跨设备移动才先复制再删除源，其他错误（如目标已存在）直接失败
+            if e.errno != errno.EXDEV:
+                raise
+        _copy_into_place(source, target, job)
+        # 复制已完成，删除源时不再响应取消
+        with fs_timer('rmtree'):
+            _remove_tree(source)
+    finally:
+        invalidate_tree(params['source_path'], params['source_name'])
+        invalidate_tree(params['target_path'], params['source_name'])
+
+
+def run_delete(job):
+    params = job.params
+    target = _resolve(params['path'], params['name'])
+    try:
+        if not os.path.lexists(target):
+            return
+        job.bytes_total, job.files_total = _scan(target)
+        job.manager.save(job)
+        with fs_timer('rmtree'):
+            _remove_tree(target, job)
+    finally:
+        invalidate_tree(params['path'], params['name'])
+
+
+RUNNERS = {
+    'copy': run_copy,
+    'move': run_move,
+    'delete': run_delete,
+}
+
+
+class JobManager:
+    """任务管理器：在线程池中执行任务并持久化状态"""
+
+    def __init__(self, jobs_dir, max_workers=4, retention=24 * 3600):
+        self.jobs_dir = jobs_dir
+        self.retention = retention
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='gfinder-job')
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._last_cleanup = 0.0
+
+    def _path(self, job_id, suffix='.json'):
+        if not job_id or not job_id.isalnum():
+            raise FileNotFoundError("任务不存在")
+        return os.path.join(self.jobs_dir, job_id + suffix)
+
+    def save(self, job):
+        """原子地写入任务状态"""
+        path = self._path(job.id)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        data = {key: getattr(job, key) for key in Job.FIELDS}
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _load(self, job_id):
+        try:
+            with open(self._path(job_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            raise FileNotFoundError("任务不存在")
+
+    def _try_lock(self, job_id):
+        """获取任务锁，返回打开的锁文件；已被其他进程持有时返回None"""
+        lock_file = open(self._path(job_id, '.lock'), 'a')
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return None
+        return lock_file
+
+    def cancel_marker_exists(self, job_id):
+        return os.path.exists(self._path(job_id, '.cancel'))
+
+    def submit(self, job_type, params):
+        """创建任务并放入线程池，返回任务状态"""
+        if job_type not in RUNNERS:
+            raise ValueError(f"不支持的任务类型: {job_type}")
+        # 任务直接操作本地路径，存储后端不支持时在提交时报错（io.UnsupportedOperation）
+        if job_type == 'delete':
+            _resolve(params['path'], params['name'])
+        else:
+            _resolve(params['source_path'], params['source_name'])
+            check_not_inside(params['source_path'], params['source_name'], params['target_path'])
+        job = Job(os.urandom(16).hex(), job_type, params)
+        # 先持有锁再写入任务记录，其他进程的recover()不会在启动前把它当作中断的任务执行
+        lock_file = self._try_lock(job.id)
+        self.save(job)
+        self._start(job, lock_file)
+        self.cleanup()
+        return job.to_dict()
+
+    def _start(self, job, lock_file):
+        job.manager = self
+        with self._lock:
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job, lock_file)
+
+    def _run(self, job, lock_file):
+        try:
+            job.status = 'running'
+            job.started = job.started or time.time()
+            self.save(job)
+            if job.cancel_requested or self.cancel_marker_exists(job.id):
+                raise JobCancelled()
+            RUNNERS[job.type](job)
+            job.status = 'completed'
+        except JobCancelled:
+            job.status = 'cancelled'
+        except Exception as e:
+            logger.error(f"后台任务错误: {str(e)}")
+            job.status = 'failed'
+            job.error = str(e)
+        finally:
+            job.finished = time.time()
+            self.save(job)
+            try:
+                os.remove(self._path(job.id, '.cancel'))
+            except FileNotFoundError:
+                pass
+            with self._lock:
+                self._jobs.pop(job.id, None)
+            lock_file.close()
+
+    def get(self, job_id):
+        """查询任务状态（包括其他进程中运行的任务）"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        return with_rates(self._load(job_id))
+
+    def list(self, limit=100):
+        """列出最近的任务"""
+        jobs = []
+        for entry in os.scandir(self.jobs_dir):
+            if entry.name.endswith('.json'):
+                try:
+                    jobs.append(self.get(entry.name[:-5]))
+                except FileNotFoundError:
+                    continue
+        jobs.sort(key=lambda job: job['created'], reverse=True)
+        return jobs[:limit]
+
+    def cancel(self, job_id):
+        """请求取消任务；任务可能运行在其他进程中，通过标记文件通知"""
+        data = self.get(job_id)
+        if data['status'] in FINISHED_STATES:
+            return data
+        open(self._path(job_id, '.cancel'), 'a').close()
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            job.cancel_requested = True
+        return self.get(job_id)
+
+    def recover(self):
+        """重新执行因进程退出而中断的任务"""
+        for entry in os.scandir(self.jobs_dir):
+            if not entry.name.endswith('.json'):
+                continue
+            job_id = entry.name[:-5]
+            try:
+                data = self._load(job_id)
+            except FileNotFoundError:
+                continue
+            if data.get('status') not in ACTIVE_STATES:
+                continue
+            with self._lock:
+                if job_id in self._jobs:
+                    continue
+            lock_file = self._try_lock(job_id)
+            if lock_file is None:
+                # 仍在其他进程中运行
+                continue
+            job = Job.from_dict(data)
+            job.status = 'pending'
+            job.resumed = True
+            job.bytes_done = job.files_done = 0
+            logger.info(f"恢复后台任务: {job_id}")
+            self._start(job, lock_file)
+
+    def cleanup(self):
+        """删除超过保留期限的已结束任务记录"""
+        now = time.time()
+        if now - self._last_cleanup < CLEANUP_INTERVAL:
+            return
+        self._last_cleanup = now
+        for entry in os.scandir(self.jobs_dir):
+            if not entry.name.endswith('.json'):
+                continue
+            job_id = entry.name[:-5]
+            try:
+                data = self._load(job_id)
+            except FileNotFoundError:
+                continue
+            if data.get('status') in FINISHED_STATES and now - (data.get('finished') or now) > self.retention:
+                for suffix in ('.json', '.lock', '.cancel'):
+                    try:
+                        os.remove(self._path(job_id, suffix))
+                    except FileNotFoundError:
+                        pass
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager():
+    """获取进程内共享的任务管理器，首次创建时恢复中断的任务"""
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                manager = JobManager(
+                    get_state_directory('jobs'),
+                    max_workers=getattr(settings, 'GFINDER_JOB_WORKERS', 4),
+                    retention=getattr(settings, 'GFINDER_JOB_RETENTION', 24 * 3600),
+                )
+                manager.recover()
+                _manager = manager
+    return _manager
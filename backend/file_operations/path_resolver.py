@@ -0,0 +1,385 @@
+"""
+根目录下的安全路径解析
+
+请求中的路径和文件名都相对数据根目录，这里统一解析：
+- 根目录只在创建解析器时解析一次（解析器由本地存储后端持有，见storage模块）
+- 路径按组件校验：拒绝..、空字节和盘符；文件名不能包含路径分隔符
+- 目录从根目录的fd逐级openat打开（O_NOFOLLOW），遇到符号链接时在用户态展开，
+  展开后不能离开根目录（等同openat2的RESOLVE_BENEATH，Python没有提供openat2）
+- 打开的目录fd放在LRU缓存中，命中时用一次stat确认路径仍指向同一个目录；
+  调用方用dir_fd参数相对所在目录操作文件，目录在操作期间被替换为符号链接也不会离开根目录
+
+不支持dir_fd的平台（Windows）退化为字符串拼接，并用realpath检查结果仍在根目录下。
+"""
+import os
+import errno
+import threading
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+
+# 支持相对目录fd操作的平台（Linux、macOS等）
+DIR_FD_SUPPORTED = (
+    os.open in os.supports_dir_fd and os.stat in os.supports_dir_fd and
+    hasattr(os, 'O_DIRECTORY') and hasattr(os, 'O_NOFOLLOW')
+)
+O_NOFOLLOW = getattr(os, 'O_NOFOLLOW', 0)
+O_CLOEXEC = getattr(os, 'O_CLOEXEC', 0)
+O_NONBLOCK = getattr(os, 'O_NONBLOCK', 0)
+_DIR_FLAGS = os.O_RDONLY | getattr(os, 'O_DIRECTORY', 0) | O_NOFOLLOW | O_CLOEXEC
+
+# 一次解析中最多展开的符号链接数（与内核的限制一致）
+MAX_SYMLINKS = 40
+
+
+class InvalidPathError(ValueError):
+    """路径不合法或解析后离开根目录"""
+
+    def __init__(self, message="路径不合法"):
+        super().__init__(message)
+
+
+def split_path(path):
+    """把相对根目录的路径拆分为组件，开头的/忽略"""
+    if not path:
+        return ()
+    if '\0' in path:
+        raise InvalidPathError()
+    if os.name == 'nt':
+        path = path.replace('\\', '/')
+    parts = tuple(part for part in path.split('/') if part and part != '.')
+    if '..' in parts or (os.name == 'nt' and parts and ':' in parts[0]):
+        raise InvalidPathError()
+    return parts
+
+
+def check_name(name):
+    """校验单个文件名（不能为空、.、..，不能包含路径分隔符）"""
+    if not name or name in ('.', '..') or '/' in name or '\0' in name or \
+            (os.name == 'nt' and ('\\' in name or ':' in name)):
+        raise InvalidPathError(f"文件名不合法: {name}")
+    return name
+
+
+def _normalize(parts):
+    """处理符号链接目标中的.和..，..超出根目录时报错"""
+    result = []
+    for part in parts:
+        if part in ('', '.'):
+            continue
+        if part == '..':
+            if not result:
+                raise InvalidPathError("符号链接指向根目录以外")
+            result.pop()
+        else:
+            result.append(part)
+    return tuple(result)
+
+
+def _readlink(name, dir_fd):
+    """name是符号链接时返回链接目标，否则返回None"""
+    try:
+        return os.readlink(name, dir_fd=dir_fd)
+    except (OSError, ValueError):
+        return None
+
+
+class Location(namedtuple('Location', ('dir_fd', 'name', 'path'))):
+    """
+    解析结果
+
+    dir_fd为所在目录的fd（不支持dir_fd时为None），name为相对dir_fd的名称（不支持dir_fd时为完整路径），
+    path为展开符号链接后的完整路径
+    """
+    __slots__ = ()
+
+    def sibling(self, name):
+        """同一目录下另一个名称（相对dir_fd）"""
+        check_name(name)
+        if self.dir_fd is None:
+            return os.path.join(os.path.dirname(self.name), name)
+        return name
+
+
+class _DirHandle:
+    """缓存的目录fd，使用中的fd被淘汰时等最后一个使用者释放后再关闭"""
+    __slots__ = ('key', 'fd', 'parts', 'identity', 'refs', 'evicted')
+
+    def __init__(self, key, fd, parts):
+        self.key = key
+        self.fd = fd
+        self.parts = parts
+        stat_info = os.fstat(fd)
+        self.identity = (stat_info.st_dev, stat_info.st_ino)
+        self.refs = 1
+        self.evicted = False
+
+
+class PathResolver:
+    """
+    根目录下的路径解析和目录fd缓存
+
+    Args:
+        root_dir: 数据根目录
+        cache_size: 最多缓存的目录fd数
+    """
+
+    def __init__(self, root_dir, cache_size=128):
+        self.root_dir = os.path.normpath(os.path.abspath(root_dir))
+        self.cache_size = cache_size
+        self._real_root = os.path.realpath(self.root_dir)
+        self._lock = threading.Lock()
+        self._handles = OrderedDict()
+        self._root = None
+        if DIR_FD_SUPPORTED:
+            self._root = _DirHandle('', os.open(self.root_dir, os.O_RDONLY | os.O_DIRECTORY | O_CLOEXEC), ())
+
+    def full_path(self, path, name=None, follow=False):
+        """
+        校验并返回完整路径（供需要字符串路径的代码使用）
+
+        父目录中的符号链接已展开；follow为True时最后一个组件的符号链接也展开。
+        """
+        with self.locate(path, name, follow) as location:
+            return location.path
+
+    def join(self, path, name=None):
+        """校验并拼接完整路径（不展开符号链接），用作缓存键等"""
+        parts = split_path(path)
+        if name is not None:
+            parts += (check_name(name),)
+        return self._join(parts)
+
+    def _join(self, parts):
+        return os.path.join(self.root_dir, *parts)
+
+    # ------------------------------------------------------------ 目录fd
+
+    def _walk(self, parts):
+        """从根目录逐级打开目录，返回(fd, 展开符号链接后的组件)"""
+        pending = list(reversed(parts))
+        resolved = []
+        fds = []
+        links = 0
+        try:
+            while pending:
+                part = pending.pop()
+                if part in ('', '.'):
+                    continue
+                if part == '..':
+                    if not resolved:
+                        raise InvalidPathError("符号链接指向根目录以外")
+                    resolved.pop()
+                    os.close(fds.pop())
+                    continue
+                current = fds[-1] if fds else self._root.fd
+                try:
+                    fd = os.open(part, _DIR_FLAGS, dir_fd=current)
+                except OSError:
+                    target = _readlink(part, current)
+                    if target is None:
+                        raise
+                    links += 1
+                    if links > MAX_SYMLINKS:
+                        raise OSError(errno.ELOOP, os.strerror(errno.ELOOP), part)
+                    if os.path.isabs(target):
+                        # 指向根目录下的绝对路径：从根目录重新开始
+                        for fd in fds:
+                            os.close(fd)
+                        fds.clear()
+                        resolved.clear()
+                        pending.extend(reversed(self._root_relative(target)))
+                        continue
+                    pending.extend(reversed(target.split('/')))
+                    continue
+                fds.append(fd)
+                resolved.append(part)
+            fd = fds.pop() if fds else os.dup(self._root.fd)
+            return fd, tuple(resolved)
+        finally:
+            for fd in fds:
+                os.close(fd)
+
+    def _root_relative(self, target):
+        """绝对路径的符号链接目标转换为相对根目录的组件，不在根目录下时报错"""
+        parts = [part for part in target.split('/') if part and part != '.']
+        for root in (self.root_dir, self._real_root):
+            root_parts = [part for part in root.split(os.sep) if part]
+            if parts[:len(root_parts)] == root_parts:
+                return tuple(parts[len(root_parts):])
+        raise InvalidPathError("符号链接指向根目录以外")
+
+    def _acquire(self, parts):
+        """获取目录的fd（增加引用计数），用完后调用_release"""
+        if not parts:
+            return self._root
+        key = '/'.join(parts)
+        with self._lock:
+            handle = self._handles.get(key)
+            if handle is not None:
+                self._handles.move_to_end(key)
+                handle.refs += 1
+        if handle is not None:
+            try:
+                stat_info = os.stat(self._join(parts))
+                valid = (stat_info.st_dev, stat_info.st_ino) == handle.identity
+            except OSError:
+                valid = False
+            if valid:
+                return handle
+            # 目录被删除、移动或替换
+            self._release(handle, discard=True)
+
+        try:
+            fd, resolved = self._walk(parts)
+        except (FileNotFoundError, NotADirectoryError):
+            raise FileNotFoundError(f"目录不存在: {key}")
+        handle = _DirHandle(key, fd, resolved)
+        evicted = []
+        with self._lock:
+            old = self._handles.pop(key, None)
+            if old is not None:
+                old.evicted = True
+                if old.refs == 0:
+                    evicted.append(old)
+            handle.refs += 1
+            self._handles[key] = handle
+            while len(self._handles) > self.cache_size:
+                _, removed = self._handles.popitem(last=False)
+                removed.evicted = True
+                if removed.refs == 0:
+                    evicted.append(removed)
+            # 缓存本身持有一个引用，这里去掉
+            handle.refs -= 1
+        for removed in evicted:
+            os.close(removed.fd)
+        return handle
+
+    def _release(self, handle, discard=False):
+        if handle is self._root:
+            return
+        with self._lock:
+            handle.refs -= 1
+            if discard and self._handles.get(handle.key) is handle:
+                del self._handles[handle.key]
+                handle.evicted = True
+            close = handle.evicted and handle.refs == 0
+        if close:
+            os.close(handle.fd)
+
+    def clear(self):
+        """关闭所有未在使用的缓存fd"""
+        with self._lock:
+            handles = list(self._handles.values())
+            self._handles.clear()
+            idle = []
+            for handle in handles:
+                handle.evicted = True
+                if handle.refs == 0:
+                    idle.append(handle)
+        for handle in idle:
+            os.close(handle.fd)
+
+    # ------------------------------------------------------------ 解析
+
+    def _check_beneath(self, full_path):
+        """不支持dir_fd时检查路径展开符号链接后仍在根目录下"""
+        real_path = os.path.realpath(full_path)
+        if real_path != self._real_root and \
+                os.path.commonpath([real_path, self._real_root]) != self._real_root:
+            raise InvalidPathError("路径指向根目录以外")
+
+    @contextmanager
+    def directory(self, path):
+        """
+        打开目录，产生可以传给os.scandir、os.stat的目标（目录fd，不支持dir_fd时为完整路径）
+
+        Raises:
+            FileNotFoundError: 目录不存在或不是目录
+            InvalidPathError: 路径不合法
+        """
+        parts = split_path(path)
+        if not DIR_FD_SUPPORTED:
+            full_path = self._join(parts)
+            self._check_beneath(full_path)
+            if not os.path.isdir(full_path):
+                raise FileNotFoundError(f"目录不存在: {path}")
+            yield full_path
+            return
+        handle = self._acquire(parts)
+        try:
+            yield handle.fd
+        finally:
+            self._release(handle)
+
+    @contextmanager
+    def locate(self, path, name=None, follow=False):
+        """
+        解析路径，产生Location，用于相对所在目录的操作：
+            os.unlink(location.name, dir_fd=location.dir_fd)
+
+        Args:
+            path: 目录（相对根目录）
+            name: 目录下的文件名，为None时path的最后一个组件为文件名
+            follow: 最后一个组件是符号链接时是否展开（展开后仍不能离开根目录）
+        """
+        parts = split_path(path)
+        if name is not None:
+            parts += (check_name(name),)
+        if not parts:
+            # 根目录本身
+            parts = ('.',)
+        parent, last = parts[:-1], parts[-1]
+
+        if not DIR_FD_SUPPORTED:
+            full_path = os.path.join(self._join(parent), last)
+            self._check_beneath(full_path if follow else self._join(parent))
+            yield Location(None, full_path, full_path)
+            return
+
+        handle = self._acquire(parent)
+        try:
+            links = 0
+            while follow:
+                target = _readlink(last, handle.fd)
+                if target is None:
+                    break
+                links += 1
+                if links > MAX_SYMLINKS:
+                    raise OSError(errno.ELOOP, os.strerror(errno.ELOOP), last)
+                if os.path.isabs(target):
+                    combined = _normalize(self._root_relative(target)) or ('.',)
+                else:
+                    combined = _normalize(handle.parts + tuple(target.split('/'))) or ('.',)
+                self._release(handle)
+                handle = self._root
+                handle = self._acquire(combined[:-1])
+                last = combined[-1]
+            yield Location(handle.fd, last, os.path.normpath(os.path.join(self._join(handle.parts), last)))
+        finally:
+            self._release(handle)
+
+    def open(self, path, name=None, flags=os.O_RDONLY, mode=0o666, follow=True):
+        """
+        打开文件，返回fd
+
+        follow为False时最后一个组件是符号链接会失败（ELOOP），用于写入，避免通过链接写到其他位置。
+        """
+        with self.locate(path, name, follow) as location:
+            return os.open(location.name, flags | O_NOFOLLOW | O_CLOEXEC, mode, dir_fd=location.dir_fd)
+
+    def open_file(self, path, name=None, mode='rb', follow=True):
+        """打开文件，返回Python文件对象，name属性为完整路径"""
+        # 只读时带O_NONBLOCK，误打开FIFO等特殊文件不会阻塞（对普通文件没有影响）
+        flags = {
+            'rb': os.O_RDONLY | O_NONBLOCK, 'r': os.O_RDONLY | O_NONBLOCK,
+            'wb': os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 'w': os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+            'xb': os.O_WRONLY | os.O_CREAT | os.O_EXCL, 'x': os.O_WRONLY | os.O_CREAT | os.O_EXCL,
+        }[mode] | getattr(os, 'O_BINARY', 0)
+        encoding = None if 'b' in mode else 'utf-8'
+        with self.locate(path, name, follow) as location:
+            return open(
+                location.path, mode, encoding=encoding,
+                opener=lambda _, _flags: os.open(
+                    location.name, flags | O_NOFOLLOW | O_CLOEXEC, 0o666, dir_fd=location.dir_fd
+                ),
+            )
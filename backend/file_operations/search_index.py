@@ -0,0 +1,643 @@
+"""
+文件名搜索索引
+
+根目录下所有文件和文件夹的路径、大小、修改时间和类型保存在状态目录的SQLite数据库中，
+文件名建立FTS5 trigram索引，子串和通配符查询在数百万条目中也只需几毫秒。
+
+索引的维护：
+1. 启动后由一个进程（持有indexer.lock文件锁的进程）用线程池并行遍历整个根目录，
+   遍历期间旧的索引仍可查询；遍历完成后删除已不存在的条目
+2. 该进程用inotify监视所有目录，目录内容变化后重新扫描该目录
+3. 各进程的写操作通过file_utils.invalidate_directory/invalidate_tree通知索引
+4. inotify不可用、监视数达到上限或事件队列溢出时，定期重新遍历
+
+每个文件夹还记录递归的总字节数和文件数（tree_size/tree_files）：增量更新时把变化量
+累加到所有上级文件夹，全量遍历结束后整体重新汇总。列目录和"最大文件夹"查询直接读取，无需遍历。
+
+所有数据库写入都在每个进程的一个后台线程中进行，请求线程只读取。
+"""
+import os
+import re
+import stat
+import time
+import sqlite3
+import logging
+import datetime
+import mimetypes
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from django.conf import settings
+
+from . import fs_events
+from .storage import get_storage
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# 每个事务写入的最大条目数
+WRITE_BATCH_SIZE = 2000
+# 收到变化通知后等待合并后续通知的时间（秒）
+DEBOUNCE_SECONDS = 0.2
+# 非索引进程检查是否需要接管索引的间隔（秒）
+TAKEOVER_INTERVAL = 60
+
+# 变化通知的范围：单个条目、目录的直接子条目、整个子树
+_ENTRY, _DIR, _TREE = 0, 1, 2
+
+SEARCH_DEFAULT_LIMIT = 100
+SEARCH_MAX_LIMIT = 1000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    parent TEXT NOT NULL,
+    name TEXT NOT NULL,
+    ext TEXT NOT NULL,
+    is_dir INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    generation INTEGER NOT NULL,
+    tree_size INTEGER NOT NULL DEFAULT 0,
+    tree_files INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS files_parent ON files(parent);
+CREATE INDEX IF NOT EXISTS files_ext ON files(ext);
+CREATE INDEX IF NOT EXISTS files_size ON files(size);
+CREATE INDEX IF NOT EXISTS files_mtime ON files(mtime);
+CREATE INDEX IF NOT EXISTS files_generation ON files(generation);
+CREATE VIRTUAL TABLE IF NOT EXISTS files_fts USING fts5(
+    name, content='files', content_rowid='id', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS files_ai AFTER INSERT ON files BEGIN
+    INSERT INTO files_fts(rowid, name) VALUES (new.id, new.name);
+END;
+CREATE TRIGGER IF NOT EXISTS files_ad AFTER DELETE ON files BEGIN
+    INSERT INTO files_fts(files_fts, rowid, name) VALUES ('delete', old.id, old.name);
+END;
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+INSERT OR IGNORE INTO meta(key, value) VALUES ('generation', '0');
+"""
+
+# 路径唯一，名称不会被更新，因此FTS只需要插入和删除触发器
+_UPSERT_SQL = """
+INSERT INTO files(path, parent, name, ext, is_dir, size, mtime, generation)
+VALUES (?, ?, ?, ?, ?, ?, ?, COALESCE(?, (SELECT CAST(value AS INTEGER) FROM meta WHERE key = 'generation')))
+ON CONFLICT(path) DO UPDATE SET
+    is_dir = excluded.is_dir,
+    size = excluded.size,
+    mtime = excluded.mtime,
+    generation = MAX(generation, excluded.generation)
+"""
+
+_DELETE_TREE_SQL = "DELETE FROM files WHERE path = ? OR (path >= ? AND path < ?)"
+
+_ADD_TREE_SQL = "UPDATE files SET tree_size = tree_size + ?, tree_files = tree_files + ? WHERE path = ?"
+
+
+def _join(parent, name):
+    return f'{parent}/{name}' if parent else name
+
+
+def _ancestors(path):
+    """上级文件夹的相对路径（不含根目录）"""
+    while '/' in path:
+        path = path.rpartition('/')[0]
+        yield path
+
+
+def _make_row(parent, name, is_dir, stat_info):
+    ext = '' if is_dir else os.path.splitext(name)[1][1:].lower()
+    return (_join(parent, name), parent, name, ext, int(is_dir),
+            0 if is_dir else stat_info.st_size, stat_info.st_mtime)
+
+
+def _glob_to_like(pattern):
+    """把通配符转换为LIKE模式（结果是原模式的超集，用于走trigram索引预筛选）"""
+    like = []
+    in_class = False
+    for char in pattern:
+        if in_class:
+            if char == ']':
+                in_class = False
+            continue
+        if char == '*':
+            like.append('%')
+        elif char in '?%_':
+            like.append('_')
+        elif char == '[':
+            in_class = True
+            like.append('_')
+        else:
+            like.append(char)
+    return ''.join(like)
+
+
+def parse_time(value):
+    """解析时间过滤参数：Unix时间戳、YYYY-MM-DD 或 YYYY-MM-DD HH:MM:SS"""
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d'):
+        try:
+            return datetime.datetime.strptime(value, fmt).timestamp()
+        except ValueError:
+            continue
+    raise ValueError(f"无效的时间: {value}")
+
+
+class SearchIndex:
+    """根目录的文件名索引"""
+
+    def __init__(self, root_dir, db_path, workers=8, use_inotify=True, recrawl_interval=3600):
+        self.root_dir = os.path.normpath(root_dir)
+        self.db_path = db_path
+        self.workers = max(1, workers)
+        self.recrawl_interval = recrawl_interval
+        self.use_inotify = use_inotify and fs_events.available()
+        self.is_indexer = False
+        self._local = threading.local()
+        self._cond = threading.Condition()
+        self._dirty = {}
+        self._recrawl_requested = False
+        self._watcher = None
+        self._watch_incomplete = False
+        self._last_crawl = 0.0
+        self._indexer_lock_file = None
+        # 状态目录位于根目录内时不索引，避免数据库写入触发的事件形成循环
+        self._excluded = {os.path.normpath(os.path.dirname(db_path))}
+
+        conn = self._connect()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(_SCHEMA)
+        # 旧版本创建的数据库没有文件夹大小列，下次全量遍历后汇总
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(files)')}
+        for column in ('tree_size', 'tree_files'):
+            if column not in columns:
+                conn.execute(f'ALTER TABLE files ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0')
+        conn.execute('CREATE INDEX IF NOT EXISTS files_tree_size ON files(tree_size) WHERE is_dir = 1')
+
+        self._try_become_indexer()
+        thread = threading.Thread(target=self._run, name='gfinder-search-index', daemon=True)
+        thread.start()
+
+    def _connect(self):
+        """获取当前线程的数据库连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _try_become_indexer(self):
+        """获取索引锁；成功的进程负责全量遍历和inotify监视"""
+        if self.is_indexer:
+            return True
+        lock_file = open(os.path.join(os.path.dirname(self.db_path), 'indexer.lock'), 'a')
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return False
+        self._indexer_lock_file = lock_file
+        self.is_indexer = True
+        if self.use_inotify:
+            self._watcher = fs_events.InotifyWatcher(self._on_event, name='gfinder-search-inotify')
+        self.request_recrawl()
+        return True
+
+    def _abs(self, rel_path):
+        return os.path.join(self.root_dir, *rel_path.split('/')) if rel_path else self.root_dir
+
+    def _rel(self, abs_path):
+        rel_path = os.path.relpath(abs_path, self.root_dir)
+        return '' if rel_path == '.' else rel_path.replace(os.sep, '/')
+
+    # ---- 变化通知 ----
+
+    def mark_changed(self, rel_path, recursive=False):
+        """
+        通知目录内容发生了变化
+
+        Args:
+            rel_path: 相对根目录的路径
+            recursive: 是否重新遍历整个子树（用于新建、复制或移入的目录）
+        """
+        self._mark(rel_path.strip('/'), _TREE if recursive else _DIR)
+
+    def _mark(self, rel_path, level):
+        with self._cond:
+            self._dirty[rel_path] = max(self._dirty.get(rel_path, _ENTRY), level)
+            self._cond.notify()
+
+    def request_recrawl(self):
+        """请求重新遍历整个根目录"""
+        with self._cond:
+            self._recrawl_requested = True
+            self._cond.notify()
+
+    def _on_event(self, dir_path, name, mask):
+        if dir_path is None:
+            # 事件队列溢出，无法确定哪些目录发生了变化
+            self.request_recrawl()
+            return
+        if name is None:
+            # 目录自身的事件，其父目录也会收到对应的事件
+            return
+        rel_path = _join(self._rel(dir_path), name)
+        if mask & fs_events.IN_ISDIR and mask & (fs_events.IN_CREATE | fs_events.IN_MOVED_TO):
+            # 新出现的目录（可能是移入的整棵子树）
+            self._mark(rel_path, _TREE)
+        else:
+            # 文件变化只需重新获取该条目的信息，不必扫描整个目录
+            self._mark(rel_path, _ENTRY)
+
+    # ---- 后台线程 ----
+
+    def _run(self):
+        while True:
+            try:
+                self._run_once()
+            except Exception:
+                logger.exception("更新搜索索引出错")
+                time.sleep(1)
+
+    def _run_once(self):
+        with self._cond:
+            while not self._dirty and not self._recrawl_requested:
+                if not self._cond.wait(timeout=TAKEOVER_INTERVAL):
+                    self._on_idle()
+        time.sleep(DEBOUNCE_SECONDS)
+        with self._cond:
+            dirty, self._dirty = self._dirty, {}
+            recrawl, self._recrawl_requested = self._recrawl_requested, False
+
+        if recrawl and self.is_indexer:
+            self._full_crawl()
+        self._refresh_entries([path for path, level in dirty.items() if level == _ENTRY])
+        for rel_path in sorted(path for path, level in dirty.items() if level != _ENTRY):
+            try:
+                self._refresh(rel_path, dirty[rel_path] == _TREE)
+            except OSError as e:
+                logger.error(f"更新搜索索引失败: {rel_path}: {str(e)}")
+
+    def _on_idle(self):
+        """空闲时检查是否需要接管索引或定期重新遍历（调用时持有self._cond）"""
+        if not self.is_indexer:
+            self._try_become_indexer()
+        elif (not self.use_inotify or self._watch_incomplete) and \
+                time.time() - self._last_crawl > self.recrawl_interval:
+            self._recrawl_requested = True
+
+    # ---- 遍历和写入 ----
+
+    def _scan_dir(self, rel_dir):
+        """扫描一个目录，返回(条目行列表, 子目录相对路径列表)"""
+        abs_dir = self._abs(rel_dir)
+        if abs_dir in self._excluded:
+            return [], []
+        if self._watcher is not None:
+            # 先监视再扫描，避免遗漏扫描期间的变化
+            if not self._watcher.add_watch(abs_dir) and not self._watch_incomplete:
+                self._watch_incomplete = True
+                logger.warning("inotify监视数达到上限（fs.inotify.max_user_watches），搜索索引将定期重新遍历")
+        rows = []
+        subdirs = []
+        try:
+            with os.scandir(abs_dir) as it:
+                for entry in it:
+                    try:
+                        is_dir = entry.is_dir()
+                        try:
+                            stat_info = entry.stat()
+                        except OSError:
+                            stat_info = entry.stat(follow_symlinks=False)
+                        # 不进入指向目录的符号链接，避免循环
+                        if is_dir and not entry.is_symlink():
+                            if os.path.join(abs_dir, entry.name) in self._excluded:
+                                continue
+                            subdirs.append(_join(rel_dir, entry.name))
+                    except OSError:
+                        continue
+                    rows.append(_make_row(rel_dir, entry.name, is_dir, stat_info))
+        except OSError as e:
+            logger.error(f"索引目录失败: {str(e)}")
+        return rows, subdirs
+
+    def _write(self, rows=(), deleted=(), generation=None):
+        """
+        在一个事务中删除子树并写入条目
+
+        全量遍历（指定generation）时不维护文件夹大小，遍历结束后整体汇总；
+        其他写入把大小和文件数的变化量累加到所有上级文件夹。
+        """
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            deltas = {}
+
+            def add(path, size, files):
+                for ancestor in _ancestors(path):
+                    total = deltas.setdefault(ancestor, [0, 0])
+                    total[0] += size
+                    total[1] += files
+
+            for path in deleted:
+                if generation is None:
+                    old = conn.execute('SELECT is_dir, size, tree_size, tree_files FROM files WHERE path = ?',
+                                       (path,)).fetchone()
+                    if old is not None:
+                        add(path, *((-old[2], -old[3]) if old[0] else (-old[1], -1)))
+                conn.execute(_DELETE_TREE_SQL, (path, path + '/', path + '0'))
+            if generation is None:
+                for path, _, _, _, is_dir, size, _ in rows:
+                    old = conn.execute('SELECT is_dir, size FROM files WHERE path = ?', (path,)).fetchone()
+                    old_size, old_files = (old[1], 1) if old is not None and not old[0] else (0, 0)
+                    new_size, new_files = (0, 0) if is_dir else (size, 1)
+                    if (new_size, new_files) != (old_size, old_files):
+                        add(path, new_size - old_size, new_files - old_files)
+            conn.executemany(_UPSERT_SQL, [row + (generation,) for row in rows])
+            conn.executemany(_ADD_TREE_SQL, [(size, files, path) for path, (size, files) in deltas.items()])
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _summarize_folders(self, conn):
+        """重新汇总所有文件夹的递归大小和文件数（调用时已在事务中）"""
+        totals = {}
+        for path, size in conn.execute('SELECT path, size FROM files WHERE is_dir = 0'):
+            for ancestor in _ancestors(path):
+                total = totals.get(ancestor)
+                if total is None:
+                    totals[ancestor] = [size, 1]
+                else:
+                    total[0] += size
+                    total[1] += 1
+        conn.execute('UPDATE files SET tree_size = 0, tree_files = 0 WHERE is_dir = 1 AND tree_files != 0')
+        conn.executemany('UPDATE files SET tree_size = ?, tree_files = ? WHERE path = ?',
+                         [(size, files, path) for path, (size, files) in totals.items()])
+
+    def _crawl(self, rel_dir, generation=None):
+        """用线程池并行遍历子树并写入索引"""
+        batch = []
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='gfinder-index') as executor:
+            pending = {executor.submit(self._scan_dir, rel_dir)}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    rows, subdirs = future.result()
+                    batch.extend(rows)
+                    for subdir in subdirs:
+                        pending.add(executor.submit(self._scan_dir, subdir))
+                if len(batch) >= WRITE_BATCH_SIZE:
+                    self._write(batch, generation=generation)
+                    batch = []
+        if batch:
+            self._write(batch, generation=generation)
+
+    def _full_crawl(self):
+        """全量遍历，完成后删除本轮没有见到的条目"""
+        started = time.monotonic()
+        self._last_crawl = time.time()
+        self._watch_incomplete = False
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        generation = int(conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()[0]) + 1
+        conn.execute("UPDATE meta SET value = ? WHERE key = 'generation'", (str(generation),))
+        conn.execute('COMMIT')
+
+        self._crawl('', generation)
+
+        conn.execute('BEGIN IMMEDIATE')
+        conn.execute('DELETE FROM files WHERE generation < ?', (generation,))
+        self._summarize_folders(conn)
+        conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES ('crawled', ?)", (str(time.time()),))
+        conn.execute('COMMIT')
+        logger.info(f"搜索索引遍历完成，用时{time.monotonic() - started:.1f}秒")
+
+    def _refresh_entries(self, paths):
+        """重新获取单个条目的信息；已删除的条目连同子树一起移除"""
+        # 每个操作为(要删除的子树, 要写入的条目)，同一条目的删除和写入在同一事务中
+        operations = []
+        new_dirs = []
+        for rel_path in paths:
+            if not rel_path:
+                continue
+            parent, _, name = rel_path.rpartition('/')
+            abs_path = self._abs(rel_path)
+            try:
+                try:
+                    stat_info = os.stat(abs_path)
+                except FileNotFoundError:
+                    # 失效的符号链接
+                    stat_info = os.lstat(abs_path)
+            except OSError:
+                operations.append((rel_path, None))
+                continue
+            is_dir = stat.S_ISDIR(stat_info.st_mode)
+            if is_dir and not os.path.islink(abs_path):
+                new_dirs.append(rel_path)
+            # 文件可能由目录替换而来，先移除原来的子树
+            operations.append((None if is_dir else rel_path, _make_row(parent, name, is_dir, stat_info)))
+        for start in range(0, len(operations), WRITE_BATCH_SIZE):
+            batch = operations[start:start + WRITE_BATCH_SIZE]
+            self._write([row for _, row in batch if row is not None],
+                        deleted=[path for path, _ in batch if path is not None])
+        if new_dirs:
+            conn = self._connect()
+            for rel_path in new_dirs:
+                if conn.execute('SELECT 1 FROM files WHERE parent = ? LIMIT 1', (rel_path,)).fetchone() is None:
+                    self._crawl(rel_path)
+
+    def _refresh(self, rel_dir, recursive=False):
+        """重新扫描一个目录，更新其直接子条目，并遍历新出现的子目录"""
+        abs_dir = self._abs(rel_dir)
+        parent, _, name = rel_dir.rpartition('/')
+        if rel_dir and (os.path.islink(abs_dir) or not os.path.isdir(abs_dir)):
+            # 已被删除或已不是目录
+            try:
+                stat_info = os.stat(abs_dir)
+                self._write([_make_row(parent, name, False, stat_info)], deleted=[rel_dir])
+            except OSError:
+                self._write(deleted=[rel_dir])
+            return
+
+        rows, subdirs = self._scan_dir(rel_dir)
+        conn = self._connect()
+        existing = dict(conn.execute('SELECT path, is_dir FROM files WHERE parent = ?', (rel_dir,)))
+        current = {row[0] for row in rows}
+        deleted = [path for path in existing if path not in current]
+        if rel_dir:
+            try:
+                rows.append(_make_row(parent, name, True, os.stat(abs_dir)))
+            except OSError:
+                pass
+        self._write(rows, deleted=deleted)
+
+        for subdir in subdirs:
+            if recursive or not existing.get(subdir):
+                self._crawl(subdir)
+
+    # ---- 查询 ----
+
+    def is_ready(self):
+        """首次全量遍历是否已经完成"""
+        row = self._connect().execute("SELECT 1 FROM meta WHERE key = 'crawled'").fetchone()
+        return row is not None
+
+    def search(self, query='', glob=None, extensions=None, kind=None, min_size=None, max_size=None,
+               modified_after=None, modified_before=None, scope='', limit=SEARCH_DEFAULT_LIMIT, cursor=None):
+        """
+        搜索文件和文件夹
+
+        Args:
+            query: 文件名包含的子串（不区分大小写）
+            glob: 文件名通配符，如 *.tar.gz、IMG_????.jpg（区分大小写）
+            extensions: 扩展名列表（不含点）
+            kind: 'file' 或 'dir'
+            min_size, max_size: 文件大小范围（字节）
+            modified_after, modified_before: 修改时间范围（Unix时间戳）
+            scope: 只在该目录（相对根目录）下搜索
+            limit: 最多返回的条目数
+            cursor: 上一页返回的next_cursor
+
+        Returns:
+            {'items': [...], 'next_cursor': 游标或None}
+        """
+        conditions = []
+        params = []
+        like_patterns = []
+        if query:
+            like_patterns.append('%' + query.replace('%', '_') + '%')
+            if '%' in query or '_' in query:
+                conditions.append('instr(lower(f.name), lower(?)) > 0')
+                params.append(query)
+        if glob:
+            like_patterns.append(_glob_to_like(glob))
+            conditions.append('f.name GLOB ?')
+            params.append(glob)
+        if extensions:
+            conditions.append(f"f.ext IN ({','.join('?' * len(extensions))})")
+            params.extend(ext.lower().lstrip('.') for ext in extensions)
+        if kind in ('file', 'dir'):
+            conditions.append('f.is_dir = ?')
+            params.append(1 if kind == 'dir' else 0)
+        for column, op, value in (('size', '>=', min_size), ('size', '<=', max_size),
+                                  ('mtime', '>=', modified_after), ('mtime', '<=', modified_before)):
+            if value is not None:
+                conditions.append(f'f.{column} {op} ?')
+                params.append(value)
+        scope = scope.strip('/')
+        if scope:
+            conditions.append('f.path >= ? AND f.path < ?')
+            params.extend([scope + '/', scope + '0'])
+        if cursor:
+            try:
+                conditions.append('f.id > ?')
+                params.append(int(cursor))
+            except ValueError:
+                raise ValueError("无效的分页游标")
+
+        # trigram索引要求模式中有至少3个连续的普通字符，否则直接按主键顺序扫描，找到limit条即停止
+        indexed = [p for p in like_patterns if max(map(len, re.split('[%_]', p))) >= 3]
+        conditions = ['f.name LIKE ?' for p in like_patterns if p not in indexed] + conditions
+        params = [p for p in like_patterns if p not in indexed] + params
+        if indexed:
+            # 由FTS5 trigram索引按rowid顺序给出候选，满足条件的前limit条即可返回
+            sql = 'SELECT f.id, f.path, f.parent, f.name, f.is_dir, f.size, f.mtime ' \
+                  'FROM files_fts JOIN files f ON f.id = files_fts.rowid'
+            conditions = ['files_fts.name LIKE ?'] * len(indexed) + conditions
+            params = indexed + params
+            order = 'files_fts.rowid'
+        else:
+            sql = 'SELECT f.id, f.path, f.parent, f.name, f.is_dir, f.size, f.mtime FROM files f'
+            order = 'f.id'
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += f' ORDER BY {order} LIMIT ?'
+        params.append(limit + 1)
+
+        rows = self._connect().execute(sql, params).fetchall()
+        items = []
+        for row_id, path, parent, name, is_dir, size, mtime in rows[:limit]:
+            items.append({
+                'name': name,
+                'path': parent,
+                'is_dir': bool(is_dir),
+                'size': size,
+                'modified': datetime.datetime.fromtimestamp(mtime).strftime('%Y-%m-%d %H:%M:%S'),
+                'mimetype': None if is_dir else mimetypes.guess_type(name)[0],
+            })
+        next_cursor = str(rows[limit - 1][0]) if len(rows) > limit else None
+        return {'items': items, 'next_cursor': next_cursor}
+
+    def folder_sizes(self, rel_dir):
+        """目录下各文件夹的递归大小，返回{名称: (字节数, 文件数)}"""
+        rows = self._connect().execute(
+            'SELECT name, tree_size, tree_files FROM files WHERE parent = ? AND is_dir = 1', (rel_dir.strip('/'),)
+        )
+        return {name: (size, files) for name, size, files in rows}
+
+    def biggest_folders(self, scope='', limit=20):
+        """按递归大小降序列出scope下（含所有层级）最大的文件夹"""
+        scope = scope.strip('/')
+        sql = 'SELECT path, parent, name, tree_size, tree_files, mtime FROM files WHERE is_dir = 1'
+        params = []
+        if scope:
+            sql += ' AND path >= ? AND path < ?'
+            params.extend([scope + '/', scope + '0'])
+        sql += ' ORDER BY tree_size DESC LIMIT ?'
+        params.append(limit)
+        return [{
+            'name': name,
+            'path': parent,
+            'is_dir': True,
+            'size': size,
+            'file_count': files,
+            'modified': datetime.datetime.fromtimestamp(mtime).strftime('%Y-%m-%d %H:%M:%S'),
+        } for path, parent, name, size, files, mtime in self._connect().execute(sql, params)]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_search_index():
+    """获取进程内共享的搜索索引，未启用或存储不是单个本地目录时返回None"""
+    global _index
+    if not getattr(settings, 'GFINDER_SEARCH_INDEX', True):
+        return None
+    root_dir = get_storage().root_dir
+    if root_dir is None:
+        return None
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                from .file_utils import get_state_directory
+                _index = SearchIndex(
+                    root_dir,
+                    os.path.join(get_state_directory('search'), 'index.sqlite3'),
+                    workers=getattr(settings, 'GFINDER_SEARCH_WORKERS', 8),
+                    use_inotify=getattr(settings, 'GFINDER_SEARCH_INOTIFY', True),
+                    recrawl_interval=getattr(settings, 'GFINDER_SEARCH_RECRAWL_INTERVAL', 3600),
+                )
+    return _index
+
+
+def mark_changed(rel_path, recursive=False):
+    """写操作后通知搜索索引（未启用时忽略）"""
+    index = get_search_index()
+    if index is not None:
+        index.mark_changed(rel_path, recursive)
@@ -0,0 +1,701 @@
+"""
+存储后端
+
+文件操作通过存储后端执行，GFINDER_STORAGE_BACKEND选择：
+- local: 单个本地目录（GFINDER_ROOT_DIR），相对根目录的目录fd操作（见path_resolver模块）
+- memory: 数据保存在进程内存中，用于测试和基准测试，重启后丢失，也不在进程之间共享
+- multi: 多个本地目录（卷，GFINDER_STORAGE_VOLUMES），GFINDER_STORAGE_PLACEMENT为
+    mount: 每个卷是根目录下的一个顶层目录
+    hash: 合并显示各卷的根目录，新的顶层文件和文件夹按名称哈希分布到各卷；
+          每个顶层条目的整个子树在同一个卷上，重命名和卷内移动仍是原子的，
+          同时上传、复制到不同顶层目录的操作分散在各个磁盘上
+
+接口中path为相对根目录的目录，name为其中的条目名，name为None时表示path本身。
+需要本地文件路径的功能（打包下载、缩略图、分段预览、分块上传、后台任务等）通过local_path获取路径，
+内存存储不支持这些功能；搜索索引和秒传索引只在单个本地目录时启用。
+"""
+import io
+import os
+import sys
+import stat
+import zlib
+import errno
+import shutil
+import platform
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext, ExitStack
+
+from django.conf import settings
+
+from .path_resolver import PathResolver, split_path, check_name
+from .dir_cache import directory_signature
+from .copy_engine import copy_tree
+
+STORAGE_BACKENDS = ('local', 'memory', 'multi')
+PLACEMENTS = ('mount', 'hash')
+
+# 内存存储的stat结果中的设备号
+MEMORY_DEVICE = 0
+
+
+def _join_parts(*parts):
+    return '/'.join(part for part in parts if part)
+
+
+class Storage:
+    """存储后端接口"""
+
+    # 单个本地根目录（搜索索引、秒传索引和下载卸载需要），其他后端为None
+    root_dir = None
+
+    def join(self, path, name=None):
+        """条目的路径字符串（不访问文件系统），用作目录缓存的键和按扩展名检测类型；本地存储为完整路径"""
+        raise NotImplementedError
+
+    def directory(self, path):
+        """打开目录，产生带scandir()和signature()的对象（上下文管理器）"""
+        raise NotImplementedError
+
+    def stat(self, path, name=None, follow=False):
+        """条目的stat信息，follow为False时不跟随最后一个组件的符号链接"""
+        raise NotImplementedError
+
+    def mkdir(self, path, name):
+        raise NotImplementedError
+
+    def rename(self, path, old_name, new_name):
+        raise NotImplementedError
+
+    def remove(self, path, name):
+        """删除文件或符号链接"""
+        raise NotImplementedError
+
+    def rmtree(self, path, name):
+        """删除目录树"""
+        raise NotImplementedError
+
+    def move(self, source_path, name, target_path):
+        """把source_path下的name移动到target_path下（调用方已检查目标不存在）"""
+        raise NotImplementedError
+
+    def copy(self, source_path, name, target_path):
+        """把source_path下的name复制到target_path下（调用方已检查目标不存在）"""
+        raise NotImplementedError
+
+    def open(self, path, name, mode='rb', follow=True):
+        """打开文件，mode为rb、r、wb、w、xb或x"""
+        raise NotImplementedError
+
+    def link(self, source_path, source_name, target_path, target_name):
+        """创建硬链接（不跟随源的符号链接），不支持时抛出io.UnsupportedOperation"""
+        raise io.UnsupportedOperation("当前存储后端不支持该操作")
+
+    def fstat(self, file_obj):
+        """open返回的文件的stat信息"""
+        return os.fstat(file_obj.fileno())
+
+    def local_path(self, path, name=None, follow=False):
+        """条目的本地完整路径，不支持时抛出io.UnsupportedOperation"""
+        raise io.UnsupportedOperation("当前存储后端不支持该操作")
+
+    def close(self):
+        """释放后端持有的资源（配置变化后替换后端时调用）"""
+
+
+class _LocalDirectory:
+    __slots__ = ('target',)
+
+    def __init__(self, target):
+        # 目录fd，不支持dir_fd的平台为完整路径
+        self.target = target
+
+    def scandir(self):
+        return os.scandir(self.target)
+
+    def signature(self):
+        return directory_signature(self.target)
+
+
+class LocalStorage(Storage):
+    """单个本地目录，所有操作相对根目录下已打开的目录fd执行"""
+
+    def __init__(self, root_dir, cache_size=128):
+        # 如果目录不存在则创建
+        os.makedirs(root_dir, exist_ok=True)
+        self.resolver = PathResolver(root_dir, cache_size)
+        self.root_dir = self.resolver.root_dir
+
+    def join(self, path, name=None):
+        return self.resolver.join(path, name)
+
+    @contextmanager
+    def directory(self, path):
+        with self.resolver.directory(path) as target:
+            yield _LocalDirectory(target)
+
+    def stat(self, path, name=None, follow=False):
+        with self.resolver.locate(path, name, follow) as location:
+            return os.stat(location.name, dir_fd=location.dir_fd, follow_symlinks=False)
+
+    def mkdir(self, path, name):
+        with self.resolver.locate(path, name) as location:
+            os.mkdir(location.name, dir_fd=location.dir_fd)
+
+    def rename(self, path, old_name, new_name):
+        with self.resolver.locate(path, old_name) as location:
+            os.rename(location.name, location.sibling(new_name),
+                      src_dir_fd=location.dir_fd, dst_dir_fd=location.dir_fd)
+
+    def remove(self, path, name):
+        with self.resolver.locate(path, name) as location:
+            os.unlink(location.name, dir_fd=location.dir_fd)
+
+    def rmtree(self, path, name):
+        with self.resolver.locate(path, name) as location:
+            # Python 3.11起shutil.rmtree支持dir_fd
+            if location.dir_fd is not None and sys.version_info >= (3, 11):
+                shutil.rmtree(location.name, dir_fd=location.dir_fd)
+            else:
+                shutil.rmtree(location.path)
+
+    def move(self, source_path, name, target_path):
+        with self.resolver.locate(source_path, name) as source, \
+                self.resolver.locate(target_path, name) as target:
+            try:
+                os.rename(source.name, target.name, src_dir_fd=source.dir_fd, dst_dir_fd=target.dir_fd)
+            except OSError as e:
+                # 跨文件系统时复制后删除
+                if e.errno != errno.EXDEV:
+                    raise
+                shutil.move(source.path, target.path)
+
+    def copy(self, source_path, name, target_path):
+        copy_tree(self.local_path(source_path, name), self.local_path(target_path, name))
+
+    def open(self, path, name, mode='rb', follow=True):
+        return self.resolver.open_file(path, name, mode, follow)
+
+    def link(self, source_path, source_name, target_path, target_name):
+        with self.resolver.locate(source_path, source_name) as source, \
+                self.resolver.locate(target_path, target_name) as target:
+            os.link(source.name, target.name, src_dir_fd=source.dir_fd, dst_dir_fd=target.dir_fd,
+                    follow_symlinks=False)
+
+    def local_path(self, path, name=None, follow=False):
+        return self.resolver.full_path(path, name, follow)
+
+    def close(self):
+        self.resolver.clear()
+
+
+class _MemoryNode:
+    """内存存储中的文件（data为bytes）或目录（children为字典）"""
+    __slots__ = ('children', 'data', 'ino', 'mtime_ns')
+
+    _inodes = itertools.count(1)
+
+    def __init__(self, is_dir, data=b''):
+        self.children = {} if is_dir else None
+        self.data = None if is_dir else data
+        self.ino = next(self._inodes)
+        self.touch()
+
+    @property
+    def is_dir(self):
+        return self.children is not None
+
+    def touch(self):
+        self.mtime_ns = time.time_ns()
+
+    def stat(self):
+        if self.is_dir:
+            mode, size = stat.S_IFDIR | 0o755, 0
+        else:
+            mode, size = stat.S_IFREG | 0o644, len(self.data)
+        ns = self.mtime_ns
+        seconds = ns // 1000000000
+        return os.stat_result((
+            mode, self.ino, MEMORY_DEVICE, 1, 0, 0, size, seconds, seconds, seconds,
+            ns / 1e9, ns / 1e9, ns / 1e9, ns, ns, ns,
+        ))
+
+    def clone(self):
+        if not self.is_dir:
+            return _MemoryNode(False, self.data)
+        node = _MemoryNode(True)
+        node.children = {name: child.clone() for name, child in self.children.items()}
+        return node
+
+
+class _MemoryEntry:
+    """与os.DirEntry接口相同的目录条目"""
+    __slots__ = ('name', 'path', '_stat')
+
+    def __init__(self, name, path, node):
+        self.name = name
+        self.path = path
+        # 遍历时的快照，与scandir缓存的信息一样不随之后的修改变化
+        self._stat = node.stat()
+
+    def is_dir(self, follow_symlinks=True):
+        return stat.S_ISDIR(self._stat.st_mode)
+
+    def is_file(self, follow_symlinks=True):
+        return stat.S_ISREG(self._stat.st_mode)
+
+    def is_symlink(self):
+        return False
+
+    def inode(self):
+        return self._stat.st_ino
+
+    def stat(self, follow_symlinks=True):
+        return self._stat
+
+
+class _MemoryDirectory:
+    __slots__ = ('storage', 'node', 'path')
+
+    def __init__(self, storage, node, path):
+        self.storage = storage
+        self.node = node
+        self.path = path
+
+    def scandir(self):
+        with self.storage._lock:
+            entries = [
+                _MemoryEntry(name, self.path + os.sep + name, child)
+                for name, child in self.node.children.items()
+            ]
+        return nullcontext(entries)
+
+    def signature(self):
+        with self.storage._lock:
+            return (MEMORY_DEVICE, self.node.ino, self.node.mtime_ns)
+
+
+class _MemoryWriter(io.BytesIO):
+    """写入内存存储的文件，关闭时保存内容"""
+
+    def __init__(self, storage, node, name):
+        super().__init__()
+        self.storage = storage
+        self.node = node
+        self.name = name
+
+    def close(self):
+        if not self.closed:
+            with self.storage._lock:
+                self.node.data = self.getvalue()
+                self.node.touch()
+        super().close()
+
+
+class MemoryStorage(Storage):
+    """数据保存在进程内存中的存储，用于测试和基准测试"""
+
+    PREFIX = 'memory:'
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._root = _MemoryNode(True)
+
+    def join(self, path, name=None):
+        parts = split_path(path)
+        if name is not None:
+            parts += (check_name(name),)
+        return self.PREFIX + ''.join(os.sep + part for part in parts)
+
+    def _node(self, parts):
+        node = self._root
+        for index, part in enumerate(parts):
+            if not node.is_dir:
+                raise NotADirectoryError(f"不是目录: {'/'.join(parts[:index])}")
+            node = node.children.get(part)
+            if node is None:
+                raise FileNotFoundError(f"文件或目录不存在: {'/'.join(parts[:index + 1])}")
+        return node
+
+    def _parent(self, path):
+        """path对应的目录节点"""
+        node = self._node(split_path(path))
+        if not node.is_dir:
+            raise NotADirectoryError(f"不是目录: {path}")
+        return node
+
+    def _entry(self, path, name):
+        """返回(父目录节点, 名称)；name为None时为path本身"""
+        parts = split_path(path)
+        if name is not None:
+            parts += (check_name(name),)
+        if not parts:
+            raise PermissionError("不能修改根目录")
+        parent = self._node(parts[:-1])
+        if not parent.is_dir:
+            raise NotADirectoryError(f"不是目录: {'/'.join(parts[:-1])}")
+        return parent, parts[-1]
+
+    @contextmanager
+    def directory(self, path):
+        with self._lock:
+            try:
+                node = self._parent(path)
+            except (FileNotFoundError, NotADirectoryError):
+                raise FileNotFoundError(f"目录不存在: {path}")
+        yield _MemoryDirectory(self, node, self.join(path))
+
+    def stat(self, path, name=None, follow=False):
+        parts = split_path(path)
+        if name is not None:
+            parts += (check_name(name),)
+        with self._lock:
+            return self._node(parts).stat()
+
+    def mkdir(self, path, name):
+        with self._lock:
+            parent, name = self._entry(path, name)
+            if name in parent.children:
+                raise FileExistsError(f"文件或目录已存在: {name}")
+            parent.children[name] = _MemoryNode(True)
+            parent.touch()
+
+    def rename(self, path, old_name, new_name):
+        check_name(new_name)
+        with self._lock:
+            parent, old_name = self._entry(path, old_name)
+            node = parent.children.get(old_name)
+            if node is None:
+                raise FileNotFoundError(f"文件或目录不存在: {old_name}")
+            if new_name in parent.children:
+                raise FileExistsError(f"文件或目录已存在: {new_name}")
+            parent.children[new_name] = parent.children.pop(old_name)
+            parent.touch()
+
+    def _delete(self, path, name, is_dir):
+        with self._lock:
+            parent, name = self._entry(path, name)
+            node = parent.children.get(name)
+            if node is None:
+                raise FileNotFoundError(f"文件或目录不存在: {name}")
+            if node.is_dir != is_dir:
+                raise (NotADirectoryError if is_dir else IsADirectoryError)(f"类型不符: {name}")
+            del parent.children[name]
+            parent.touch()
+
+    def remove(self, path, name):
+        self._delete(path, name, False)
+
+    def rmtree(self, path, name):
+        self._delete(path, name, True)
+
+    def _transfer(self, source_path, name, target_path, keep_source):
+        with self._lock:
+            source_parent, name = self._entry(source_path, name)
+            node = source_parent.children.get(name)
+            if node is None:
+                raise FileNotFoundError("源文件或文件夹不存在")
+            target_parent = self._parent(target_path)
+            if name in target_parent.children:
+                raise FileExistsError("目标位置已存在同名文件或文件夹")
+            if not keep_source:
+                # 不能把目录移动到自身或其子目录中
+                target_parts = split_path(target_path)
+                source_parts = split_path(source_path) + (name,)
+                if target_parts[:len(source_parts)] == source_parts:
+                    raise OSError(errno.EINVAL, "不能把文件夹移动到自身的子目录中")
+                del source_parent.children[name]
+                source_parent.touch()
+            target_parent.children[name] = node.clone() if keep_source else node
+            target_parent.touch()
+
+    def move(self, source_path, name, target_path):
+        self._transfer(source_path, name, target_path, keep_source=False)
+
+    def copy(self, source_path, name, target_path):
+        self._transfer(source_path, name, target_path, keep_source=True)
+
+    def open(self, path, name, mode='rb', follow=True):
+        if mode not in ('rb', 'r', 'wb', 'w', 'xb', 'x'):
+            raise ValueError(f"不支持的打开方式: {mode}")
+        with self._lock:
+            parent, name = self._entry(path, name)
+            node = parent.children.get(name)
+            if mode[0] == 'r':
+                if node is None:
+                    raise FileNotFoundError(f"文件不存在: {name}")
+                if node.is_dir:
+                    raise IsADirectoryError(f"不是一个文件: {name}")
+                f = io.BytesIO(node.data)
+                f.name = self.join(path, name)
+                f.stat_info = node.stat()
+            else:
+                if node is not None and (mode[0] == 'x' or node.is_dir):
+                    raise (IsADirectoryError if node.is_dir else FileExistsError)(f"文件已存在: {name}")
+                if node is None:
+                    node = parent.children[name] = _MemoryNode(False)
+                    parent.touch()
+                else:
+                    node.data = b''
+                    node.touch()
+                f = _MemoryWriter(self, node, self.join(path, name))
+                f.stat_info = node.stat()
+        if 'b' in mode:
+            return f
+        text = io.TextIOWrapper(f, encoding='utf-8')
+        text.stat_info = f.stat_info
+        return text
+
+    def fstat(self, file_obj):
+        if isinstance(file_obj, _MemoryWriter):
+            with self._lock:
+                return file_obj.node.stat()
+        return file_obj.stat_info
+
+
+class _VolumeEntry:
+    """mount方式下根目录中代表一个卷的条目"""
+    __slots__ = ('name', 'path', '_root')
+
+    def __init__(self, name, root):
+        self.name = name
+        self.path = root
+        self._root = root
+
+    def is_dir(self, follow_symlinks=True):
+        return True
+
+    def is_file(self, follow_symlinks=True):
+        return False
+
+    def is_symlink(self):
+        return False
+
+    def inode(self):
+        return self.stat().st_ino
+
+    def stat(self, follow_symlinks=True):
+        return os.stat(self._root)
+
+
+class _MultiRootDirectory:
+    """多卷的根目录：mount方式列出各个卷，hash方式合并各卷根目录的内容"""
+    __slots__ = ('storage', 'directories')
+
+    def __init__(self, storage, directories):
+        self.storage = storage
+        self.directories = directories
+
+    @contextmanager
+    def scandir(self):
+        if self.storage.placement == 'mount':
+            yield [_VolumeEntry(name, volume.root_dir) for name, volume in self.storage.volumes.items()]
+            return
+        with ExitStack() as stack:
+            iterators = [stack.enter_context(directory.scandir()) for directory in self.directories]
+            yield itertools.chain.from_iterable(iterators)
+
+    def signature(self):
+        # 任一卷根目录的变化都会使缓存失效；第三项为最新的修改时间，供缓存判断时间戳是否可靠
+        signatures = tuple(directory.signature() for directory in self.directories)
+        return (MEMORY_DEVICE, signatures, max(signature[2] for signature in signatures))
+
+
+class MultiRootStorage(Storage):
+    """
+    多个本地目录（卷）组成的存储
+
+    Args:
+        volumes: {卷名: 目录}，卷名在mount方式下是根目录中显示的目录名
+        placement: mount或hash（见模块说明）
+        cache_size: 每个卷缓存的目录fd数
+    """
+
+    PREFIX = 'multi:'
+
+    def __init__(self, volumes, placement='mount', cache_size=128):
+        if not volumes:
+            raise ValueError("GFINDER_STORAGE_VOLUMES不能为空")
+        if placement not in PLACEMENTS:
+            raise ValueError(f"不支持的卷分布方式: {placement}")
+        self.placement = placement
+        self.volumes = OrderedDict(
+            (check_name(name), LocalStorage(root_dir, cache_size)) for name, root_dir in volumes.items()
+        )
+        self._ordered = list(self.volumes.values())
+
+    def _find(self, top):
+        """hash方式下顶层条目所在的卷，先查按名称哈希的卷"""
+        placed = self._place(top)
+        for volume in [placed] + [volume for volume in self._ordered if volume is not placed]:
+            if os.path.lexists(os.path.join(volume.root_dir, top)):
+                return volume
+        return None
+
+    def _place(self, top):
+        """按名称哈希为新的顶层条目选择卷（与进程无关，各进程结果一致）"""
+        digest = zlib.crc32(top.encode('utf-8', 'surrogateescape'))
+        return self._ordered[digest % len(self._ordered)]
+
+    def _locate(self, path, name=None, create=False, prefer=None):
+        """
+        条目所在的卷，返回(卷, 卷内目录, 名称)，名称为None时为卷的根目录
+
+        create为True时顶层条目可以不存在：hash方式下优先使用prefer，否则按名称哈希选择卷。
+        """
+        parts = split_path(path)
+        if name is not None:
+            parts += (check_name(name),)
+        if not parts:
+            raise PermissionError("不能修改根目录")
+        if self.placement == 'mount':
+            volume = self.volumes.get(parts[0])
+            if volume is None:
+                if create and len(parts) == 1:
+                    raise PermissionError("根目录下只能是存储卷")
+                raise FileNotFoundError(f"存储卷不存在: {parts[0]}")
+            if len(parts) == 1:
+                return volume, '', None
+            return volume, '/'.join(parts[1:-1]), parts[-1]
+        volume = self._find(parts[0])
+        if volume is None:
+            if not create or len(parts) > 1:
+                raise FileNotFoundError(f"文件或目录不存在: {parts[0]}")
+            volume = prefer or self._place(parts[0])
+        return volume, '/'.join(parts[:-1]), parts[-1]
+
+    def _locate_entry(self, path, name, create=False, prefer=None):
+        """要修改的条目，卷的根目录不能修改"""
+        volume, sub_path, name = self._locate(path, name, create, prefer)
+        if name is None:
+            raise PermissionError("不能修改存储卷")
+        return volume, sub_path, name
+
+    def join(self, path, name=None):
+        if not split_path(path) and name is None:
+            return self.PREFIX
+        volume, sub_path, name = self._locate(path, name, create=True)
+        return volume.join(sub_path, name)
+
+    @contextmanager
+    def directory(self, path):
+        if split_path(path):
+            volume, sub_path, name = self._locate(path)
+            with volume.directory(_join_parts(sub_path, name)) as directory:
+                yield directory
+            return
+        with ExitStack() as stack:
+            directories = [stack.enter_context(volume.directory('')) for volume in self._ordered]
+            yield _MultiRootDirectory(self, directories)
+
+    def stat(self, path, name=None, follow=False):
+        if not split_path(path) and name is None:
+            return self._ordered[0].stat('')
+        volume, sub_path, name = self._locate(path, name)
+        return volume.stat(sub_path, name, follow)
+
+    def mkdir(self, path, name):
+        volume, sub_path, name = self._locate_entry(path, name, create=True)
+        volume.mkdir(sub_path, name)
+
+    def rename(self, path, old_name, new_name):
+        volume, sub_path, old_name = self._locate_entry(path, old_name)
+        volume.rename(sub_path, old_name, new_name)
+
+    def remove(self, path, name):
+        volume, sub_path, name = self._locate_entry(path, name)
+        volume.remove(sub_path, name)
+
+    def rmtree(self, path, name):
+        volume, sub_path, name = self._locate_entry(path, name)
+        volume.rmtree(sub_path, name)
+
+    def move(self, source_path, name, target_path):
+        source_volume, source_sub, name = self._locate_entry(source_path, name)
+        # 移动到hash方式的根目录时留在原来的卷上，仍然是一次rename
+        target_volume, target_sub, _ = self._locate_entry(target_path, name, create=True, prefer=source_volume)
+        if target_volume is source_volume:
+            source_volume.move(source_sub, name, target_sub)
+        else:
+            shutil.move(source_volume.local_path(source_sub, name), target_volume.local_path(target_sub, name))
+
+    def copy(self, source_path, name, target_path):
+        source_volume, source_sub, name = self._locate_entry(source_path, name)
+        target_volume, target_sub, _ = self._locate_entry(target_path, name, create=True)
+        copy_tree(source_volume.local_path(source_sub, name), target_volume.local_path(target_sub, name))
+
+    def open(self, path, name, mode='rb', follow=True):
+        volume, sub_path, name = self._locate(path, name, create=mode[0] != 'r')
+        if name is None:
+            raise IsADirectoryError(f"不是一个文件: {path}")
+        return volume.open(sub_path, name, mode, follow)
+
+    def local_path(self, path, name=None, follow=False):
+        if not split_path(path) and name is None:
+            raise io.UnsupportedOperation("多个存储卷没有统一的根目录")
+        volume, sub_path, name = self._locate(path, name, create=True)
+        return volume.local_path(sub_path, name, follow)
+
+    def close(self):
+        for volume in self._ordered:
+            volume.close()
+
+
+def _configured_root(configured):
+    """配置的根目录，未配置时根据系统类型"""
+    if configured:
+        return configured
+    if platform.system() == 'Windows':
+        return 'd:\\data'
+    return '/var/opt/gfinder/data'
+
+
+def get_root_directory():
+    """获取根目录，优先使用配置的GFINDER_ROOT_DIR，否则根据系统类型"""
+    return _configured_root(getattr(settings, 'GFINDER_ROOT_DIR', None))
+
+
+def create_storage(backend='local', root_dir=None, volumes=None, placement='mount', cache_size=128):
+    """按配置创建存储后端"""
+    if backend == 'local':
+        return LocalStorage(root_dir or _configured_root(None), cache_size)
+    if backend == 'memory':
+        return MemoryStorage()
+    if backend == 'multi':
+        return MultiRootStorage(volumes or {}, placement, cache_size)
+    raise ValueError(f"不支持的存储后端: {backend}")
+
+
+def _storage_config():
+    volumes = getattr(settings, 'GFINDER_STORAGE_VOLUMES', None) or {}
+    return (
+        getattr(settings, 'GFINDER_STORAGE_BACKEND', 'local'),
+        get_root_directory(),
+        tuple(volumes.items()),
+        getattr(settings, 'GFINDER_STORAGE_PLACEMENT', 'mount'),
+        getattr(settings, 'GFINDER_DIRFD_CACHE_SIZE', 128),
+    )
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage():
+    """获取进程内共享的存储后端，相关配置变化时重新创建"""
+    global _storage
+    config = _storage_config()
+    storage = _storage
+    if storage is None or storage.config != config:
+        with _storage_lock:
+            if _storage is None or _storage.config != config:
+                backend, root_dir, volumes, placement, cache_size = config
+                storage = create_storage(backend, root_dir, dict(volumes), placement, cache_size)
+                storage.config = config
+                if _storage is not None:
+                    _storage.close()
+                _storage = storage
+            storage = _storage
+    return storage
@@ -0,0 +1,306 @@
+"""
+大文本文件的窗口预览
+
+按字节范围或行范围读取任意大小文件的一部分，通过mmap访问，内存占用与文件大小无关。
+
+按行定位使用稀疏的行索引：记录每个BLOCK_SIZE字节块之前的换行符数量。
+建立索引只需对每块调用一次bytes.count（C实现），4GB文件只有16K个条目；
+定位某一行时二分查找所在的块，再在块内查找换行符，耗时为毫秒级。
+
+索引在首次按行访问时建立，缓存在内存中并保存到状态目录，其他进程和重启后可以复用。
+同一文件只是追加了内容时（日志），从上次索引的位置继续统计，无需重新扫描；
+是否只是追加由文件开头和上次索引末尾的校验值判断，原地重写、截断后重写或删除后
+重新创建（复用了inode）的文件会重新建立索引。
+"""
+import os
+import mmap
+import bisect
+import hashlib
+import logging
+import threading
+from array import array
+from collections import OrderedDict
+
+from .file_utils import get_state_directory, is_valid_path
+from .storage import get_storage
+from ..metrics import cache_result
+
+logger = logging.getLogger(__name__)
+
+# 行索引的块大小
+BLOCK_SIZE = 256 * 1024
+# 内存中缓存的行索引数量
+INDEX_CACHE_SIZE = 32
+# 计算校验值时读取的文件开头和已索引部分末尾的字节数
+CHECK_BYTES = 4096
+# 磁盘索引文件的格式标记
+INDEX_MAGIC = 0x4746494458000002
+
+WINDOW_DEFAULT_LINES = 200
+WINDOW_MAX_LINES = 10000
+WINDOW_DEFAULT_BYTES = 64 * 1024
+# 单个窗口最多返回的字节数（超长的行会被截断）
+WINDOW_MAX_BYTES = 4 * 1024 * 1024
+
+
+class LineIndex:
+    """
+    稀疏行索引
+
+    counts[i]为第i个块（从i*BLOCK_SIZE开始）之前的换行符数量，
+    最后一个元素为已索引部分（indexed_size字节）中的换行符总数。
+    checksum为已索引部分的校验值（见_content_checksum）。
+    """
+
+    def __init__(self, identity, counts=None, indexed_size=0, checksum=0):
+        self.identity = identity
+        self.counts = counts if counts is not None else array('Q', [0])
+        self.indexed_size = indexed_size
+        self.checksum = checksum
+
+    def extend(self, mm, size):
+        """统计新增部分的换行符；最后一个不完整的块在文件增长后重新统计"""
+        full_blocks = self.indexed_size // BLOCK_SIZE
+        del self.counts[full_blocks + 1:]
+        total = self.counts[full_blocks]
+        for start in range(full_blocks * BLOCK_SIZE, size, BLOCK_SIZE):
+            end = min(start + BLOCK_SIZE, size)
+            total += mm[start:end].count(b'\n')
+            if end - start == BLOCK_SIZE:
+                self.counts.append(total)
+        if size % BLOCK_SIZE:
+            self.counts.append(total)
+        self.indexed_size = size
+
+    @property
+    def newlines(self):
+        return self.counts[-1]
+
+    def line_offset(self, mm, line):
+        """第line行（从0开始）的起始字节偏移"""
+        if line <= 0:
+            return 0
+        # 第line行从第line个换行符之后开始：找到包含该换行符的块
+        block = bisect.bisect_left(self.counts, line) - 1
+        position = block * BLOCK_SIZE
+        remaining = line - self.counts[block]
+        while remaining > 0:
+            position = mm.find(b'\n', position) + 1
+            remaining -= 1
+        return position
+
+
+def _content_checksum(mm, size):
+    """文件前size字节的开头和末尾各CHECK_BYTES字节的校验值，用于判断文件是否只是被追加"""
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(size.to_bytes(8, 'little'))
+    digest.update(mm[:min(CHECK_BYTES, size)])
+    digest.update(mm[max(0, size - CHECK_BYTES):size])
+    return int.from_bytes(digest.digest(), 'little')
+
+
+class _IndexStore:
+    """行索引的内存LRU缓存和磁盘持久化"""
+
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def _disk_path(self, file_path):
+        key = hashlib.sha1(os.fsencode(file_path)).hexdigest()
+        return os.path.join(self.index_dir, key + '.idx')
+
+    def _load(self, file_path, dev_ino):
+        """
+        从磁盘读取索引
+
+        文件头为(INDEX_MAGIC, dev, ino, 已索引字节数, mtime_ns, 校验值)，其后为counts
+        """
+        try:
+            with open(self._disk_path(file_path), 'rb') as f:
+                header = array('Q')
+                header.fromfile(f, 6)
+                counts = array('Q')
+                counts.frombytes(f.read())
+        except (OSError, EOFError, ValueError):
+            return None
+        if header[0] != INDEX_MAGIC or tuple(header[1:3]) != dev_ino or not counts:
+            return None
+        return LineIndex(tuple(header[1:5]), counts, header[3], header[5])
+
+    def _save(self, file_path, index):
+        path = self._disk_path(file_path)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                array('Q', [INDEX_MAGIC, *index.identity, index.checksum]).tofile(f)
+                index.counts.tofile(f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.error(f"保存行索引失败: {str(e)}")
+
+    def get(self, file_path, stat_info, mm):
+        """获取与文件当前内容一致的行索引"""
+        dev_ino = (stat_info.st_dev, stat_info.st_ino)
+        identity = dev_ino + (stat_info.st_size, stat_info.st_mtime_ns)
+        with self._lock:
+            index = self._entries.get(file_path)
+            if index is not None:
+                self._entries.move_to_end(file_path)
+        if index is None:
+            index = self._load(file_path, dev_ino)
+        if index is not None and index.identity == identity:
+            cache_result('line_index', True)
+            return index
+        cache_result('line_index', False)
+
+        if index is not None and index.identity[:2] == dev_ino and index.indexed_size < stat_info.st_size \
+                and index.checksum == _content_checksum(mm, index.indexed_size):
+            # 同一文件只是追加了内容，从上次的位置继续
+            index = LineIndex(identity, array('Q', index.counts), index.indexed_size)
+        else:
+            index = LineIndex(identity)
+        index.extend(mm, stat_info.st_size)
+        index.checksum = _content_checksum(mm, stat_info.st_size)
+        self._save(file_path, index)
+        with self._lock:
+            self._entries[file_path] = index
+            self._entries.move_to_end(file_path)
+            while len(self._entries) > INDEX_CACHE_SIZE:
+                self._entries.popitem(last=False)
+        return index
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def _get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = _IndexStore(get_state_directory('line_index'))
+    return _store
+
+
+def get_line_index(file_path, stat_info, mm):
+    """获取文件的行索引（mm为文件的mmap，stat_info用于校验缓存）"""
+    return _get_store().get(file_path, stat_info, mm)
+
+
+def _resolve(path, filename):
+    relative_path = os.path.join(path.strip('/'), filename)
+    if not filename or not is_valid_path(relative_path):
+        raise ValueError("路径不合法")
+    file_path = get_storage().local_path(path, filename, follow=True)
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"文件不存在: {filename}")
+    if not os.path.isfile(file_path):
+        raise IsADirectoryError(f"不是一个文件: {filename}")
+    return file_path
+
+
+def _char_start(mm, position, size):
+    """向后跳过UTF-8的后续字节，避免从多字节字符的中间开始"""
+    for _ in range(3):
+        if position < size and 0x80 <= mm[position] < 0xC0:
+            position += 1
+    return position
+
+
+def _decode(data):
+    return data.decode('utf-8', errors='replace')
+
+
+def read_window(path, filename, offset=None, length=None, line=None, lines=None):
+    """
+    读取文件的一个窗口
+
+    按行：line为起始行号（从1开始，负数表示倒数第几行），lines为行数
+    按字节：offset为起始偏移，length为字节数（起止位置对齐到UTF-8字符边界）
+
+    Returns:
+        按行时包含lines列表和行号信息，按字节时包含content；
+        都包含offset/next_offset（下一个窗口的起始偏移）、size和eof
+    """
+    file_path = _resolve(path, filename)
+    with open(file_path, 'rb') as f:
+        stat_info = os.fstat(f.fileno())
+        size = stat_info.st_size
+        if size == 0:
+            # 空文件无法mmap
+            if line is not None:
+                return {'lines': [], 'start_line': 1, 'end_line': 0, 'total_lines': 0,
+                        'offset': 0, 'next_offset': 0, 'size': 0, 'eof': True, 'truncated': False}
+            return {'content': '', 'offset': 0, 'next_offset': 0, 'size': 0, 'eof': True}
+
+        with mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as mm:
+            if line is None:
+                return _read_bytes(mm, size, offset or 0, length or WINDOW_DEFAULT_BYTES)
+            return _read_lines(mm, size, file_path, stat_info, line, lines or WINDOW_DEFAULT_LINES)
+
+
+def _read_bytes(mm, size, offset, length):
+    if offset < 0 or length <= 0:
+        raise ValueError("无效的字节范围")
+    length = min(length, WINDOW_MAX_BYTES)
+    start = _char_start(mm, min(offset, size), size)
+    end = min(start + length, size)
+    if end < size:
+        # 结束位置落在多字节字符中间时退回到字符开始处
+        adjusted = end
+        while adjusted > start and end - adjusted < 3 and 0x80 <= mm[adjusted] < 0xC0:
+            adjusted -= 1
+        if adjusted > start:
+            end = adjusted
+    return {
+        'content': _decode(mm[start:end]),
+        'offset': start,
+        'next_offset': end,
+        'size': size,
+        'eof': end >= size,
+    }
+
+
+def _read_lines(mm, size, file_path, stat_info, line, count):
+    if line == 0 or count <= 0:
+        raise ValueError("无效的行范围")
+    count = min(count, WINDOW_MAX_LINES)
+    index = get_line_index(file_path, stat_info, mm)
+    # 最后一行没有换行符结尾时也算一行
+    total_lines = index.newlines + (0 if mm[size - 1] == 0x0A else 1)
+    if line < 0:
+        line = max(total_lines + line + 1, 1)
+    first = line - 1
+
+    start = index.line_offset(mm, first) if first < total_lines else size
+    result = []
+    position = start
+    limit = min(start + WINDOW_MAX_BYTES, size)
+    truncated = False
+    while len(result) < count and position < size:
+        newline = mm.find(b'\n', position, limit)
+        if newline < 0:
+            if limit < size:
+                # 窗口字节数达到上限，截断当前行
+                truncated = True
+                result.append(_decode(mm[position:limit]).rstrip('\r'))
+                position = limit
+                break
+            newline = size
+        result.append(_decode(mm[position:newline]).rstrip('\r'))
+        position = newline + 1
+    position = min(position, size)
+    return {
+        'lines': result,
+        'start_line': line,
+        'end_line': line + len(result) - 1,
+        'total_lines': total_lines,
+        'offset': start,
+        'next_offset': position,
+        'size': size,
+        'eof': position >= size,
+        'truncated': truncated,
+    }
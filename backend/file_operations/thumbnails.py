@@ -0,0 +1,252 @@
+"""
+缩略图服务
+
+图片缩略图在进程池中用Pillow生成（解码和缩放是CPU密集型操作，不占用请求线程，
+也不受GIL限制），结果以WebP或JPEG保存在状态目录的thumbnails子目录中。
+
+缓存键由文件路径、修改时间、大小、尺寸和格式计算，原图修改后自动生成新的缩略图。
+缓存总大小超过上限时按最近使用时间（命中时更新文件的mtime）淘汰最旧的缩略图。
+"""
+import os
+import hashlib
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+
+from .file_utils import get_state_directory, is_valid_path
+from .storage import get_storage
+from ..metrics import cache_result
+
+try:
+    from PIL import Image, ImageOps, UnidentifiedImageError
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# 缩略图尺寸：最长边的像素数
+THUMBNAIL_SIZES = {
+    'small': 128,
+    'medium': 256,
+    'large': 1024,
+}
+
+# 输出格式：(扩展名, MIME类型, Pillow格式名)
+THUMBNAIL_FORMATS = {
+    'webp': ('.webp', 'image/webp', 'WEBP'),
+    'jpeg': ('.jpg', 'image/jpeg', 'JPEG'),
+}
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.tif', '.tiff')
+
+THUMBNAIL_QUALITY = 80
+# 淘汰时清理到上限的该比例，避免每次写入都触发淘汰
+EVICT_TARGET_RATIO = 0.9
+
+
+def available():
+    """是否安装了Pillow"""
+    return Image is not None
+
+
+def render_thumbnail(source, target, size, image_format):
+    """
+    生成缩略图（在子进程中执行）
+
+    先写入临时文件再原子地重命名，其他进程不会读到不完整的缩略图。
+
+    Returns:
+        缩略图的字节数
+    """
+    pil_format = THUMBNAIL_FORMATS[image_format][2]
+    tmp_path = f'{target}.{os.getpid()}.tmp'
+    try:
+        img = Image.open(source)
+    except (UnidentifiedImageError, Image.DecompressionBombError) as e:
+        raise ValueError(f"无法识别的图片: {str(e)}")
+    with img:
+        # JPEG可以在解码时直接缩小，大图速度提升数倍
+        img.draft('RGB', (size, size))
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((size, size), Image.LANCZOS)
+        if pil_format == 'JPEG' and img.mode != 'RGB':
+            img = img.convert('RGB')
+        elif img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA' if 'A' in img.getbands() or 'transparency' in img.info else 'RGB')
+        try:
+            img.save(tmp_path, pil_format, quality=THUMBNAIL_QUALITY)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    os.replace(tmp_path, target)
+    return os.path.getsize(target)
+
+
+class ThumbnailService:
+    """缩略图生成和磁盘缓存"""
+
+    def __init__(self, cache_dir, max_cache_bytes, workers=None):
+        self.cache_dir = cache_dir
+        self.max_cache_bytes = max_cache_bytes
+        self.workers = workers or os.cpu_count() or 1
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pending = {}
+        self._cache_bytes = None
+
+    def _get_pool(self):
+        # 使用spawn，避免在有多个线程的服务器进程中fork
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')
+            )
+        return self._pool
+
+    def resolve(self, path, filename, size='medium', image_format='webp'):
+        """
+        校验参数并定位缩略图
+
+        Returns:
+            (原图完整路径, 缓存文件路径, 缓存键)
+        """
+        if size not in THUMBNAIL_SIZES:
+            raise ValueError(f"不支持的缩略图尺寸: {size}")
+        if image_format not in THUMBNAIL_FORMATS:
+            raise ValueError(f"不支持的缩略图格式: {image_format}")
+        relative_path = os.path.join(path.strip('/'), filename)
+        if not filename or not is_valid_path(relative_path):
+            raise ValueError("路径不合法")
+        if os.path.splitext(filename)[1].lower() not in IMAGE_EXTENSIONS:
+            raise ValueError("不支持生成缩略图的文件类型")
+        source = get_storage().local_path(path, filename, follow=True)
+        stat_info = os.stat(source)
+        raw = f'{relative_path}\0{stat_info.st_mtime_ns}\0{stat_info.st_size}\0{size}\0{image_format}'
+        key = hashlib.sha1(raw.encode('utf-8', 'surrogateescape')).hexdigest()
+        target = os.path.join(self.cache_dir, key[:2], key + THUMBNAIL_FORMATS[image_format][0])
+        return source, target, key
+
+    def _submit(self, source, target, key, size, image_format):
+        """提交生成任务；同一缩略图的并发请求共用一个任务"""
+        with self._lock:
+            future = self._pending.get(key)
+            if future is not None:
+                return future
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            args = (render_thumbnail, source, target, THUMBNAIL_SIZES[size], image_format)
+            try:
+                future = self._get_pool().submit(*args)
+            except BrokenProcessPool:
+                # 子进程异常退出（如解码损坏的图片时崩溃）后进程池不可再用，重新创建
+                logger.warning("缩略图进程池已损坏，重新创建")
+                self._pool = None
+                future = self._get_pool().submit(*args)
+            self._pending[key] = future
+        future.add_done_callback(lambda f: self._on_done(key, f))
+        return future
+
+    def _on_done(self, key, future):
+        with self._lock:
+            self._pending.pop(key, None)
+        if future.cancelled() or future.exception() is not None:
+            return
+        self._account(future.result())
+
+    def get(self, path, filename, size='medium', image_format='webp'):
+        """
+        获取缩略图，不存在时生成并等待完成
+
+        Returns:
+            (缓存文件路径, 缓存键)
+        """
+        source, target, key = self.resolve(path, filename, size, image_format)
+        try:
+            # 更新mtime记录最近使用时间
+            os.utime(target)
+            cache_result('thumbnail', True)
+            return target, key
+        except FileNotFoundError:
+            pass
+        cache_result('thumbnail', False)
+        self._submit(source, target, key, size, image_format).result()
+        return target, key
+
+    def prefetch(self, path, names, size='medium', image_format='webp'):
+        """
+        为目录中的图片在后台生成缩略图，不等待完成
+
+        Returns:
+            {'queued': 新提交的数量, 'cached': 已有缓存的数量}
+        """
+        queued = cached = 0
+        for name in names:
+            try:
+                source, target, key = self.resolve(path, name, size, image_format)
+            except (ValueError, OSError):
+                continue
+            if os.path.exists(target):
+                cached += 1
+                continue
+            self._submit(source, target, key, size, image_format)
+            queued += 1
+        return {'queued': queued, 'cached': cached}
+
+    def _scan_cache(self):
+        """列出缓存文件(最近使用时间, 大小, 路径)"""
+        files = []
+        for dirpath, dirnames, filenames in os.walk(self.cache_dir):
+            for name in filenames:
+                file_path = os.path.join(dirpath, name)
+                try:
+                    stat_info = os.stat(file_path)
+                except FileNotFoundError:
+                    continue
+                files.append((stat_info.st_mtime, stat_info.st_size, file_path))
+        return files
+
+    def _account(self, nbytes):
+        """记录新增的缓存大小，超过上限时淘汰最久未使用的缩略图"""
+        with self._lock:
+            if self._cache_bytes is None:
+                # 首次统计已包含刚生成的缩略图
+                self._cache_bytes = sum(size for _, size, _ in self._scan_cache())
+            else:
+                self._cache_bytes += nbytes
+            if self._cache_bytes <= self.max_cache_bytes:
+                return
+            # 其他进程也会写入缓存，淘汰前重新统计
+            files = self._scan_cache()
+            total = sum(size for _, size, _ in files)
+            target = self.max_cache_bytes * EVICT_TARGET_RATIO
+            files.sort()
+            for _, size, file_path in files:
+                if total <= target:
+                    break
+                try:
+                    os.remove(file_path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+            self._cache_bytes = total
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_thumbnail_service():
+    """获取进程内共享的缩略图服务"""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = ThumbnailService(
+                    get_state_directory('thumbnails'),
+                    max_cache_bytes=getattr(settings, 'GFINDER_THUMBNAIL_CACHE_SIZE', 512 * 1024 * 1024),
+                    workers=getattr(settings, 'GFINDER_THUMBNAIL_WORKERS', None),
+                )
+    return _service
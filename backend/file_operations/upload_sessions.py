@@ -0,0 +1,317 @@
+"""
+分块上传会话
+
+支持大文件断点续传和并行上传：
+1. 创建会话，服务器在状态目录中预分配与目标文件同样大小的数据文件
+2. 客户端按偏移量上传分块（可并行、可乱序），服务器用定位写入(pwrite)写入数据文件
+3. 客户端可随时查询已接收的字节范围，仅重传缺失部分
+4. 提交时检查是否接收完整，可选校验整体哈希，然后原子地移动到目标位置
+
+已接收范围以追加方式记录在每个会话的ranges.log中，多个进程同时写入也无需加锁。
+长时间没有新分块的会话会被自动清理。
+"""
+import os
+import re
+import json
+import time
+import shutil
+import hashlib
+import threading
+
+from django.conf import settings
+
+from .file_utils import get_state_directory, is_valid_path, is_valid_name, invalidate_directory
+from .storage import get_storage
+from .content_index import get_content_index, record_content_hash
+
+# 建议客户端使用的分块大小
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+# 从请求体读取数据的块大小
+READ_SIZE = 1024 * 1024
+# 两次清理过期会话之间的最小间隔（秒）
+CLEANUP_INTERVAL = 600
+
+_SESSION_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+_last_cleanup = 0.0
+_cleanup_lock = threading.Lock()
+
+
+def _session_ttl():
+    return getattr(settings, 'GFINDER_UPLOAD_SESSION_TTL', 24 * 3600)
+
+
+def _sessions_root():
+    return get_state_directory('uploads')
+
+
+def _session_dir(session_id):
+    """获取会话目录，会话不存在时抛出FileNotFoundError"""
+    if not _SESSION_ID_RE.match(session_id or ''):
+        raise FileNotFoundError("上传会话不存在")
+    session_dir = os.path.join(_sessions_root(), session_id)
+    if not os.path.isdir(session_dir):
+        raise FileNotFoundError("上传会话不存在")
+    return session_dir
+
+
+def _load_meta(session_dir):
+    with open(os.path.join(session_dir, 'session.json'), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _parse_checksum(checksum):
+    """解析"算法:十六进制摘要"格式的校验值"""
+    if not checksum:
+        return None
+    algorithm, sep, digest = checksum.partition(':')
+    algorithm = algorithm.strip().lower()
+    if not sep or algorithm not in hashlib.algorithms_guaranteed or not digest.strip():
+        raise ValueError("校验值格式应为 算法:摘要，例如 sha256:...")
+    return algorithm, digest.strip().lower()
+
+
+def _preallocate(fd, size):
+    """预分配数据文件空间，尽量避免分块乱序写入造成碎片"""
+    if size <= 0:
+        return
+    if hasattr(os, 'posix_fallocate'):
+        try:
+            os.posix_fallocate(fd, 0, size)
+            return
+        except OSError:
+            # 部分文件系统不支持fallocate
+            pass
+    os.ftruncate(fd, size)
+
+
+def _pwrite_all(fd, data, offset):
+    """在指定偏移量写入全部数据"""
+    view = memoryview(data)
+    while view:
+        if hasattr(os, 'pwrite'):
+            written = os.pwrite(fd, view, offset)
+        else:
+            os.lseek(fd, offset, os.SEEK_SET)
+            written = os.write(fd, view)
+        view = view[written:]
+        offset += written
+
+
+def _received_ranges(session_dir):
+    """读取并合并已接收的字节范围，返回[[start, end)]"""
+    ranges = []
+    try:
+        with open(os.path.join(session_dir, 'ranges.log'), 'r', encoding='ascii') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 2:
+                    ranges.append((int(parts[0]), int(parts[1])))
+    except FileNotFoundError:
+        pass
+
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def create_upload_session(path, filename, size, checksum=None):
+    """
+    创建上传会话
+
+    Args:
+        path: 目标目录（相对根目录）
+        filename: 目标文件名
+        size: 文件总大小
+        checksum: 可选的整体校验值，格式为"算法:摘要"
+
+    Returns:
+        dict: 会话信息
+    """
+    if not is_valid_name(filename) or not is_valid_path(path):
+        raise ValueError("路径不合法")
+    size = int(size)
+    if size < 0:
+        raise ValueError("文件大小不合法")
+    _parse_checksum(checksum)
+
+    storage = get_storage()
+    with storage.directory(path):
+        pass
+    # 提交时移动到目标位置，需要本地路径（内存存储不支持分块上传）
+    storage.local_path(path, filename)
+
+    cleanup_expired_sessions()
+
+    session_id = os.urandom(16).hex()
+    session_dir = os.path.join(_sessions_root(), session_id)
+    os.makedirs(session_dir)
+    meta = {
+        'path': path.strip('/'),
+        'filename': filename,
+        'size': size,
+        'checksum': checksum or None,
+        'created': time.time(),
+    }
+    with open(os.path.join(session_dir, 'session.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+
+    fd = os.open(os.path.join(session_dir, 'data'), os.O_WRONLY | os.O_CREAT | getattr(os, 'O_BINARY', 0), 0o644)
+    try:
+        _preallocate(fd, size)
+    finally:
+        os.close(fd)
+    # 创建空的范围记录，其修改时间即会话最近活动时间
+    open(os.path.join(session_dir, 'ranges.log'), 'a').close()
+
+    return {
+        'session_id': session_id,
+        'size': size,
+        'chunk_size': DEFAULT_CHUNK_SIZE,
+        'expires_in': _session_ttl(),
+    }
+
+
+def get_upload_status(session_id):
+    """查询会话已接收的字节范围"""
+    session_dir = _session_dir(session_id)
+    meta = _load_meta(session_dir)
+    received = _received_ranges(session_dir)
+    received_bytes = sum(end - start for start, end in received)
+    return {
+        'session_id': session_id,
+        'path': meta['path'],
+        'filename': meta['filename'],
+        'size': meta['size'],
+        'received': received,
+        'received_bytes': received_bytes,
+        'complete': received_bytes >= meta['size'],
+    }
+
+
+def write_upload_chunk(session_id, offset, stream, length):
+    """
+    将请求体写入数据文件的指定偏移量
+
+    Args:
+        session_id: 会话ID
+        offset: 分块在文件中的偏移量
+        stream: 可read()的请求体
+        length: 分块长度（Content-Length）
+
+    Returns:
+        int: 实际写入的字节数
+    """
+    session_dir = _session_dir(session_id)
+    meta = _load_meta(session_dir)
+    offset = int(offset)
+    length = int(length)
+    if offset < 0 or length < 0 or offset + length > meta['size']:
+        raise ValueError("分块超出文件范围")
+
+    written = 0
+    fd = os.open(os.path.join(session_dir, 'data'), os.O_WRONLY | getattr(os, 'O_BINARY', 0))
+    try:
+        while written < length:
+            data = stream.read(min(READ_SIZE, length - written))
+            if not data:
+                break
+            _pwrite_all(fd, data, offset + written)
+            written += len(data)
+    finally:
+        os.close(fd)
+        # 即使连接中断也记录已写入的部分，客户端续传时只需补齐剩余部分
+        if written:
+            with open(os.path.join(session_dir, 'ranges.log'), 'a', encoding='ascii') as f:
+                f.write(f'{offset} {offset + written}\n')
+    return written
+
+
+def commit_upload_session(session_id):
+    """
+    提交会话：检查完整性和校验值，然后移动到目标位置
+
+    Returns:
+        dict: 上传结果
+    """
+    session_dir = _session_dir(session_id)
+    meta = _load_meta(session_dir)
+    size = meta['size']
+    received = _received_ranges(session_dir)
+    if size > 0 and received != [[0, size]]:
+        raise ValueError("文件尚未上传完整")
+
+    data_path = os.path.join(session_dir, 'data')
+    checksum = _parse_checksum(meta.get('checksum'))
+    # 分块可能乱序到达，在提交时计算SHA-256供秒传使用，与校验值在同一次读取中完成
+    content_digest = hashlib.sha256() if get_content_index() is not None else None
+    check_digest = None
+    if checksum:
+        algorithm, expected = checksum
+        if algorithm == 'sha256' and content_digest is not None:
+            check_digest = content_digest
+        else:
+            check_digest = hashlib.new(algorithm)
+    digests = [d for d in (content_digest, check_digest) if d is not None]
+    if len(digests) == 2 and digests[0] is digests[1]:
+        digests.pop()
+    with open(data_path, 'rb') as f:
+        if digests:
+            for block in iter(lambda: f.read(READ_SIZE), b''):
+                for digest in digests:
+                    digest.update(block)
+            if check_digest is not None and check_digest.hexdigest() != expected:
+                raise ValueError("文件校验失败")
+        os.fsync(f.fileno())
+
+    target_path = get_storage().local_path(meta['path'], meta['filename'])
+    try:
+        os.replace(data_path, target_path)
+    except OSError:
+        # 状态目录与目标不在同一文件系统
+        shutil.move(data_path, target_path)
+    shutil.rmtree(session_dir, ignore_errors=True)
+    invalidate_directory(meta['path'])
+    if content_digest is not None:
+        record_content_hash(meta['path'], meta['filename'], content_digest.hexdigest())
+
+    return {'filename': meta['filename'], 'size': size}
+
+
+def abort_upload_session(session_id):
+    """放弃上传会话并删除已上传的数据"""
+    session_dir = _session_dir(session_id)
+    shutil.rmtree(session_dir, ignore_errors=True)
+    return {'session_id': session_id}
+
+
+def cleanup_expired_sessions(force=False):
+    """清理长时间没有活动的会话，默认每个进程每CLEANUP_INTERVAL秒最多执行一次"""
+    global _last_cleanup
+    now = time.time()
+    with _cleanup_lock:
+        if not force and now - _last_cleanup < CLEANUP_INTERVAL:
+            return 0
+        _last_cleanup = now
+
+    sessions_root = _sessions_root()
+    ttl = _session_ttl()
+    removed = 0
+    try:
+        entries = list(os.scandir(sessions_root))
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        if not _SESSION_ID_RE.match(entry.name):
+            continue
+        try:
+            last_active = os.stat(os.path.join(entry.path, 'ranges.log')).st_mtime
+        except OSError:
+            last_active = entry.stat().st_mtime
+        if now - last_active > ttl:
+            shutil.rmtree(entry.path, ignore_errors=True)
+            removed += 1
+    return removed
@@ -0,0 +1,507 @@
+"""
+Prometheus指标
+
+/metrics以Prometheus文本格式输出：
+- gfinder_request_duration_seconds: 各视图生成响应的耗时直方图（不含流式响应体的发送时间）
+- gfinder_requests_total: 各视图按状态码统计的请求数
+- gfinder_transfer_bytes_total: 上传和下载的字节数
+- gfinder_transfers_in_flight: 进行中的上传和下载
+- gfinder_fs_call_duration_seconds: 文件系统操作（listdir/stat/copy/move/rmtree）耗时直方图
+- gfinder_listing_entries: 每次读取目录的条目数直方图
+- gfinder_cache_requests_total: 各缓存的命中和未命中次数
+
+记录时不加锁：每个线程写自己的字典（threading.local），只在抓取时合并，线程退出后其数据并入进程的汇总。
+
+多进程（start.py --serve production）时每个进程每GFINDER_METRICS_FLUSH_INTERVAL秒
+把自己的快照写入状态目录的metrics子目录（<pid>.json），抓取时合并全部进程的快照，
+请求落到任何一个工作进程返回的都是所有进程的总和。已退出进程的计数器和直方图并入archive.json继续累计，
+瞬时值（gauge）随进程一起丢弃。其他进程的数据最多滞后一个保存间隔。
+"""
+import os
+import json
+import time
+import uuid
+import atexit
+import weakref
+import logging
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# 已退出进程的累计值
+ARCHIVE_FILE = 'archive.json'
+# 无法用信号检查进程是否存在时（Windows），快照超过该秒数未更新视为进程已退出
+STALE_SNAPSHOT_SECONDS = 120
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+FS_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30, 120)
+ENTRY_BUCKETS = (0, 10, 100, 1000, 10000, 100000, 1000000)
+
+# 请求方法标签的取值，其他方法记为other，避免标签值无限增长
+_METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+
+def _merge(target, source, skip=()):
+    """把source的值累加到target：计数为数字，直方图为列表（各桶计数、总和、次数）"""
+    for key, value in list(source.items()):
+        if key[0] in skip:
+            continue
+        if isinstance(value, list):
+            current = target.get(key)
+            if current is None:
+                target[key] = list(value)
+            else:
+                for i, v in enumerate(value):
+                    current[i] += v
+        else:
+            target[key] = target.get(key, 0) + value
+
+
+def _dump(values):
+    return [[name, list(labels), value] for (name, labels), value in values.items()]
+
+
+def _load(records):
+    return {(name, tuple(labels)): value for name, labels, value in records}
+
+
+def _read_json(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"读取指标快照失败 {path}: {str(e)}")
+        return None
+
+
+def _write_json(path, data):
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _process_alive(pid, path):
+    if os.name == 'nt':
+        # Windows上os.kill(pid, 0)会发送CTRL_C_EVENT
+        try:
+            return os.path.getmtime(path) > time.time() - STALE_SNAPSHOT_SECONDS
+        except OSError:
+            return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+@contextmanager
+def _directory_lock(directory):
+    """合并和清理快照文件时的进程间互斥"""
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(directory, '.lock'), 'a') as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class Registry:
+    """进程内的指标注册表：定义全局共享，数值按线程分别保存"""
+
+    def __init__(self):
+        self.metrics = {}
+        self._reset()
+        if hasattr(os, 'register_at_fork'):
+            # 子进程不继承父进程已记录的数值，否则会被重复统计
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stores = {}
+        self._retired = {}
+        self._pid = os.getpid()
+        self._token = uuid.uuid4().hex
+        self._flusher = None
+        self._snapshot_dir = None
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"指标名称重复: {metric.name}")
+        self.metrics[metric.name] = metric
+
+    def values(self):
+        """当前线程的数值字典，只有当前线程写入"""
+        try:
+            return self._local.values
+        except AttributeError:
+            return self._new_store()
+
+    def _new_store(self):
+        values = {}
+        self._local.values = values
+        key = id(values)
+        with self._lock:
+            self._stores[key] = values
+        # 线程结束后把它的数值并入进程汇总
+        weakref.finalize(threading.current_thread(), self._retire, key)
+        self._start_flusher()
+        return values
+
+    def _retire(self, key):
+        with self._lock:
+            values = self._stores.pop(key, None)
+            if values is not None:
+                _merge(self._retired, values)
+
+    def snapshot(self):
+        """当前进程全部线程的数值之和"""
+        with self._lock:
+            stores = list(self._stores.values())
+            result = {}
+            _merge(result, self._retired)
+        for values in stores:
+            _merge(result, values)
+        return result
+
+    def _directory(self):
+        from .file_operations.file_utils import get_state_directory
+        self._snapshot_dir = get_state_directory('metrics')
+        return self._snapshot_dir
+
+    def _start_flusher(self):
+        if self._flusher is not None or not getattr(settings, 'GFINDER_METRICS', True):
+            return
+        with self._lock:
+            if self._flusher is not None:
+                return
+            interval = max(1, getattr(settings, 'GFINDER_METRICS_FLUSH_INTERVAL', 5))
+            self._flusher = threading.Thread(
+                target=self._flush_loop, args=(interval,), name='gfinder-metrics', daemon=True
+            )
+            self._flusher.start()
+
+    def _flush_loop(self, interval):
+        try:
+            # 先归档同一pid的旧进程遗留的快照
+            self.collect()
+        except OSError as e:
+            logger.warning(f"归档指标快照失败: {str(e)}")
+        atexit.register(self.flush)
+        while True:
+            time.sleep(interval)
+            self.flush()
+
+    def flush(self):
+        """把当前进程的快照写入状态目录"""
+        if self._snapshot_dir is None:
+            return
+        try:
+            _write_json(os.path.join(self._snapshot_dir, f'{self._pid}.json'), {
+                'pid': self._pid,
+                'token': self._token,
+                'values': _dump(self.snapshot()),
+            })
+        except FileNotFoundError:
+            # 状态目录已被删除（如测试用的临时目录），不重新创建
+            pass
+        except OSError as e:
+            logger.warning(f"保存指标快照失败: {str(e)}")
+
+    def collect(self):
+        """
+        合并所有进程的数值，同时把已退出进程的快照并入归档
+
+        Returns:
+            (数值字典, 参与汇总的进程数)
+        """
+        directory = self._directory()
+        archive_path = os.path.join(directory, ARCHIVE_FILE)
+        gauges = {name for name, metric in self.metrics.items() if metric.type == 'gauge'}
+        total = {}
+        processes = 1
+        with _directory_lock(directory):
+            archive = _load((_read_json(archive_path) or {}).get('values', []))
+            archived = False
+            for name in os.listdir(directory):
+                stem, ext = os.path.splitext(name)
+                if ext != '.json' or not stem.isdigit():
+                    continue
+                path = os.path.join(directory, name)
+                data = _read_json(path)
+                if data is None:
+                    continue
+                pid = int(stem)
+                if pid == self._pid:
+                    if data.get('token') == self._token:
+                        # 当前进程使用实时数值
+                        continue
+                elif _process_alive(pid, path):
+                    _merge(total, _load(data.get('values', [])))
+                    processes += 1
+                    continue
+                _merge(archive, _load(data.get('values', [])), skip=gauges)
+                os.remove(path)
+                archived = True
+            if archived:
+                _write_json(archive_path, {'values': _dump(archive)})
+        _merge(total, archive)
+        _merge(total, self.snapshot())
+        return total, processes
+
+    def render(self):
+        """Prometheus文本格式"""
+        values, processes = self.collect()
+        grouped = {}
+        for (name, labels), value in values.items():
+            grouped.setdefault(name, []).append((labels, value))
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for labels, value in sorted(grouped.get(metric.name, ()), key=lambda item: item[0]):
+                if len(labels) == len(metric.labelnames):
+                    metric.render(lines, labels, value)
+        lines.append('# HELP gfinder_metrics_processes 参与汇总的进程数')
+        lines.append('# TYPE gfinder_metrics_processes gauge')
+        lines.append(f'gfinder_metrics_processes {processes}')
+        return '\n'.join(lines) + '\n'
+
+
+_registry = Registry()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        if value == float('inf'):
+            return '+Inf'
+        return repr(value)
+    return str(value)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        _registry.register(self)
+
+    def render(self, lines, labels, value):
+        lines.append(f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}')
+
+
+class Counter(_Metric):
+    """只增不减的计数，标签值按labelnames的顺序传入"""
+    type = 'counter'
+
+    def inc(self, *labels, amount=1):
+        values = _registry.values()
+        key = (self.name, labels)
+        values[key] = values.get(key, 0) + amount
+
+
+class Gauge(Counter):
+    """可增可减的瞬时值；各线程分别记录增减，合并后得到当前值"""
+    type = 'gauge'
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+
+class _Timer:
+    __slots__ = ('_histogram', '_labels', '_start')
+
+    def __init__(self, histogram, labels):
+        self._histogram = histogram
+        self._labels = labels
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._histogram.observe(time.perf_counter() - self._start, *self._labels)
+
+
+class Histogram(_Metric):
+    """
+    直方图
+
+    每组标签保存为列表：各桶（含+Inf）的非累计计数，最后两项为总和和次数，输出时再转换为累计计数。
+    """
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(float(bucket) for bucket in buckets)
+
+    def observe(self, value, *labels):
+        values = _registry.values()
+        key = (self.name, labels)
+        data = values.get(key)
+        if data is None:
+            data = values[key] = [0] * (len(self.buckets) + 3)
+        data[bisect_left(self.buckets, value)] += 1
+        data[-2] += value
+        data[-1] += 1
+
+    def time(self, *labels):
+        """上下文管理器，记录代码块的耗时"""
+        return _Timer(self, labels)
+
+    def render(self, lines, labels, value):
+        if len(value) != len(self.buckets) + 3:
+            # 桶定义变化前的旧快照
+            return
+        cumulative = 0
+        for bucket, count in zip(self.buckets + (float('inf'),), value):
+            cumulative += count
+            label_text = _format_labels(self.labelnames, labels, ('le', _format_value(bucket)))
+            lines.append(f'{self.name}_bucket{label_text} {cumulative}')
+        label_text = _format_labels(self.labelnames, labels)
+        lines.append(f'{self.name}_sum{label_text} {_format_value(value[-2])}')
+        lines.append(f'{self.name}_count{label_text} {value[-1]}')
+
+
+REQUEST_DURATION = Histogram(
+    'gfinder_request_duration_seconds', '视图生成响应的耗时（秒）', ('view', 'method'), LATENCY_BUCKETS
+)
+REQUESTS = Counter('gfinder_requests_total', '请求数', ('view', 'method', 'status'))
+TRANSFER_BYTES = Counter('gfinder_transfer_bytes_total', '上传和下载的字节数', ('direction', 'kind'))
+TRANSFERS_IN_FLIGHT = Gauge('gfinder_transfers_in_flight', '进行中的上传和下载', ('direction',))
+FS_CALL_DURATION = Histogram(
+    'gfinder_fs_call_duration_seconds', '文件系统操作耗时（秒）', ('op',), FS_BUCKETS
+)
+LISTING_ENTRIES = Histogram('gfinder_listing_entries', '每次读取目录的条目数', (), ENTRY_BUCKETS)
+CACHE_REQUESTS = Counter('gfinder_cache_requests_total', '缓存查找次数', ('cache', 'result'))
+
+
+def fs_timer(op):
+    """记录文件系统操作耗时：with fs_timer('listdir'): ..."""
+    return _Timer(FS_CALL_DURATION, (op,))
+
+
+def cache_result(cache, hit):
+    CACHE_REQUESTS.inc(cache, 'hit' if hit else 'miss')
+
+
+@contextmanager
+def transfer_in_flight(direction):
+    """请求处理期间计入进行中的传输"""
+    TRANSFERS_IN_FLIGHT.inc(direction)
+    try:
+        yield
+    finally:
+        TRANSFERS_IN_FLIGHT.dec(direction)
+
+
+def _count_chunks(chunks, kind):
+    for chunk in chunks:
+        TRANSFER_BYTES.inc('download', kind, amount=len(chunk))
+        yield chunk
+
+
+def track_download(response, kind):
+    """
+    统计下载响应：响应关闭（发送完成或连接中断）前计入进行中的下载。
+
+    有Content-Length的响应在关闭时按其计入字节数（不替换FileResponse的文件对象，保留sendfile），
+    没有Content-Length的流式响应（打包下载）逐块计数。
+    """
+    if response.status_code not in (200, 206):
+        return response
+    TRANSFERS_IN_FLIGHT.inc('download')
+    length = response.get('Content-Length')
+    if length is None and response.streaming:
+        response.streaming_content = _count_chunks(response.streaming_content, kind)
+
+    def closed():
+        TRANSFERS_IN_FLIGHT.dec('download')
+        if length is not None:
+            TRANSFER_BYTES.inc('download', kind, amount=int(length))
+
+    response._resource_closers.append(closed)
+    return response
+
+
+def render():
+    return _registry.render()
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.url_name or getattr(match.func, '__name__', 'other')
+
+
+def _record_request(request, response, elapsed):
+    view = _view_name(request)
+    method = request.method if request.method in _METHODS else 'other'
+    REQUEST_DURATION.observe(elapsed, view, method)
+    REQUESTS.inc(view, method, str(response.status_code))
+
+
+class MetricsMiddleware:
+    """记录每个请求的视图耗时和状态码，同时支持同步和异步请求处理；应放在MIDDLEWARE的第一项"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'GFINDER_METRICS', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        start = time.perf_counter()
+        response = self.get_response(request)
+        _record_request(request, response, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        _record_request(request, response, time.perf_counter() - start)
+        return response
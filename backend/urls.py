@@ -1,14 +1,35 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+
+# ASGI下使用异步视图，阻塞的文件系统操作在线程池中执行
+if getattr(settings, 'GFINDER_ASYNC_VIEWS', False):
+    from . import async_views as views
+else:
+    from . import views
 
 urlpatterns = [
     path('api/list', views.list_dir, name='list_dir'),
+    path('api/search', views.search_files, name='search_files'),
+    path('api/biggest-folders', views.biggest_folders, name='biggest_folders'),
     path('api/operation', views.file_operations, name='file_operations'),
     path('api/upload', views.upload_file, name='upload_file'),
+    path('api/upload/instant', views.upload_instant, name='upload_instant'),
+    path('api/upload/session', views.upload_session_create, name='upload_session_create'),
+    path('api/upload/session/<str:session_id>', views.upload_session, name='upload_session'),
+    path('api/upload/session/<str:session_id>/commit', views.upload_session_commit, name='upload_session_commit'),
     path('api/download', views.download_file, name='download_file'),
+    path('api/archive', views.download_archive, name='download_archive'),
     path('api/preview', views.preview_file, name='preview_file'),
+    path('api/preview/window', views.preview_text_window, name='preview_text_window'),
+    path('api/thumbnail', views.get_thumbnail, name='get_thumbnail'),
+    path('api/thumbnails/prefetch', views.prefetch_thumbnails, name='prefetch_thumbnails'),
     path('api/save', views.save_file, name='save_file'),
     path('api/move', views.move_item, name='move_item'),
     path('api/copy', views.copy_item, name='copy_item'),
+    path('api/batch', views.batch_operations, name='batch_operations'),
+    path('api/jobs', views.list_jobs, name='list_jobs'),
+    path('api/jobs/<str:job_id>', views.job_status, name='job_status'),
+    path('api/jobs/<str:job_id>/cancel', views.cancel_job, name='cancel_job'),
     path('api/system-info', views.get_system_info, name='get_system_info'),
+    path('metrics', views.metrics, name='metrics'),
 ] 
\ No newline at end of file
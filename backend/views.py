@@ -1,43 +1,227 @@
-from django.http import JsonResponse, FileResponse, HttpResponse
+from django.http import JsonResponse, FileResponse, HttpResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
+from django.utils.http import parse_etags, http_date
+from django.utils.cache import get_conditional_response
 from django.conf import settings
+import io
 import os
 import json
-import shutil
+import stat
+import hashlib
 from .file_operations.file_utils import (
     list_directory,
+    list_directory_page,
+    iter_directory,
+    get_directory_listing,
+    invalidate_directory,
     create_directory,
     rename_item,
     delete_item,
+    move_entry,
+    copy_entry,
     get_file_content,
     save_file_content,
+    save_file_edits,
     create_file,
+    entry_exists,
+    check_transfer_paths,
     is_valid_path,
-    get_root_directory
+    is_valid_name,
+    LIST_PAGE_DEFAULT_LIMIT
 )
+from .file_operations.path_resolver import InvalidPathError
+from .file_operations.storage import get_storage
+from .file_operations.range_utils import (
+    CHUNK_SIZE,
+    FileSegment,
+    file_etag,
+    parse_range_header,
+    if_range_matches,
+    multipart_ranges
+)
+from .file_operations.upload_sessions import (
+    create_upload_session,
+    get_upload_status,
+    write_upload_chunk,
+    commit_upload_session,
+    abort_upload_session
+)
+from .file_operations.archive import ARCHIVE_FORMATS, archive_stream, archive_filename
+from .file_operations.jobs import get_job_manager
+from .file_operations.content_index import instant_upload, record_content_hash
+from .file_operations.batch import validate_operations, run_batch
+from .file_operations.thumbnails import (
+    get_thumbnail_service,
+    available as thumbnails_available,
+    THUMBNAIL_FORMATS,
+    IMAGE_EXTENSIONS,
+)
+from .file_operations.text_preview import read_window
+from .file_operations.file_edits import VersionConflictError, stream_version
+from .file_operations.content_type import detect_file_content_type, preview_kind
+from .file_operations.search_index import get_search_index, parse_time, SEARCH_DEFAULT_LIMIT, SEARCH_MAX_LIMIT
+from .metrics import TRANSFER_BYTES, CONTENT_TYPE as METRICS_CONTENT_TYPE, render as render_metrics, \
+    track_download, transfer_in_flight
 import logging
 from urllib.parse import quote
 
 logger = logging.getLogger(__name__)
 
+# 流式列目录时每个数据块包含的条目数
+NDJSON_BATCH_SIZE = 200
+
+def _etag_matches(request, etag):
+    """If-None-Match是否包含etag（弱比较：压缩后的响应带弱ETag）"""
+    etags = parse_etags(request.headers.get('If-None-Match', ''))
+    return '*' in etags or etag in (tag[2:] if tag.startswith('W/') else tag for tag in etags)
+
+def _ndjson_stream(items):
+    """将条目序列转换为NDJSON数据块"""
+    batch = []
+    for item in items:
+        batch.append(json.dumps(item, ensure_ascii=False))
+        if len(batch) >= NDJSON_BATCH_SIZE:
+            yield '\n'.join(batch) + '\n'
+            batch = []
+    if batch:
+        yield '\n'.join(batch) + '\n'
+
 @csrf_exempt
 def list_dir(request):
-    """列出目录内容"""
+    """
+    列出目录内容
+    
+    可选参数:
+        limit/cursor: 分页返回，响应中的next_cursor用于获取下一页
+        format=ndjson: 按磁盘顺序流式返回，每行一个条目
+        detect=1: mimetype按文件内容检测，而不是按扩展名猜测
+    """
     if request.method == 'GET':
         path = request.GET.get('path', '')
+        detect_types = request.GET.get('detect') == '1'
         
         if not is_valid_path(path):
             return JsonResponse({'error': '路径不合法'}, status=400)
             
         try:
-            items = list_directory(path)
-            return JsonResponse({'items': items})
+            if request.GET.get('format') == 'ndjson':
+                return StreamingHttpResponse(
+                    _ndjson_stream(iter_directory(path, detect_types)),
+                    content_type='application/x-ndjson; charset=utf-8'
+                )
+            
+            if 'limit' in request.GET or 'cursor' in request.GET:
+                limit = request.GET.get('limit') or LIST_PAGE_DEFAULT_LIMIT
+                page = list_directory_page(path, limit, request.GET.get('cursor'), detect_types)
+                return JsonResponse(page)
+            
+            items, etag = get_directory_listing(path, detect_types)
+            if _etag_matches(request, etag):
+                response = HttpResponse(status=304)
+            else:
+                response = JsonResponse({'items': items})
+            response['ETag'] = etag
+            response['Cache-Control'] = 'no-cache'
+            return response
+        except FileNotFoundError as e:
+            return JsonResponse({'error': str(e)}, status=404)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
         except Exception as e:
             logger.error(f"列出目录错误: {str(e)}")
             return JsonResponse({'error': str(e)}, status=500)
     
     return JsonResponse({'error': '不支持的请求方法'}, status=405)
 
+def search_files(request):
+    """
+    搜索文件和文件夹
+    
+    可选参数:
+        q: 文件名包含的子串（不区分大小写）
+        glob: 文件名通配符（区分大小写）
+        ext: 扩展名，多个用逗号分隔
+        type: file 或 dir
+        min_size/max_size: 文件大小范围（字节）
+        modified_after/modified_before: 修改时间范围（Unix时间戳或YYYY-MM-DD[ HH:MM:SS]）
+        path: 只在该目录下搜索
+        limit/cursor: 分页
+    """
+    if request.method == 'GET':
+        path = request.GET.get('path', '')
+        
+        if not is_valid_path(path):
+            return JsonResponse({'error': '路径不合法'}, status=400)
+        
+        try:
+            index = get_search_index()
+            if index is None:
+                return JsonResponse({'error': '搜索功能未启用'}, status=503)
+            
+            params = request.GET
+            limit = min(int(params.get('limit') or SEARCH_DEFAULT_LIMIT), SEARCH_MAX_LIMIT)
+            if limit <= 0:
+                raise ValueError("limit必须大于0")
+            extensions = [ext for ext in params.get('ext', '').split(',') if ext.strip()]
+            result = index.search(
+                query=params.get('q', '').strip(),
+                glob=params.get('glob') or None,
+                extensions=[ext.strip() for ext in extensions],
+                kind=params.get('type'),
+                min_size=int(params['min_size']) if params.get('min_size') else None,
+                max_size=int(params['max_size']) if params.get('max_size') else None,
+                modified_after=parse_time(params['modified_after']) if params.get('modified_after') else None,
+                modified_before=parse_time(params['modified_before']) if params.get('modified_before') else None,
+                scope=path,
+                limit=limit,
+                cursor=params.get('cursor'),
+            )
+            # 首次遍历完成前结果可能不完整
+            result['ready'] = index.is_ready()
+            return JsonResponse(result)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        except Exception as e:
+            logger.error(f"搜索文件错误: {str(e)}")
+            return JsonResponse({'error': str(e)}, status=500)
+    
+    return JsonResponse({'error': '不支持的请求方法'}, status=405)
+
+def biggest_folders(request):
+    """
+    列出最大的文件夹（递归大小，来自搜索索引的汇总）
+    
+    可选参数:
+        path: 只统计该目录下的文件夹
+        limit: 返回的条目数，默认20
+    """
+    if request.method == 'GET':
+        path = request.GET.get('path', '')
+        
+        if not is_valid_path(path):
+            return JsonResponse({'error': '路径不合法'}, status=400)
+        
+        try:
+            index = get_search_index()
+            if index is None:
+                return JsonResponse({'error': '搜索功能未启用'}, status=503)
+            
+            limit = min(int(request.GET.get('limit') or 20), SEARCH_MAX_LIMIT)
+            if limit <= 0:
+                raise ValueError("limit必须大于0")
+            return JsonResponse({
+                'items': index.biggest_folders(path, limit),
+                # 首次遍历完成前文件夹大小尚未汇总
+                'ready': index.is_ready(),
+            })
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        except Exception as e:
+            logger.error(f"统计文件夹大小错误: {str(e)}")
+            return JsonResponse({'error': str(e)}, status=500)
+    
+    return JsonResponse({'error': '不支持的请求方法'}, status=405)
+
 @csrf_exempt
 def file_operations(request):
     """处理文件操作"""
@@ -63,6 +247,11 @@ def file_operations(request):
                 
             elif operation == 'delete':
                 name = data.get('name', '')
+                if data.get('background'):
+                    if not is_valid_name(name) or not entry_exists(path, name):
+                        return JsonResponse({'error': f"文件或目录不存在: {name}"}, status=404)
+                    job = get_job_manager().submit('delete', {'path': path, 'name': name})
+                    return JsonResponse({'success': True, 'job': job}, status=202)
                 result = delete_item(path, name)
                 return JsonResponse({'success': True, 'result': result})
                 
@@ -75,6 +264,8 @@ def file_operations(request):
             else:
                 return JsonResponse({'error': '不支持的操作'}, status=400)
                 
+        except (InvalidPathError, io.UnsupportedOperation) as e:
+            return JsonResponse({'error': str(e)}, status=400)
         except Exception as e:
             logger.error(f"文件操作错误: {str(e)}")
             return JsonResponse({'error': str(e)}, status=500)
@@ -85,27 +276,248 @@ def file_operations(request):
 def upload_file(request):
     """处理文件上传"""
     if request.method == 'POST':
-        path = request.POST.get('path', '')
+        # 接收和解析请求体期间计入进行中的上传
+        with transfer_in_flight('upload'):
+            return _save_uploaded_file(request)
+    
+    return JsonResponse({'error': '不支持的请求方法'}, status=405)
+
+def _save_uploaded_file(request):
+    path = request.POST.get('path', '')
+    
+    if not is_valid_path(path):
+        return JsonResponse({'error': '路径不合法'}, status=400)
+        
+    uploaded_file = request.FILES.get('file')
+    if not uploaded_file:
+        return JsonResponse({'error': '没有文件上传'}, status=400)
+        
+    try:
+        # 边写入边计算SHA-256，供秒传查找相同内容
+        digest = hashlib.sha256()
+        with get_storage().open(path, uploaded_file.name, 'wb') as destination:
+            for chunk in uploaded_file.chunks():
+                destination.write(chunk)
+                digest.update(chunk)
+        TRANSFER_BYTES.inc('upload', 'file', amount=uploaded_file.size)
+        invalidate_directory(path)
+        record_content_hash(path, uploaded_file.name, digest.hexdigest())
+                
+        return JsonResponse({'success': True, 'filename': uploaded_file.name})
+    except InvalidPathError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except Exception as e:
+        logger.error(f"上传文件错误: {str(e)}")
+        return JsonResponse({'error': str(e)}, status=500)
+
+def _set_attachment_filename(response, filename):
+    """设置附件下载的文件名"""
+    # 使用三种方式处理文件名，兼容不同浏览器
+    # 1. 使用RFC 5987规范 (现代浏览器)
+    encoded_filename_utf8 = quote(filename)
+    # 2. ASCII编码名称 (旧浏览器)
+    ascii_filename = filename.encode('ascii', 'replace').decode('ascii')
+    # 3. 使用UTF-8编码参数
+    response['Content-Disposition'] = f'attachment; filename="{ascii_filename}"; filename*=UTF-8\'\'{encoded_filename_utf8}'
+
+def _set_download_headers(response, filename, stat_info):
+    """设置下载响应的文件名、缓存校验和断点续传相关头"""
+    _set_attachment_filename(response, filename)
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = file_etag(stat_info)
+    response['Last-Modified'] = http_date(stat_info.st_mtime)
+
+def _offload_response(file_path, content_type):
+    """
+    构造交给前端代理发送文件内容的响应
+    
+    x-accel-redirect: Nginx内部跳转，需配置internal的location指向数据根目录
+    x-sendfile: Apache mod_xsendfile / lighttpd
+    Range和缓存校验由代理处理，Python进程不再读取文件内容。
+    """
+    mode = getattr(settings, 'GFINDER_DOWNLOAD_OFFLOAD', None)
+    response = HttpResponse(content_type=content_type)
+    if mode == 'x-accel-redirect':
+        prefix = getattr(settings, 'GFINDER_DOWNLOAD_OFFLOAD_PREFIX', '/protected/')
+        relative_path = os.path.relpath(file_path, get_storage().root_dir).replace(os.sep, '/')
+        response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(relative_path)
+    elif mode == 'x-sendfile':
+        response['X-Sendfile'] = file_path
+    else:
+        raise ValueError(f"不支持的下载卸载模式: {mode}")
+    return response
+
+def _file_download_response(request, file_obj, filename, stat_info):
+    """
+    构造文件下载响应
+    
+    支持If-None-Match/If-Modified-Since条件请求(304)、
+    Range单段(206)和多段(multipart/byteranges)请求，以及If-Range。
+    完整文件和单段范围以FileResponse返回，支持sendfile的服务器可零拷贝发送；
+    配置了GFINDER_DOWNLOAD_OFFLOAD时交给前端代理发送。
+    file_obj为存储后端打开的文件（name属性为完整路径），stat_info为其stat信息。
+    """
+    file_path = file_obj.name
+    try:
+        size = stat_info.st_size
+        etag = file_etag(stat_info)
+        
+        conditional = get_conditional_response(
+            request, etag=etag, last_modified=int(stat_info.st_mtime)
+        )
+        if conditional is not None:
+            file_obj.close()
+            _set_download_headers(conditional, filename, stat_info)
+            return conditional
+        
+        # 按内容检测MIME类型（结果按inode和修改时间缓存），默认使用二进制流类型
+        content_type = detect_file_content_type(file_obj, filename, stat_info) or 'application/octet-stream'
+        
+        # 前端代理按路径读取文件，只适用于单个本地目录
+        if getattr(settings, 'GFINDER_DOWNLOAD_OFFLOAD', None) and get_storage().root_dir is not None:
+            file_obj.close()
+            response = _offload_response(file_path, content_type)
+            _set_download_headers(response, filename, stat_info)
+            return response
+        
+        ranges = None
+        if if_range_matches(request.headers.get('If-Range'), etag, stat_info.st_mtime):
+            ranges = parse_range_header(request.headers.get('Range'), size)
+        
+        if ranges is None:
+            # 基本的文件下载实现
+            response = FileResponse(file_obj, content_type=content_type)
+            response.block_size = CHUNK_SIZE
+        elif not ranges:
+            file_obj.close()
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+        elif len(ranges) == 1:
+            start, end = ranges[0]
+            response = FileResponse(
+                FileSegment(file_obj, start, end - start + 1), status=206, content_type=content_type
+            )
+            response.block_size = CHUNK_SIZE
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+            response['Content-Length'] = str(end - start + 1)
+        else:
+            body, boundary = multipart_ranges(file_obj, ranges, size, content_type)
+            response = StreamingHttpResponse(
+                body, status=206, content_type=f'multipart/byteranges; boundary={boundary}'
+            )
+            response['Content-Length'] = str(body.content_length)
+    except Exception:
+        file_obj.close()
+        raise
+    
+    _set_download_headers(response, filename, stat_info)
+    return response
+
+@csrf_exempt
+def upload_instant(request):
+    """
+    秒传
+    
+    请求体: {"path", "filename", "size", "sha256"}
+    服务器上已有相同内容的文件时直接创建目标文件并返回instant: true，
+    否则返回instant: false，客户端需要正常上传。
+    """
+    if request.method == 'POST':
+        data = json.loads(request.body)
+        path = data.get('path', '')
         
         if not is_valid_path(path):
             return JsonResponse({'error': '路径不合法'}, status=400)
-            
-        uploaded_file = request.FILES.get('file')
-        if not uploaded_file:
-            return JsonResponse({'error': '没有文件上传'}, status=400)
-            
+        
         try:
-            root_dir = get_root_directory()
-            full_path = os.path.join(root_dir, path.strip('/'))
-            file_path = os.path.join(full_path, uploaded_file.name)
-            
-            with open(file_path, 'wb+') as destination:
-                for chunk in uploaded_file.chunks():
-                    destination.write(chunk)
-                    
-            return JsonResponse({'success': True, 'filename': uploaded_file.name})
+            result = instant_upload(path, data.get('filename', ''), data.get('size', -1), data.get('sha256'))
+            if result['instant']:
+                # 秒传省去的上传字节数
+                TRANSFER_BYTES.inc('upload', 'instant', amount=result['size'])
+            return JsonResponse({'success': True, 'result': result})
+        except FileNotFoundError as e:
+            return JsonResponse({'error': str(e)}, status=404)
+        except (ValueError, TypeError) as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        except Exception as e:
+            logger.error(f"秒传错误: {str(e)}")
+            return JsonResponse({'error': str(e)}, status=500)
+    
+    return JsonResponse({'error': '不支持的请求方法'}, status=405)
+
+@csrf_exempt
+def upload_session_create(request):
+    """创建分块上传会话"""
+    if request.method == 'POST':
+        data = json.loads(request.body)
+        path = data.get('path', '')
+        
+        if not is_valid_path(path):
+            return JsonResponse({'error': '路径不合法'}, status=400)
+        
+        try:
+            result = create_upload_session(
+                path, data.get('filename', ''), data.get('size', -1), data.get('checksum')
+            )
+            return JsonResponse({'success': True, 'result': result})
+        except FileNotFoundError as e:
+            return JsonResponse({'error': str(e)}, status=404)
+        except (ValueError, TypeError) as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        except Exception as e:
+            logger.error(f"创建上传会话错误: {str(e)}")
+            return JsonResponse({'error': str(e)}, status=500)
+    
+    return JsonResponse({'error': '不支持的请求方法'}, status=405)
+
+@csrf_exempt
+def upload_session(request, session_id):
+    """
+    分块上传会话
+    
+    GET: 查询已接收的字节范围
+    PUT: 上传分块，请求体为原始数据，offset参数为分块在文件中的偏移量
+    DELETE: 放弃上传
+    """
+    try:
+        if request.method == 'GET':
+            return JsonResponse(get_upload_status(session_id))
+        
+        elif request.method == 'PUT':
+            length = request.headers.get('Content-Length')
+            if length is None:
+                return JsonResponse({'error': '缺少Content-Length'}, status=411)
+            with transfer_in_flight('upload'):
+                written = write_upload_chunk(session_id, request.GET.get('offset', 0), request, length)
+            TRANSFER_BYTES.inc('upload', 'chunk', amount=written)
+            return JsonResponse({'success': True, 'written': written})
+        
+        elif request.method == 'DELETE':
+            result = abort_upload_session(session_id)
+            return JsonResponse({'success': True, 'result': result})
+    except FileNotFoundError as e:
+        return JsonResponse({'error': str(e)}, status=404)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except Exception as e:
+        logger.error(f"上传分块错误: {str(e)}")
+        return JsonResponse({'error': str(e)}, status=500)
+    
+    return JsonResponse({'error': '不支持的请求方法'}, status=405)
+
+@csrf_exempt
+def upload_session_commit(request, session_id):
+    """完成分块上传"""
+    if request.method == 'POST':
+        try:
+            result = commit_upload_session(session_id)
+            return JsonResponse({'success': True, 'result': result})
+        except FileNotFoundError as e:
+            return JsonResponse({'error': str(e)}, status=404)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
         except Exception as e:
-            logger.error(f"上传文件错误: {str(e)}")
+            logger.error(f"提交上传会话错误: {str(e)}")
             return JsonResponse({'error': str(e)}, status=500)
     
     return JsonResponse({'error': '不支持的请求方法'}, status=405)
@@ -127,42 +539,67 @@ def download_file(request):
                 return JsonResponse({'error': '文件名不能为空'}, status=400)
                 
             # 单独验证路径和文件名
-            if not is_valid_path(path) or (filename and '../' in filename):
+            if not is_valid_path(path) or not is_valid_name(filename):
                 return JsonResponse({'error': '路径不合法'}, status=400)
-                
-            root_dir = get_root_directory()
-            file_path = os.path.join(root_dir, path, filename)
             
-            if os.path.exists(file_path) and os.path.isfile(file_path):
-                # 基本的文件下载实现
-                response = FileResponse(open(file_path, 'rb'))
-                
-                # 使用三种方式处理文件名，兼容不同浏览器
-                # 1. 使用RFC 5987规范 (现代浏览器)
-                encoded_filename_utf8 = quote(filename)
-                # 2. ASCII编码名称 (旧浏览器)
-                ascii_filename = filename.encode('ascii', 'replace').decode('ascii')
-                # 3. 使用UTF-8编码参数
-                response['Content-Disposition'] = f'attachment; filename="{ascii_filename}"; filename*=UTF-8\'\'{encoded_filename_utf8}'
-                
-                # 设置正确的MIME类型
-                import mimetypes
-                content_type, _ = mimetypes.guess_type(file_path)
-                if content_type:
-                    response['Content-Type'] = content_type
-                else:
-                    # 默认使用二进制流类型
-                    response['Content-Type'] = 'application/octet-stream'
-                
-                return response
-            else:
+            # 本地存储相对根目录的fd打开，符号链接不能指向根目录以外
+            storage = get_storage()
+            try:
+                file_obj = storage.open(path, filename)
+            except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
                 return JsonResponse({'error': '文件不存在'}, status=404)
+            stat_info = storage.fstat(file_obj)
+            if not stat.S_ISREG(stat_info.st_mode):
+                file_obj.close()
+                return JsonResponse({'error': '文件不存在'}, status=404)
+            return track_download(_file_download_response(request, file_obj, filename, stat_info), 'file')
+        except InvalidPathError as e:
+            return JsonResponse({'error': str(e)}, status=400)
         except Exception as e:
             logger.error(f"下载文件错误: {str(e)}")
             return JsonResponse({'error': str(e)}, status=500)
     
     return JsonResponse({'error': '不支持的请求方法'}, status=405)
 
+@csrf_exempt
+def download_archive(request):
+    """
+    打包下载多个文件或文件夹
+    
+    GET参数或POST JSON:
+        path: 条目所在目录
+        names: 条目名称列表（GET时可重复传递names参数）
+        format: zip（默认）、tar或tgz
+        compression: ZIP的压缩方式，deflate（默认）或store
+    """
+    if request.method in ('GET', 'POST'):
+        if request.method == 'GET':
+            data = request.GET
+            names = request.GET.getlist('names')
+        else:
+            data = json.loads(request.body)
+            names = data.get('names', [])
+        path = data.get('path', '')
+        archive_format = data.get('format', 'zip')
+        
+        if not is_valid_path(path):
+            return JsonResponse({'error': '路径不合法'}, status=400)
+        
+        try:
+            stream = archive_stream(path, names, archive_format, data.get('compression', 'deflate'))
+            response = StreamingHttpResponse(stream, content_type=ARCHIVE_FORMATS[archive_format][1])
+            _set_attachment_filename(response, archive_filename(path, names, archive_format))
+            return track_download(response, 'archive')
+        except FileNotFoundError as e:
+            return JsonResponse({'error': str(e)}, status=404)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        except Exception as e:
+            logger.error(f"打包下载错误: {str(e)}")
+            return JsonResponse({'error': str(e)}, status=500)
+    
+    return JsonResponse({'error': '不支持的请求方法'}, status=405)
+
 @csrf_exempt
 def preview_file(request):
     """预览文件内容"""
@@ -170,43 +607,196 @@ def preview_file(request):
         path = request.GET.get('path', '')
         filename = request.GET.get('filename', '')
         
-        if not filename or not is_valid_path(os.path.join(path.strip('/'), filename)):
+        if not is_valid_name(filename) or not is_valid_path(path):
             return JsonResponse({'error': '路径不合法'}, status=400)
             
         try:
-            content = get_file_content(path, filename)
-            file_ext = os.path.splitext(filename)[1].lower()
+            storage = get_storage()
+            try:
+                f = storage.open(path, filename, 'rb')
+            except (FileNotFoundError, NotADirectoryError, IsADirectoryError):
+                return JsonResponse({'error': '文件不存在'}, status=404)
+            with f:
+                stat_info = storage.fstat(f)
+                if not stat.S_ISREG(stat_info.st_mode):
+                    return JsonResponse({'error': '文件不存在'}, status=404)
+                # 按内容检测类型，没有扩展名的文本文件也可以预览
+                mimetype = detect_file_content_type(f, filename, stat_info)
+                kind = preview_kind(mimetype)
+                # 先取版本再读内容：读取期间文件被修改时，基于旧版本的保存会被拒绝
+                version = stream_version(f, stat_info) if kind == 'text' else None
             
-            # 处理不同类型的文件
-            if file_ext in ['.txt', '.md', '.py', '.js', '.html', '.css', '.json', '.xml', '.yaml', '.yml']:
-                return JsonResponse({'content': content, 'type': 'text'})
-            elif file_ext in ['.jpg', '.jpeg', '.png', '.gif', '.bmp']:
-                return JsonResponse({'type': 'image'})
-            elif file_ext == '.pdf':
-                return JsonResponse({'type': 'pdf'})
+            if kind == 'text':
+                content = get_file_content(path, filename)
+                return JsonResponse({
+                    'content': content,
+                    'type': 'text',
+                    'mimetype': mimetype,
+                    # 保存时作为base_version，用于增量保存和检测并发修改
+                    'version': version,
+                })
+            elif kind in ('image', 'pdf'):
+                return JsonResponse({'type': kind, 'mimetype': mimetype})
             else:
                 return JsonResponse({'error': '不支持的文件类型预览'}, status=400)
+        except ValueError as e:
+            # 路径不合法或存储后端不支持预览
+            return JsonResponse({'error': str(e)}, status=400)
         except Exception as e:
             logger.error(f"预览文件错误: {str(e)}")
             return JsonResponse({'error': str(e)}, status=500)
     
     return JsonResponse({'error': '不支持的请求方法'}, status=405)
 
+def preview_text_window(request):
+    """
+    分段预览大文本文件
+    
+    参数（二选一）:
+        line/lines: 起始行号（从1开始，负数表示倒数第几行）和行数
+        offset/length: 起始字节偏移和字节数
+    """
+    if request.method == 'GET':
+        path = request.GET.get('path', '')
+        filename = request.GET.get('filename', '')
+        
+        params = {}
+        try:
+            for name in ('offset', 'length', 'line', 'lines'):
+                value = request.GET.get(name)
+                if value not in (None, ''):
+                    params[name] = int(value)
+        except ValueError:
+            return JsonResponse({'error': f'{name}必须是整数'}, status=400)
+        if 'line' not in params and 'offset' not in params:
+            params['line'] = 1
+        
+        try:
+            return JsonResponse(read_window(path, filename, **params))
+        except FileNotFoundError:
+            return JsonResponse({'error': '文件不存在'}, status=404)
+        except IsADirectoryError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        except Exception as e:
+            logger.error(f"分段预览文件错误: {str(e)}")
+            return JsonResponse({'error': str(e)}, status=500)
+    
+    return JsonResponse({'error': '不支持的请求方法'}, status=405)
+
+def get_thumbnail(request):
+    """
+    获取图片缩略图
+    
+    参数:
+        path/filename: 图片位置
+        size: small(128) / medium(256) / large(1024)，默认medium
+        format: webp / jpeg，默认webp
+    """
+    if request.method == 'GET':
+        path = request.GET.get('path', '')
+        filename = request.GET.get('filename', '')
+        
+        if not thumbnails_available():
+            return JsonResponse({'error': '服务器未安装Pillow，无法生成缩略图'}, status=501)
+        
+        try:
+            target, key = get_thumbnail_service().get(
+                path, filename,
+                request.GET.get('size', 'medium'),
+                request.GET.get('format', 'webp'),
+            )
+            etag = f'"{key}"'
+            if _etag_matches(request, etag):
+                response = HttpResponse(status=304)
+            else:
+                content_type = THUMBNAIL_FORMATS[request.GET.get('format', 'webp')][1]
+                response = FileResponse(open(target, 'rb'), content_type=content_type)
+            response['ETag'] = etag
+            # 原图修改后缓存键改变，浏览器按ETag重新验证
+            response['Cache-Control'] = 'private, no-cache'
+            return response
+        except FileNotFoundError:
+            return JsonResponse({'error': '文件不存在'}, status=404)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        except Exception as e:
+            logger.error(f"生成缩略图错误: {str(e)}")
+            return JsonResponse({'error': f'无法生成缩略图: {str(e)}'}, status=500)
+    
+    return JsonResponse({'error': '不支持的请求方法'}, status=405)
+
+@csrf_exempt
+def prefetch_thumbnails(request):
+    """
+    在后台为目录中的图片批量生成缩略图
+    
+    请求体: {"path": 目录, "names": 可选的文件名列表（默认为目录中的所有图片）, "size": 尺寸, "format": 格式}
+    """
+    if request.method == 'POST':
+        data = json.loads(request.body)
+        path = data.get('path', '')
+        
+        if not is_valid_path(path):
+            return JsonResponse({'error': '路径不合法'}, status=400)
+        
+        if not thumbnails_available():
+            return JsonResponse({'error': '服务器未安装Pillow，无法生成缩略图'}, status=501)
+        
+        try:
+            names = data.get('names')
+            if names is None:
+                names = [
+                    item['name'] for item in list_directory(path)
+                    if not item['is_dir'] and os.path.splitext(item['name'])[1].lower() in IMAGE_EXTENSIONS
+                ]
+            names = names[:getattr(settings, 'GFINDER_THUMBNAIL_PREFETCH_MAX', 1000)]
+            result = get_thumbnail_service().prefetch(
+                path, names, data.get('size', 'medium'), data.get('format', 'webp')
+            )
+            return JsonResponse({'success': True, **result})
+        except FileNotFoundError as e:
+            return JsonResponse({'error': str(e)}, status=404)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        except Exception as e:
+            logger.error(f"预生成缩略图错误: {str(e)}")
+            return JsonResponse({'error': str(e)}, status=500)
+    
+    return JsonResponse({'error': '不支持的请求方法'}, status=405)
+
 @csrf_exempt
 def save_file(request):
-    """保存文件内容"""
+    """
+    保存文件内容
+    
+    完整保存: {"path", "filename", "content", "base_version"(可选)}
+    增量保存: {"path", "filename", "edits": [...], "base_version"}，edits的格式见file_edits模块
+    文件先写入临时文件再重命名覆盖；base_version与当前版本不一致时返回409和current_version。
+    返回的result.version为保存后的版本，用作下一次增量保存的base_version。
+    """
     if request.method == 'POST':
         data = json.loads(request.body)
         path = data.get('path', '')
         filename = data.get('filename', '')
-        content = data.get('content', '')
+        base_version = data.get('base_version') or None
         
         if not path or not filename or not is_valid_path(os.path.join(path, filename)):
             return JsonResponse({'error': '路径不合法'}, status=400)
             
         try:
-            result = save_file_content(path, filename, content)
+            if 'edits' in data:
+                result = save_file_edits(path, filename, data['edits'], base_version)
+            else:
+                result = save_file_content(path, filename, data.get('content', ''), base_version)
             return JsonResponse({'success': True, 'result': result})
+        except VersionConflictError as e:
+            return JsonResponse({'error': str(e), 'current_version': e.current_version}, status=409)
+        except FileNotFoundError as e:
+            return JsonResponse({'error': str(e)}, status=404)
+        except (ValueError, IsADirectoryError) as e:
+            return JsonResponse({'error': str(e)}, status=400)
         except Exception as e:
             logger.error(f"保存文件错误: {str(e)}")
             return JsonResponse({'error': str(e)}, status=500)
@@ -226,18 +816,19 @@ def move_item(request):
             return JsonResponse({'error': '路径不合法'}, status=400)
             
         try:
-            root_dir = get_root_directory()
-            source_full_path = os.path.join(root_dir, source_path.strip('/'), source_name)
-            target_full_path = os.path.join(root_dir, target_path.strip('/'), source_name)
-            
-            if not os.path.exists(source_full_path):
-                return JsonResponse({'error': '源文件或文件夹不存在'}, status=404)
-                
-            if os.path.exists(target_full_path):
-                return JsonResponse({'error': '目标位置已存在同名文件或文件夹'}, status=400)
+            if data.get('background'):
+                check_transfer_paths(source_path, source_name, target_path)
+                job = get_job_manager().submit('move', {
+                    'source_path': source_path, 'source_name': source_name, 'target_path': target_path
+                })
+                return JsonResponse({'success': True, 'job': job}, status=202)
                 
-            shutil.move(source_full_path, target_full_path)
+            move_entry(source_path, source_name, target_path)
             return JsonResponse({'success': True})
+        except FileNotFoundError as e:
+            return JsonResponse({'error': str(e)}, status=404)
+        except (FileExistsError, InvalidPathError, io.UnsupportedOperation) as e:
+            return JsonResponse({'error': str(e)}, status=400)
         except Exception as e:
             logger.error(f"移动文件错误: {str(e)}")
             return JsonResponse({'error': str(e)}, status=500)
@@ -257,28 +848,98 @@ def copy_item(request):
             return JsonResponse({'error': '路径不合法'}, status=400)
             
         try:
-            root_dir = get_root_directory()
-            source_full_path = os.path.join(root_dir, source_path.strip('/'), source_name)
-            target_full_path = os.path.join(root_dir, target_path.strip('/'), source_name)
-            
-            if not os.path.exists(source_full_path):
-                return JsonResponse({'error': '源文件或文件夹不存在'}, status=404)
-                
-            if os.path.exists(target_full_path):
-                return JsonResponse({'error': '目标位置已存在同名文件或文件夹'}, status=400)
-                
-            if os.path.isdir(source_full_path):
-                shutil.copytree(source_full_path, target_full_path)
-            else:
-                shutil.copy2(source_full_path, target_full_path)
+            if data.get('background'):
+                check_transfer_paths(source_path, source_name, target_path)
+                job = get_job_manager().submit('copy', {
+                    'source_path': source_path, 'source_name': source_name, 'target_path': target_path
+                })
+                return JsonResponse({'success': True, 'job': job}, status=202)
                 
+            copy_entry(source_path, source_name, target_path)
             return JsonResponse({'success': True})
+        except FileNotFoundError as e:
+            return JsonResponse({'error': str(e)}, status=404)
+        except (FileExistsError, InvalidPathError, io.UnsupportedOperation) as e:
+            return JsonResponse({'error': str(e)}, status=400)
         except Exception as e:
             logger.error(f"复制文件错误: {str(e)}")
             return JsonResponse({'error': str(e)}, status=500)
     
     return JsonResponse({'error': '不支持的请求方法'}, status=405)
 
+@csrf_exempt
+def batch_operations(request):
+    """
+    批量执行文件操作
+    
+    请求体: {"operations": [{"operation": "delete", "path": ..., "name": ...}, ...]}
+    operation可以是delete、move、copy、rename、create_directory、create_file，
+    参数与单个操作的接口相同；delete/move/copy可以带background转为后台任务。
+    任一操作不合法时整批拒绝(400)，否则返回每个操作的结果。
+    """
+    if request.method == 'POST':
+        try:
+            data = json.loads(request.body)
+            operations = data.get('operations') if isinstance(data, dict) else None
+            operations, touched, errors = validate_operations(operations)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        if errors:
+            return JsonResponse({'error': f'{len(errors)}个操作不合法', 'invalid': errors}, status=400)
+        
+        try:
+            results = run_batch(operations, touched)
+            failed = sum(1 for result in results if not result['success'])
+            return JsonResponse({
+                'success': failed == 0,
+                'succeeded': len(results) - failed,
+                'failed': failed,
+                'results': results,
+            })
+        except Exception as e:
+            logger.error(f"批量操作错误: {str(e)}")
+            return JsonResponse({'error': str(e)}, status=500)
+    
+    return JsonResponse({'error': '不支持的请求方法'}, status=405)
+
+def list_jobs(request):
+    """列出最近的后台任务"""
+    if request.method == 'GET':
+        try:
+            return JsonResponse({'jobs': get_job_manager().list()})
+        except Exception as e:
+            logger.error(f"列出后台任务错误: {str(e)}")
+            return JsonResponse({'error': str(e)}, status=500)
+    
+    return JsonResponse({'error': '不支持的请求方法'}, status=405)
+
+def job_status(request, job_id):
+    """查询后台任务的进度、速度和预计剩余时间"""
+    if request.method == 'GET':
+        try:
+            return JsonResponse(get_job_manager().get(job_id))
+        except FileNotFoundError as e:
+            return JsonResponse({'error': str(e)}, status=404)
+        except Exception as e:
+            logger.error(f"查询后台任务错误: {str(e)}")
+            return JsonResponse({'error': str(e)}, status=500)
+    
+    return JsonResponse({'error': '不支持的请求方法'}, status=405)
+
+@csrf_exempt
+def cancel_job(request, job_id):
+    """取消后台任务"""
+    if request.method == 'POST':
+        try:
+            return JsonResponse({'success': True, 'job': get_job_manager().cancel(job_id)})
+        except FileNotFoundError as e:
+            return JsonResponse({'error': str(e)}, status=404)
+        except Exception as e:
+            logger.error(f"取消后台任务错误: {str(e)}")
+            return JsonResponse({'error': str(e)}, status=500)
+    
+    return JsonResponse({'error': '不支持的请求方法'}, status=405)
+
 def get_system_info(request):
     """获取系统信息"""
     if request.method == 'GET':
@@ -286,11 +947,26 @@ def get_system_info(request):
             import platform
             system_info = {
                 'os': platform.system(),
-                'root_dir': get_root_directory()
+                # 没有单一本地根目录的存储后端（内存、多卷）为null
+                'root_dir': get_storage().root_dir,
+                'storage': getattr(settings, 'GFINDER_STORAGE_BACKEND', 'local'),
             }
             return JsonResponse(system_info)
         except Exception as e:
             logger.error(f"获取系统信息错误: {str(e)}")
             return JsonResponse({'error': str(e)}, status=500)
     
-    return JsonResponse({'error': '不支持的请求方法'}, status=405) 
\ No newline at end of file
+    return JsonResponse({'error': '不支持的请求方法'}, status=405)
+
+def metrics(request):
+    """Prometheus指标（所有工作进程的总和）"""
+    if request.method == 'GET':
+        if not getattr(settings, 'GFINDER_METRICS', True):
+            return JsonResponse({'error': '指标未启用'}, status=404)
+        try:
+            return HttpResponse(render_metrics(), content_type=METRICS_CONTENT_TYPE)
+        except Exception as e:
+            logger.error(f"获取指标错误: {str(e)}")
+            return JsonResponse({'error': str(e)}, status=500)
+    
+    return JsonResponse({'error': '不支持的请求方法'}, status=405)
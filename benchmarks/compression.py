@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+"""
+响应压缩基准测试
+
+对比gzip、brotli、zstd在不同级别下压缩典型响应的压缩率和CPU耗时，结果以JSON输出：
+- listing: 一次返回的大目录列表JSON
+- ndjson: 流式列目录，每块后刷新压缩器（与CompressionMiddleware的流式压缩一致）
+- preview: 日志文件的文本预览JSON
+
+未安装Brotli或zstandard时跳过对应的编码。
+
+用法:
+    python benchmarks/compression.py --entries 100000 --levels gzip=1,5,9 br=1,4,11 zstd=1,3,9
+"""
+import os
+import sys
+import json
+import time
+import random
+import datetime
+import argparse
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gfinder.settings')
+
+from backend import compression  # noqa: E402
+from backend.views import NDJSON_BATCH_SIZE  # noqa: E402
+
+EXTENSIONS = [
+    ('.txt', 'text/plain'), ('.jpg', 'image/jpeg'), ('.py', 'text/x-python'),
+    ('.pdf', 'application/pdf'), ('.json', 'application/json'), ('.zip', 'application/zip'),
+]
+
+
+def _modified(rng):
+    """与_entry_info相同格式的修改时间"""
+    timestamp = 1700000000 + rng.randrange(10 ** 7)
+    return datetime.datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def build_entries(count, seed=0):
+    """生成与_entry_info格式相同的目录项"""
+    rng = random.Random(seed)
+    entries = []
+    for i in range(count):
+        if rng.random() < 0.1:
+            entries.append({
+                'name': f'folder_{i:06d}', 'is_dir': True, 'size': 0,
+                'modified': _modified(rng), 'mimetype': None,
+            })
+            continue
+        ext, mimetype = rng.choice(EXTENSIONS)
+        entries.append({
+            'name': f'file_{i:06d}_{rng.getrandbits(32):08x}{ext}', 'is_dir': False,
+            'size': rng.randrange(1, 10 ** 9), 'modified': _modified(rng),
+            'mimetype': mimetype,
+        })
+    return entries
+
+
+def build_log(lines, seed=0):
+    """生成日志文本"""
+    rng = random.Random(seed)
+    levels = ['INFO', 'INFO', 'INFO', 'DEBUG', 'WARNING', 'ERROR']
+    out = []
+    for i in range(lines):
+        out.append(
+            f'2024-01-{1 + i % 28:02d} 12:{i % 60:02d}:{rng.randrange(60):02d},{rng.randrange(1000):03d} '
+            f'{rng.choice(levels)} backend.views 请求处理完成 path=/api/list/ status=200 '
+            f'duration={rng.random() * 100:.2f}ms request_id={rng.getrandbits(64):016x}\n'
+        )
+    return ''.join(out)
+
+
+def build_payloads(entries, log_lines):
+    items = build_entries(entries)
+    listing = json.dumps({'path': '/', 'items': items}).encode('utf-8')
+    ndjson_chunks = [
+        ('\n'.join(json.dumps(item, ensure_ascii=False) for item in items[i:i + NDJSON_BATCH_SIZE]) + '\n')
+        .encode('utf-8')
+        for i in range(0, len(items), NDJSON_BATCH_SIZE)
+    ]
+    preview = json.dumps({'content': build_log(log_lines), 'type': 'text'}, ensure_ascii=False).encode('utf-8')
+    return {'listing': [listing], 'ndjson': ndjson_chunks, 'preview': [preview]}
+
+
+def run_case(encoding, level, chunks, repeat):
+    size = sum(len(chunk) for chunk in chunks)
+    timings = []
+    compressed = 0
+    for _ in range(repeat):
+        started = time.process_time()
+        if len(chunks) == 1:
+            compressed = len(compression.compress_bytes(encoding, chunks[0], level))
+        else:
+            compressed = sum(len(part) for part in compression.compress_chunks(encoding, chunks, level))
+        timings.append(time.process_time() - started)
+    best = min(timings)
+    return {
+        'encoding': encoding,
+        'level': level,
+        'compressed_bytes': compressed,
+        'ratio': round(size / compressed, 2),
+        'best_cpu_seconds': round(best, 4),
+        'mean_cpu_seconds': round(sum(timings) / len(timings), 4),
+        'mb_per_second': round(size / 1024 / 1024 / best, 1) if best else None,
+    }
+
+
+def parse_levels(values):
+    levels = {}
+    for value in values:
+        encoding, _, numbers = value.partition('=')
+        levels[encoding] = [int(n) for n in numbers.split(',') if n]
+    return levels
+
+
+def main():
+    parser = argparse.ArgumentParser(description='响应压缩基准测试')
+    parser.add_argument('--entries', type=int, default=100000, help='目录列表的条目数')
+    parser.add_argument('--log-lines', type=int, default=50000, help='文本预览的行数')
+    parser.add_argument('--levels', nargs='*', default=['gzip=1,5,9', 'br=1,4,11', 'zstd=1,3,9'],
+                        help='各编码测试的级别，如 gzip=1,5,9')
+    parser.add_argument('--repeat', type=int, default=3, help='每种组合重复次数')
+    args = parser.parse_args()
+
+    payloads = build_payloads(args.entries, args.log_lines)
+    levels = parse_levels(args.levels)
+    encodings = [encoding for encoding in compression.available_encodings() if encoding in levels]
+
+    results = {}
+    for name, chunks in payloads.items():
+        results[name] = {
+            'original_bytes': sum(len(chunk) for chunk in chunks),
+            'chunks': len(chunks),
+            'results': [
+                run_case(encoding, level, chunks, args.repeat)
+                for encoding in encodings for level in levels[encoding]
+            ],
+        }
+
+    print(json.dumps({
+        'encodings': encodings,
+        'defaults': {
+            'gzip': compression.GZIP_LEVEL,
+            'br': compression.BROTLI_QUALITY,
+            'zstd': compression.ZSTD_LEVEL,
+        },
+        'payloads': results,
+    }, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
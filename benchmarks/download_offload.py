@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+"""
+下载卸载基准测试
+
+对比三种下载方式的吞吐量和工作线程占用：
+    python: Python逐块读取文件并写入套接字（Django开发服务器的默认行为）
+    sendfile: gfinder.server通过os.sendfile零拷贝发送
+    x-accel-redirect: 视图只设置响应头，文件由前端代理发送（此处没有代理，只统计线程占用）
+
+每种方式在独立的子进程中启动服务器，结束后统计服务器进程的CPU时间和
+处理请求期间线程被占用的总时长，结果以JSON输出。
+
+用法:
+    python benchmarks/download_offload.py --size-mb 256 --requests 16 --concurrency 4
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+from urllib.parse import urlencode
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = ('python', 'sendfile', 'x-accel-redirect')
+FILENAME = 'bench.bin'
+STATS_PATH = '/__bench__/stats'
+
+
+def serve(mode, root_dir):
+    """在当前进程中启动服务器（子进程入口），监听端口写到标准输出"""
+    sys.path.insert(0, BASE_DIR)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gfinder.settings')
+    import django
+    from django.conf import settings
+    django.setup()
+    settings.GFINDER_ROOT_DIR = root_dir
+    settings.GFINDER_DOWNLOAD_OFFLOAD = 'x-accel-redirect' if mode == 'x-accel-redirect' else None
+
+    import resource
+    from django.core.servers import basehttp
+    from django.core.wsgi import get_wsgi_application
+    from gfinder import server
+
+    base_handler = server.SendfileRequestHandler if mode == 'sendfile' else basehttp.WSGIRequestHandler
+    lock = threading.Lock()
+    busy = {'seconds': 0.0, 'requests': 0}
+
+    class TimedHandler(base_handler):
+        """统计每个请求占用线程的时间（包括发送响应体）"""
+
+        def handle_one_request(self):
+            started = time.perf_counter()
+            super().handle_one_request()
+            if self.command == 'GET' and self.path.startswith('/api/'):
+                with lock:
+                    busy['seconds'] += time.perf_counter() - started
+                    busy['requests'] += 1
+
+        def log_message(self, format, *args):
+            pass
+
+    django_app = get_wsgi_application()
+
+    def app(environ, start_response):
+        if environ['PATH_INFO'] == STATS_PATH:
+            usage = resource.getrusage(resource.RUSAGE_SELF)
+            with lock:
+                body = json.dumps({
+                    'cpu_seconds': usage.ru_utime + usage.ru_stime,
+                    'busy_seconds': busy['seconds'],
+                    'requests': busy['requests'],
+                }).encode('utf-8')
+            start_response('200 OK', [('Content-Type', 'application/json'),
+                                      ('Content-Length', str(len(body)))])
+            return [body]
+        return django_app(environ, start_response)
+
+    httpd = server.make_server('127.0.0.1', 0, app, request_handler=TimedHandler)
+    print(httpd.server_port, flush=True)
+    httpd.serve_forever()
+
+
+def _download(port, counter):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=600)
+    conn.request('GET', '/api/download?' + urlencode({'path': '', 'filename': FILENAME}))
+    response = conn.getresponse()
+    received = 0
+    while True:
+        data = response.read(1024 * 1024)
+        if not data:
+            break
+        received += len(data)
+    conn.close()
+    counter.append(received)
+
+
+def _get_stats(port):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    conn.request('GET', STATS_PATH)
+    stats = json.loads(conn.getresponse().read())
+    conn.close()
+    return stats
+
+
+def run_mode(mode, root_dir, requests, concurrency):
+    """启动指定模式的服务器并施加下载负载"""
+    proc = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), '--serve', mode, '--root', root_dir],
+        stdout=subprocess.PIPE, text=True
+    )
+    try:
+        port = int(proc.stdout.readline())
+        baseline = _get_stats(port)
+
+        counter = []
+        pending = list(range(requests))
+        pending_lock = threading.Lock()
+
+        def worker():
+            while True:
+                with pending_lock:
+                    if not pending:
+                        return
+                    pending.pop()
+                _download(port, counter)
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        stats = _get_stats(port)
+        transferred = sum(counter)
+        cpu_seconds = stats['cpu_seconds'] - baseline['cpu_seconds']
+        result = {
+            'mode': mode,
+            'requests': requests,
+            'concurrency': concurrency,
+            'elapsed_seconds': round(elapsed, 4),
+            'bytes_transferred': transferred,
+            'throughput_mb_s': round(transferred / elapsed / 1024 / 1024, 2) if transferred else None,
+            'server_cpu_seconds': round(cpu_seconds, 4),
+            'worker_busy_seconds': round(stats['busy_seconds'], 4),
+            'worker_busy_ms_per_request': round(stats['busy_seconds'] * 1000 / max(stats['requests'], 1), 3),
+        }
+        if mode == 'x-accel-redirect':
+            result['note'] = '文件内容由前端代理发送，吞吐量取决于代理'
+        return result
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='下载卸载基准测试')
+    parser.add_argument('--size-mb', type=int, default=256, help='测试文件大小(MB)')
+    parser.add_argument('--requests', type=int, default=16, help='下载请求总数')
+    parser.add_argument('--concurrency', type=int, default=4, help='并发连接数')
+    parser.add_argument('--modes', default=','.join(MODES), help='要测试的模式，逗号分隔')
+    parser.add_argument('--serve', choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument('--root', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.root)
+        return
+
+    with tempfile.TemporaryDirectory(prefix='gfinder-bench-') as root_dir:
+        block = os.urandom(1024 * 1024)
+        with open(os.path.join(root_dir, FILENAME), 'wb') as f:
+            for _ in range(args.size_mb):
+                f.write(block)
+
+        results = [
+            run_mode(mode, root_dir, args.requests, args.concurrency)
+            for mode in args.modes.split(',')
+        ]
+    print(json.dumps({'file_size_mb': args.size_mb, 'results': results}, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
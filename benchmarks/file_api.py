@@ -0,0 +1,621 @@
+#!/usr/bin/env python
+"""
+文件接口基准测试
+
+在临时根目录下生成测试目录树，用指定的并发数调用文件接口，输出每种组合的吞吐量和延迟分位数（JSON）。
+
+目录树:
+    flat-1k / flat-100k / flat-1m: 单个目录下1千/10万/100万个空文件
+    deep: 多级子目录，每级每个目录下有若干小文件
+    mixed: 大量小文件和少量大文件
+
+场景:
+    list_dir: 列出各目录树（deep为最深的一级）
+    upload_file: multipart上传
+    download_file: 下载mixed中的小文件和大文件
+    copy_item: 复制deep和mixed整个目录树
+    move_item: 在两个目录之间移动文件
+    preview_file: 预览文本文件
+
+请求方式:
+    inprocess: Django测试客户端在当前进程中调用（包含全部中间件，不经过网络）
+    http: 经过HTTP，默认在子进程中启动支持sendfile的多线程服务器；
+          用--url测试已经运行的服务器（如生产模式）时，--root必须是该服务器的数据根目录
+
+生成的目录树带有参数记录，指定--root重复运行时参数未变化的目录树直接复用。
+默认关闭搜索索引，避免后台遍历目录树干扰测量（--search-index开启）。
+
+用法:
+    python benchmarks/file_api.py --trees flat-1k,flat-100k,deep,mixed --concurrency 1,16 --requests 200
+    python benchmarks/file_api.py --scenarios list_dir --trees flat-1m --transports http --output result.json
+"""
+import os
+import sys
+import json
+import math
+import time
+import uuid
+import shutil
+import argparse
+import platform
+import tempfile
+import itertools
+import threading
+import subprocess
+import http.client
+from urllib.parse import urlencode, urlsplit
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gfinder.settings')
+
+FLAT_TREES = {'flat-1k': 1000, 'flat-100k': 100000, 'flat-1m': 1000000}
+TREES = tuple(FLAT_TREES) + ('deep', 'mixed')
+SCENARIOS = ('list_dir', 'upload_file', 'download_file', 'copy_item', 'move_item', 'preview_file')
+TRANSPORTS = ('inprocess', 'http')
+MARKER_FILE = '.bench-tree.json'
+# 数据根目录在--root（或临时目录）下，状态目录（上传会话、任务等）在它旁边，见get_state_directory
+DATA_DIR = 'data'
+
+
+def setup_django(root_dir, search_index):
+    import django
+    from django.conf import settings
+    django.setup()
+    settings.GFINDER_ROOT_DIR = root_dir
+    settings.GFINDER_SEARCH_INDEX = search_index
+
+
+def serve(root_dir, search_index):
+    """在当前进程中启动服务器（子进程入口），监听端口写到标准输出"""
+    setup_django(root_dir, search_index)
+    from django.core.wsgi import get_wsgi_application
+    from gfinder import server
+
+    class QuietHandler(server.SendfileRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+    httpd = server.make_server('127.0.0.1', 0, get_wsgi_application(), request_handler=QuietHandler)
+    print(httpd.server_port, flush=True)
+    httpd.serve_forever()
+
+
+# ---------------------------------------------------------------- 目录树
+
+def _write_file(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def _tree_params(name, args):
+    if name in FLAT_TREES:
+        return {'files': FLAT_TREES[name]}
+    if name == 'deep':
+        return {'depth': args.deep_depth, 'fanout': args.deep_fanout,
+                'files_per_dir': args.deep_files, 'file_kb': args.small_kb}
+    return {'small_files': args.small_files, 'small_kb': args.small_kb,
+            'large_files': args.large_files, 'large_mb': args.large_mb}
+
+
+def build_tree(trees_dir, name, args):
+    """生成目录树，参数与已有目录树一致时复用，返回(参数, 是否新生成)"""
+    root = os.path.join(trees_dir, name)
+    params = _tree_params(name, args)
+    try:
+        with open(os.path.join(root, MARKER_FILE), 'r', encoding='utf-8') as f:
+            if json.load(f) == params:
+                return params, False
+    except (OSError, ValueError):
+        pass
+    shutil.rmtree(root, ignore_errors=True)
+    os.makedirs(root)
+
+    if name in FLAT_TREES:
+        for i in range(params['files']):
+            open(os.path.join(root, f'file_{i:07d}.txt'), 'wb').close()
+    elif name == 'deep':
+        data = os.urandom(params['file_kb'] * 1024)
+        level = [root]
+        for depth in range(params['depth'] + 1):
+            next_level = []
+            for directory in level:
+                for i in range(params['files_per_dir']):
+                    _write_file(os.path.join(directory, f'f{i}.dat'), data)
+                if depth < params['depth']:
+                    for i in range(params['fanout']):
+                        child = os.path.join(directory, f'd{i}')
+                        os.mkdir(child)
+                        next_level.append(child)
+            level = next_level
+    else:
+        data = os.urandom(params['small_kb'] * 1024)
+        os.makedirs(os.path.join(root, 'small'))
+        for i in range(params['small_files']):
+            directory = os.path.join(root, 'small', f'd{i // 500}')
+            os.makedirs(directory, exist_ok=True)
+            _write_file(os.path.join(directory, f's{i}.dat'), data)
+        os.makedirs(os.path.join(root, 'large'))
+        block = os.urandom(1024 * 1024)
+        for i in range(params['large_files']):
+            with open(os.path.join(root, 'large', f'l{i}.bin'), 'wb') as f:
+                for _ in range(params['large_mb']):
+                    f.write(block)
+
+    with open(os.path.join(root, MARKER_FILE), 'w', encoding='utf-8') as f:
+        json.dump(params, f)
+    return params, True
+
+
+def _deepest_path(params):
+    return '/'.join(['trees/deep'] + ['d0'] * params['depth'])
+
+
+def _multipart(field_values, file_field, filename, content):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in field_values.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode('utf-8')
+        )
+    parts.append(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{file_field}"; filename="{filename}"\r\n'
+        f'Content-Type: application/octet-stream\r\n\r\n'.encode('utf-8')
+    )
+    parts.append(content)
+    parts.append(f'\r\n--{boundary}--\r\n'.encode('utf-8'))
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+# ---------------------------------------------------------------- 请求方式
+
+class InProcessTransport:
+    """Django测试客户端，每个线程一个"""
+
+    def __init__(self):
+        from django.test import Client
+        self.client = Client()
+
+    def request(self, method, url, body=b'', content_type='application/octet-stream'):
+        response = self.client.generic(method, url, body, content_type)
+        try:
+            if response.streaming:
+                received = sum(len(chunk) for chunk in response.streaming_content)
+            else:
+                received = len(response.content)
+        finally:
+            response.close()
+        return response.status_code, received
+
+    def close(self):
+        pass
+
+
+class HttpTransport:
+    """HTTP/1.1长连接，每个线程一个"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.conn = None
+
+    def request(self, method, url, body=b'', content_type='application/octet-stream'):
+        if self.conn is None:
+            self.conn = http.client.HTTPConnection(self.host, self.port, timeout=600)
+        headers = {'Content-Type': content_type} if body else {}
+        try:
+            self.conn.request(method, url, body=body or None, headers=headers)
+            response = self.conn.getresponse()
+            received = 0
+            while True:
+                data = response.read(1024 * 1024)
+                if not data:
+                    break
+                received += len(data)
+        except (http.client.HTTPException, OSError):
+            self.close()
+            raise
+        if response.will_close:
+            self.close()
+        return response.status, received
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+# ---------------------------------------------------------------- 场景
+
+class Case:
+    """
+    一组测试：prepare(requests)在计时前准备数据，request(transport, n)执行第n个请求，
+    cleanup()在计时后清理。readonly的场景可以预热。
+    """
+
+    readonly = True
+
+    def __init__(self, scenario, target):
+        self.scenario = scenario
+        self.target = target
+
+    def prepare(self, requests):
+        pass
+
+    def request(self, transport, n):
+        raise NotImplementedError
+
+    def cleanup(self):
+        pass
+
+
+class ListCase(Case):
+    def __init__(self, target, path):
+        super().__init__('list_dir', target)
+        self.url = '/api/list?' + urlencode({'path': path})
+
+    def request(self, transport, n):
+        return transport.request('GET', self.url)
+
+
+class DownloadCase(Case):
+    def __init__(self, target, path, filenames):
+        super().__init__('download_file', target)
+        self.urls = ['/api/download?' + urlencode({'path': path, 'filename': name}) for name in filenames]
+
+    def request(self, transport, n):
+        return transport.request('GET', self.urls[n % len(self.urls)])
+
+
+class PreviewCase(Case):
+    def __init__(self, work_dir, files, size_kb):
+        super().__init__('preview_file', f'text-{size_kb}kb')
+        self.directory = os.path.join(work_dir, 'preview')
+        self.files = files
+        self.size_kb = size_kb
+
+    def prepare(self, requests):
+        os.makedirs(self.directory, exist_ok=True)
+        line = 'INFO 2024-01-01 12:00:00 backend.views 请求处理完成 path=/api/list/ status=200\n'
+        content = (line * (self.size_kb * 1024 // len(line.encode('utf-8')) + 1)).encode('utf-8')
+        for i in range(self.files):
+            _write_file(os.path.join(self.directory, f'log{i}.txt'), content[:self.size_kb * 1024])
+
+    def request(self, transport, n):
+        url = '/api/preview?' + urlencode({'path': 'work/preview', 'filename': f'log{n % self.files}.txt'})
+        return transport.request('GET', url)
+
+
+class UploadCase(Case):
+    readonly = False
+
+    def __init__(self, work_dir, size_kb):
+        super().__init__('upload_file', f'{size_kb}kb')
+        self.directory = os.path.join(work_dir, 'uploads')
+        self.content = os.urandom(size_kb * 1024)
+        self.run_id = uuid.uuid4().hex[:8]
+
+    def prepare(self, requests):
+        os.makedirs(self.directory, exist_ok=True)
+
+    def request(self, transport, n):
+        body, content_type = _multipart({'path': 'work/uploads'}, 'file', f'{self.run_id}-{n}.bin', self.content)
+        return transport.request('POST', '/api/upload', body, content_type)
+
+    def cleanup(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class CopyCase(Case):
+    readonly = False
+
+    def __init__(self, work_dir, tree):
+        super().__init__('copy_item', tree)
+        self.directory = os.path.join(work_dir, 'copies')
+
+    def prepare(self, requests):
+        shutil.rmtree(self.directory, ignore_errors=True)
+        for n in range(requests):
+            os.makedirs(os.path.join(self.directory, str(n)))
+
+    def request(self, transport, n):
+        body = json.dumps({'source_path': 'trees', 'source_name': self.target, 'target_path': f'work/copies/{n}'})
+        return transport.request('POST', '/api/copy', body.encode('utf-8'), 'application/json')
+
+    def cleanup(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class MoveCase(Case):
+    readonly = False
+
+    def __init__(self, work_dir, size_kb):
+        super().__init__('move_item', f'{size_kb}kb')
+        self.directory = os.path.join(work_dir, 'move')
+        self.size_kb = size_kb
+
+    def prepare(self, requests):
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.makedirs(os.path.join(self.directory, 'a'))
+        os.makedirs(os.path.join(self.directory, 'b'))
+        data = os.urandom(self.size_kb * 1024)
+        for n in range(requests):
+            _write_file(os.path.join(self.directory, 'a', f'm{n}.dat'), data)
+
+    def request(self, transport, n):
+        body = json.dumps({'source_path': 'work/move/a', 'source_name': f'm{n}.dat', 'target_path': 'work/move/b'})
+        return transport.request('POST', '/api/move', body.encode('utf-8'), 'application/json')
+
+    def cleanup(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def build_cases(args, data_dir, tree_params):
+    work_dir = os.path.join(data_dir, 'work')
+    cases = []
+    for scenario in args.scenarios.split(','):
+        if scenario == 'list_dir':
+            for tree, params in tree_params.items():
+                path = _deepest_path(params) if tree == 'deep' else f'trees/{tree}'
+                cases.append(ListCase(tree, path))
+        elif scenario == 'download_file':
+            params = tree_params.get('mixed')
+            if params is None:
+                continue
+            cases.append(DownloadCase(
+                f"mixed-small-{params['small_kb']}kb", 'trees/mixed/small/d0',
+                [f's{i}.dat' for i in range(min(params['small_files'], 500))]
+            ))
+            if params['large_files']:
+                cases.append(DownloadCase(
+                    f"mixed-large-{params['large_mb']}mb", 'trees/mixed/large',
+                    [f'l{i}.bin' for i in range(params['large_files'])]
+                ))
+        elif scenario == 'copy_item':
+            cases.extend(CopyCase(work_dir, tree) for tree in ('deep', 'mixed') if tree in tree_params)
+        elif scenario == 'upload_file':
+            cases.append(UploadCase(work_dir, args.upload_kb))
+        elif scenario == 'move_item':
+            cases.append(MoveCase(work_dir, args.small_kb))
+        elif scenario == 'preview_file':
+            cases.append(PreviewCase(work_dir, 16, args.preview_kb))
+        else:
+            raise SystemExit(f'未知场景: {scenario}')
+    return cases
+
+
+# ---------------------------------------------------------------- 执行和统计
+
+def percentile(sorted_values, fraction):
+    """最近秩法的分位数"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def run_case(case, transport_factory, transport_name, concurrency, requests, warmup):
+    case.prepare(requests)
+    if case.readonly and warmup:
+        transport = transport_factory()
+        try:
+            for n in range(warmup):
+                case.request(transport, n)
+        finally:
+            transport.close()
+
+    counter = itertools.count()
+    latencies = []
+    received = []
+    errors = []
+    lock = threading.Lock()
+
+    def worker():
+        transport = transport_factory()
+        local_latencies = []
+        local_received = 0
+        try:
+            while True:
+                n = next(counter)
+                if n >= requests:
+                    break
+                started = time.perf_counter()
+                try:
+                    status, nbytes = case.request(transport, n)
+                except Exception as e:
+                    errors.append(repr(e))
+                    continue
+                elapsed = time.perf_counter() - started
+                if status >= 400:
+                    errors.append(f'HTTP {status}')
+                    continue
+                local_latencies.append(elapsed)
+                local_received += nbytes
+        finally:
+            transport.close()
+            with lock:
+                latencies.extend(local_latencies)
+                received.append(local_received)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    case.cleanup()
+
+    latencies.sort()
+    received_bytes = sum(received)
+
+    def ms(value):
+        return round(value * 1000, 3) if value is not None else None
+
+    return {
+        'scenario': case.scenario,
+        'target': case.target,
+        'transport': transport_name,
+        'concurrency': concurrency,
+        'requests': requests,
+        'succeeded': len(latencies),
+        'errors': len(errors),
+        'first_error': errors[0] if errors else None,
+        'elapsed_seconds': round(elapsed, 4),
+        'requests_per_second': round(len(latencies) / elapsed, 2) if elapsed else None,
+        'received_mb_per_second': round(received_bytes / elapsed / 1024 / 1024, 2) if elapsed else None,
+        'latency_ms': {
+            'mean': ms(sum(latencies) / len(latencies)) if latencies else None,
+            'p50': ms(percentile(latencies, 0.5)),
+            'p90': ms(percentile(latencies, 0.9)),
+            'p99': ms(percentile(latencies, 0.99)),
+            'max': ms(latencies[-1] if latencies else None),
+        },
+    }
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR, capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def _start_server(root_dir, search_index):
+    command = [sys.executable, os.path.abspath(__file__), '--serve', '--root', root_dir]
+    if search_index:
+        command.append('--search-index')
+    proc = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    port = int(proc.stdout.readline())
+    return proc, port
+
+
+def run(args, data_dir):
+    trees_dir = os.path.join(data_dir, 'trees')
+    os.makedirs(trees_dir, exist_ok=True)
+    setup_django(data_dir, args.search_index)
+
+    tree_params = {}
+    build_seconds = {}
+    for tree in args.trees.split(','):
+        if tree not in TREES:
+            raise SystemExit(f'未知目录树: {tree}')
+        started = time.perf_counter()
+        tree_params[tree], built = build_tree(trees_dir, tree, args)
+        if built:
+            build_seconds[tree] = round(time.perf_counter() - started, 2)
+    if build_seconds:
+        # 修改时间距当前不到RACY_WINDOW的目录不会进入列表缓存，等待后再测，结果与复用目录树时一致
+        from backend.file_operations.dir_cache import RACY_WINDOW
+        time.sleep(RACY_WINDOW)
+    cases = build_cases(args, data_dir, tree_params)
+
+    results = []
+    server = None
+    try:
+        for transport_name in args.transports.split(','):
+            if transport_name == 'inprocess':
+                factory = InProcessTransport
+            elif transport_name == 'http':
+                if args.url:
+                    parts = urlsplit(args.url)
+                    host, port = parts.hostname, parts.port or 80
+                else:
+                    server, port = _start_server(data_dir, args.search_index)
+                    host = '127.0.0.1'
+
+                def factory(host=host, port=port):
+                    return HttpTransport(host, port)
+            else:
+                raise SystemExit(f'未知请求方式: {transport_name}')
+
+            for concurrency in (int(c) for c in args.concurrency.split(',')):
+                for case in cases:
+                    result = run_case(case, factory, transport_name, concurrency, args.requests, args.warmup)
+                    results.append(result)
+                    print(f"{result['scenario']:<14} {result['target']:<20} {transport_name:<9} "
+                          f"c={concurrency:<4} {result['requests_per_second']} req/s "
+                          f"p50={result['latency_ms']['p50']}ms p99={result['latency_ms']['p99']}ms",
+                          file=sys.stderr)
+            if server is not None:
+                server.terminate()
+                server.wait()
+                server = None
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    return {
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'revision': _git_revision(),
+        },
+        'config': {
+            'requests': args.requests,
+            'warmup': args.warmup,
+            'concurrency': [int(c) for c in args.concurrency.split(',')],
+            'search_index': args.search_index,
+            'trees': tree_params,
+            'tree_build_seconds': build_seconds,
+            'url': args.url,
+        },
+        'results': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='文件接口基准测试')
+    parser.add_argument('--trees', default='flat-1k,flat-100k,deep,mixed',
+                        help=f"目录树，逗号分隔，可选{','.join(TREES)}")
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='场景，逗号分隔')
+    parser.add_argument('--transports', default=','.join(TRANSPORTS), help='请求方式，逗号分隔')
+    parser.add_argument('--concurrency', default='1,8', help='并发数，逗号分隔')
+    parser.add_argument('--requests', type=int, default=100, help='每种组合的请求数')
+    parser.add_argument('--warmup', type=int, default=5, help='只读场景计时前的预热请求数')
+    parser.add_argument('--root', default=None,
+                        help='测试目录（保留生成的目录树），默认使用临时目录；与--url一起使用时为服务器的数据根目录')
+    parser.add_argument('--url', default=None, help='测试已运行的服务器，如http://127.0.0.1:8000')
+    parser.add_argument('--search-index', action='store_true', help='开启搜索索引')
+    parser.add_argument('--deep-depth', type=int, default=5, help='deep的层数')
+    parser.add_argument('--deep-fanout', type=int, default=3, help='deep每个目录的子目录数')
+    parser.add_argument('--deep-files', type=int, default=8, help='deep每个目录的文件数')
+    parser.add_argument('--small-files', type=int, default=2000, help='mixed的小文件数量')
+    parser.add_argument('--small-kb', type=int, default=16, help='小文件大小(KB)')
+    parser.add_argument('--large-files', type=int, default=4, help='mixed的大文件数量')
+    parser.add_argument('--large-mb', type=int, default=64, help='大文件大小(MB)')
+    parser.add_argument('--upload-kb', type=int, default=1024, help='上传文件大小(KB)')
+    parser.add_argument('--preview-kb', type=int, default=256, help='预览文本文件大小(KB)')
+    parser.add_argument('--output', default=None, help='结果写入文件，默认输出到标准输出')
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.root, args.search_index)
+        return
+
+    if args.url and not args.root:
+        parser.error('--url需要同时用--root指定该服务器的数据根目录')
+
+    if args.url:
+        report = run(args, os.path.abspath(args.root))
+    elif args.root:
+        report = run(args, os.path.join(os.path.abspath(args.root), DATA_DIR))
+    else:
+        with tempfile.TemporaryDirectory(prefix='gfinder-bench-') as base_dir:
+            report = run(args, os.path.join(base_dir, DATA_DIR))
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -44,6 +44,15 @@ api.interceptors.response.use(
   }
 )
 
+// 计算SHA-256用于秒传，需要把文件读入内存，超过该大小的文件直接上传
+const INSTANT_UPLOAD_MAX_SIZE = 512 * 1024 * 1024
+
+// 计算文件的SHA-256（十六进制）
+const sha256Hex = async (file) => {
+  const digest = await window.crypto.subtle.digest('SHA-256', await file.arrayBuffer())
+  return Array.from(new Uint8Array(digest), byte => byte.toString(16).padStart(2, '0')).join('')
+}
+
 // 文件API服务
 export const fileApi = {
   // 获取系统信息
@@ -51,9 +60,41 @@ export const fileApi = {
     return api.get('/api/system-info')
   },
   
-  // 列出目录内容
-  listDirectory(path = '') {
-    return api.get('/api/list', { params: { path } })
+  // 列出目录内容，detect为true时按文件内容检测类型
+  listDirectory(path = '', detect = false) {
+    const params = { path }
+    if (detect) {
+      params.detect = 1
+    }
+    return api.get('/api/list', { params })
+  },
+  
+  // 分页列出目录内容，cursor为上一页返回的next_cursor
+  listDirectoryPage(path = '', limit = 500, cursor = null) {
+    const params = { path, limit }
+    if (cursor) {
+      params.cursor = cursor
+    }
+    return api.get('/api/list', { params })
+  },
+  
+  // 搜索文件，filters可包含q、glob、ext、type、min_size、max_size、modified_after、modified_before、limit、cursor
+  searchFiles(path = '', filters = {}) {
+    return api.get('/api/search', { params: { path, ...filters } })
+  },
+  
+  // 获取最大的文件夹（递归大小）
+  getBiggestFolders(path = '', limit = 20) {
+    return api.get('/api/biggest-folders', { params: { path, limit } })
+  },
+  
+  // 在后台为目录中的图片批量生成缩略图
+  prefetchThumbnails(path, size = 'medium', names = null) {
+    const data = { path, size }
+    if (names) {
+      data.names = names
+    }
+    return api.post('/api/thumbnails/prefetch', data)
   },
   
   // 创建目录
@@ -101,12 +142,30 @@ export const fileApi = {
     })
   },
   
+  // 分段预览大文本文件：params为{ line, lines }或{ offset, length }
+  previewTextWindow(path, filename, params = {}) {
+    return api.get('/api/preview/window', {
+      params: { path, filename, ...params }
+    })
+  },
+  
   // 保存文件内容
-  saveFile(path, filename, content) {
+  saveFile(path, filename, content, baseVersion = null) {
     return api.post('/api/save', {
       path,
       filename,
-      content
+      content,
+      base_version: baseVersion
+    })
+  },
+  
+  // 增量保存：edits为相对baseVersion的修改，如[{ offset, length, text, old_text }]或[{ line, count, text }]，返回的result.version为新版本
+  saveFileEdits(path, filename, edits, baseVersion) {
+    return api.post('/api/save', {
+      path,
+      filename,
+      edits,
+      base_version: baseVersion
     })
   },
   
@@ -123,6 +182,66 @@ export const fileApi = {
     })
   },
   
+  // 秒传：服务器上已有相同内容的文件时直接创建，返回true表示无需再上传
+  async tryInstantUpload(path, file) {
+    // crypto.subtle只在HTTPS或localhost下可用
+    if (!window.crypto || !window.crypto.subtle || file.size > INSTANT_UPLOAD_MAX_SIZE) {
+      return false
+    }
+    try {
+      const { result } = await api.post('/api/upload/instant', {
+        path,
+        filename: file.name,
+        size: file.size,
+        sha256: await sha256Hex(file)
+      })
+      return result.instant
+    } catch (error) {
+      // 秒传失败时退回到正常上传
+      return false
+    }
+  },
+  
+  // 分块上传文件 - 支持断点续传和并行上传
+  async uploadFileChunked(path, file, { concurrency = 4, onProgress = null } = {}) {
+    const { result } = await api.post('/api/upload/session', {
+      path,
+      filename: file.name,
+      size: file.size
+    })
+    const sessionUrl = `/api/upload/session/${result.session_id}`
+    const chunkSize = result.chunk_size
+    
+    // 只上传尚未接收的分块
+    const status = await api.get(sessionUrl)
+    const isReceived = (start, end) =>
+      status.received.some(([s, e]) => s <= start && e >= end)
+    const offsets = []
+    for (let offset = 0; offset < file.size; offset += chunkSize) {
+      if (!isReceived(offset, Math.min(offset + chunkSize, file.size))) {
+        offsets.push(offset)
+      }
+    }
+    
+    let uploaded = status.received_bytes
+    const worker = async () => {
+      while (offsets.length > 0) {
+        const offset = offsets.shift()
+        const chunk = file.slice(offset, offset + chunkSize)
+        await api.put(`${sessionUrl}?offset=${offset}`, chunk, {
+          headers: { 'Content-Type': 'application/octet-stream' }
+        })
+        uploaded += chunk.size
+        if (onProgress) {
+          onProgress(Math.round(uploaded * 100 / file.size))
+        }
+      }
+    }
+    await Promise.all(Array.from({ length: concurrency }, worker))
+    
+    return api.post(`${sessionUrl}/commit`)
+  },
+  
   // 下载文件
   downloadFile(path, filename) {
     // 确保路径不以/开头或结尾
@@ -163,21 +282,59 @@ export const fileApi = {
       });
   },
   
-  // 移动项目
-  moveItem(sourcePath, sourceName, targetPath) {
+  // 打包下载多个文件或文件夹，由浏览器直接以流的方式保存
+  downloadArchive(path, names, format = 'zip') {
+    const params = new URLSearchParams()
+    params.append('path', path ? path.replace(/^\/+|\/+$/g, '') : '')
+    params.append('format', format)
+    names.forEach(name => params.append('names', name))
+    
+    const a = document.createElement('a')
+    a.style.display = 'none'
+    a.href = `/api/archive?${params.toString()}`
+    document.body.appendChild(a)
+    a.click()
+    document.body.removeChild(a)
+    return Promise.resolve({ success: true })
+  },
+  
+  // 移动项目，background为true时作为后台任务执行并返回任务信息
+  moveItem(sourcePath, sourceName, targetPath, background = false) {
     return api.post('/api/move', {
       source_path: sourcePath,
       source_name: sourceName,
-      target_path: targetPath
+      target_path: targetPath,
+      background
     })
   },
   
-  // 复制项目
-  copyItem(sourcePath, sourceName, targetPath) {
+  // 复制项目，background为true时作为后台任务执行并返回任务信息
+  copyItem(sourcePath, sourceName, targetPath, background = false) {
     return api.post('/api/copy', {
       source_path: sourcePath,
       source_name: sourceName,
-      target_path: targetPath
+      target_path: targetPath,
+      background
     })
+  },
+  
+  // 批量执行文件操作，operations为[{ operation: 'delete', path, name }, ...]，返回每项的结果
+  batch(operations) {
+    return api.post('/api/batch', { operations })
+  },
+  
+  // 获取后台任务列表
+  getJobs() {
+    return api.get('/api/jobs')
+  },
+  
+  // 查询后台任务进度
+  getJob(jobId) {
+    return api.get(`/api/jobs/${jobId}`)
+  },
+  
+  // 取消后台任务
+  cancelJob(jobId) {
+    return api.post(`/api/jobs/${jobId}/cancel`)
   }
 } 
\ No newline at end of file
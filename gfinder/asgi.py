@@ -4,8 +4,19 @@ ASGI config for gfinder project.
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gfinder.settings')
+# ASGI下使用异步视图（backend/async_views.py）
+os.environ.setdefault('GFINDER_ASYNC_VIEWS', '1')
 
-application = get_asgi_application() 
\ No newline at end of file
+# 与get_asgi_application()相同，但分块上传的请求体边接收边写入
+django.setup(set_prefix=False)
+from backend.async_views import StreamingBodyASGIHandler  # noqa: E402
+
+application = StreamingBodyASGIHandler()
+
+# 启动时把前端构建文件读入内存
+from gfinder.static_files import get_static_files  # noqa: E402
+get_static_files()
+ 
\ No newline at end of file
@@ -0,0 +1,473 @@
+"""
+多进程服务器（生产模式）
+
+主进程不加载Django应用，只负责监听信号、启动和替换工作进程：
+- 启动--workers个工作进程，各自加载应用后处理请求。WSGI模式下每个进程用--threads个线程并发处理连接
+  （基于gfinder.server，文件下载通过os.sendfile零拷贝发送）；ASGI模式在每个进程中运行uvicorn
+- 支持SO_REUSEPORT时主进程为每个工作进程位置创建一个监听套接字，由内核在套接字间分配新连接，
+  工作进程只accept自己的套接字；套接字由主进程持有，工作进程重启或重载时已排队的连接留给接替的进程，
+  不会被重置。不支持时所有工作进程共享一个监听套接字
+- 工作进程处理--max-requests个请求（再加上随机抖动，避免同时重启）后平滑退出，主进程启动新进程替换
+- SIGHUP：平滑重载，先启动新一批工作进程（重新导入代码和配置），再通知旧进程处理完当前请求后退出
+- SIGTERM/SIGINT：停止接受新连接，等待进行中的请求完成，最多--graceful-timeout秒后强制结束
+
+生产模式默认关闭DEBUG（GFINDER_DEBUG=0）。不支持fork的平台（Windows）在当前进程中运行单个工作进程。
+
+用法:
+    python -m gfinder.prefork --bind 0.0.0.0:8000 --workers 8 --threads 4
+"""
+import os
+import sys
+import atexit
+import time
+import errno
+import random
+import select
+import signal
+import socket
+import logging
+import argparse
+import threading
+import socketserver
+from concurrent.futures import ThreadPoolExecutor
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+logger = logging.getLogger('gfinder.prefork')
+
+# 工作进程加载应用失败时的退出码，主进程收到后停止服务而不是反复重启
+WORKER_BOOT_ERROR = 3
+
+# 工作进程启动后这么多秒内退出视为启动失败，延迟一秒再重启，避免循环
+MIN_WORKER_LIFETIME = 1.0
+
+
+def _setup_logging():
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('[%(asctime)s] [%(process)d] %(levelname)s %(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
+
+def parse_bind(bind):
+    """解析host:port，IPv6地址写为[::]:8000"""
+    host, _, port = bind.rpartition(':')
+    return host.strip('[]') or '0.0.0.0', int(port)
+
+
+def reuse_port_supported():
+    return hasattr(socket, 'SO_REUSEPORT') and sys.platform.startswith('linux')
+
+
+def create_socket(host, port, reuse_port=False, backlog=None):
+    """创建TCP套接字；backlog为None时只绑定不监听"""
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind((host, port))
+        if backlog is not None:
+            sock.listen(backlog)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def _make_wsgi_server_classes():
+    # 延迟导入：主进程不需要加载Django
+    from django.core.servers import basehttp
+    from . import server
+
+    class WorkerRequestHandler(server.SendfileRequestHandler):
+        """统计请求数，并在同一连接上等待后续请求（最多keep_alive秒）"""
+
+        def handle(self):
+            self.close_connection = True
+            self.handle_one_request()
+            while not self.close_connection and self.server.accepting:
+                # 空闲的持久连接不能一直占用线程
+                if not select.select([self.connection], [], [], self.server.keep_alive)[0]:
+                    break
+                self.handle_one_request()
+            try:
+                self.connection.shutdown(socket.SHUT_WR)
+            except OSError:
+                pass
+
+        def handle_one_request(self):
+            super().handle_one_request()
+            if self.raw_requestline.strip():
+                self.server.request_finished()
+
+    class WorkerWSGIServer(socketserver.ThreadingMixIn, basehttp.WSGIServer):
+        """
+        工作进程中的WSGI服务器
+
+        在已有的监听套接字上服务，用固定数量的线程处理连接；线程都忙时暂停accept，
+        新连接留在内核队列中。继承ThreadingMixIn使Django的ServerHandler允许持久连接。
+        """
+
+        def __init__(self, sock, wsgi_handler, threads, keep_alive, max_requests, parent_pid):
+            super().__init__(sock.getsockname()[:2], WorkerRequestHandler, bind_and_activate=False)
+            self.socket.close()
+            self.socket = sock
+            self.server_address = sock.getsockname()
+            self.server_name = socket.getfqdn(self.server_address[0])
+            self.server_port = self.server_address[1]
+            self.setup_environ()
+            self.set_app(wsgi_handler)
+            self.keep_alive = keep_alive
+            self.max_requests = max_requests
+            self.parent_pid = parent_pid
+            self.accepting = True
+            self.requests = 0
+            self._lock = threading.Lock()
+            self._slots = threading.BoundedSemaphore(threads)
+            self._pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='gfinder-worker')
+
+        def process_request(self, request, client_address):
+            self._slots.acquire()
+            self._pool.submit(self._process_request, request, client_address)
+
+        def _process_request(self, request, client_address):
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+                self._slots.release()
+
+        def service_actions(self):
+            # 主进程退出（如被SIGKILL）后不再继续服务
+            if self.parent_pid is not None and os.getppid() != self.parent_pid:
+                self.stop()
+
+        def request_finished(self):
+            with self._lock:
+                self.requests += 1
+                recycle = self.max_requests and self.requests == self.max_requests
+            if recycle:
+                logger.info(f"已处理{self.requests}个请求，工作进程退出")
+                self.stop()
+
+        def stop(self):
+            """停止接受新连接，可以在任意线程或信号处理函数中调用"""
+            with self._lock:
+                if not self.accepting:
+                    return
+                self.accepting = False
+            # shutdown会等待serve_forever退出，不能在服务线程中直接调用
+            threading.Thread(target=self.shutdown, daemon=True).start()
+
+        def drain(self):
+            """等待进行中的请求完成"""
+            self._pool.shutdown(wait=True)
+
+    return WorkerWSGIServer
+
+
+def _run_wsgi_worker(sock, application, options, max_requests, parent_pid):
+    server_cls = _make_wsgi_server_classes()
+    httpd = server_cls(sock, application, options.threads, options.keep_alive, max_requests, parent_pid)
+    signal.signal(signal.SIGTERM, lambda signum, frame: httpd.stop())
+    httpd.serve_forever(poll_interval=0.5)
+    # 只关闭本进程的描述符，主进程仍持有套接字，排队的连接留给接替的工作进程
+    sock.close()
+    httpd.drain()
+    return 0
+
+
+def _run_asgi_worker(sock, application, options, max_requests):
+    import uvicorn
+    config = uvicorn.Config(
+        application,
+        lifespan='off',
+        timeout_keep_alive=options.keep_alive or 5,
+        timeout_graceful_shutdown=options.graceful_timeout,
+        limit_max_requests=max_requests or None,
+    )
+    uvicorn.Server(config).run(sockets=[sock])
+    return 0
+
+
+def run_worker(sock, options, parent_pid=None):
+    """
+    工作进程入口
+
+    Args:
+        sock: 监听套接字
+        parent_pid: 主进程PID，主进程消失后工作进程退出
+
+    Returns:
+        进程退出码
+    """
+    if parent_pid is not None:
+        # 终端中的Ctrl+C同样会发给工作进程，由主进程统一安排退出
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+    try:
+        if options.interface == 'asgi':
+            import uvicorn  # noqa: F401
+            from gfinder.asgi import application
+        else:
+            from gfinder.wsgi import application
+    except ImportError as e:
+        logger.error(f"加载应用失败: {str(e)}" + ("（ASGI模式需要安装uvicorn）" if e.name == 'uvicorn' else ''))
+        return WORKER_BOOT_ERROR
+    except Exception:
+        logger.exception("加载应用失败")
+        return WORKER_BOOT_ERROR
+
+    max_requests = options.max_requests
+    if max_requests:
+        max_requests += random.randint(0, options.max_requests_jitter)
+    if options.interface == 'asgi':
+        return _run_asgi_worker(sock, application, options, max_requests)
+    return _run_wsgi_worker(sock, application, options, max_requests, parent_pid)
+
+
+class Worker:
+    def __init__(self, pid, generation, slot):
+        self.pid = pid
+        self.generation = generation
+        # 使用的监听套接字序号
+        self.slot = slot
+        self.started = time.monotonic()
+        # 已通知退出的时间，超过graceful_timeout后强制结束
+        self.retiring_since = None
+
+
+class Arbiter:
+    """主进程：启动、监视和替换工作进程"""
+
+    SIGNALS = (signal.SIGHUP, signal.SIGTERM, signal.SIGINT, signal.SIGQUIT, signal.SIGCHLD)
+
+    def __init__(self, options):
+        self.options = options
+        self.pid = os.getpid()
+        self.workers = {}
+        self.generation = 0
+        self.listeners = []
+        self.exit_code = 0
+        self._signals = []
+        self._respawn_after = 0.0
+        self._wakeup_r = self._wakeup_w = None
+
+    def run(self):
+        host, port = parse_bind(self.options.bind)
+        try:
+            if self.options.reuse_port:
+                sock = create_socket(host, port, reuse_port=True, backlog=self.options.backlog)
+                self.listeners.append(sock)
+                # 端口为0时其余套接字绑定到系统分配的同一端口
+                port = sock.getsockname()[1]
+                for _ in range(self.options.workers - 1):
+                    self.listeners.append(create_socket(host, port, reuse_port=True, backlog=self.options.backlog))
+            else:
+                self.listeners.append(create_socket(host, port, backlog=self.options.backlog))
+        except OSError:
+            self._close_listeners()
+            raise
+        logger.info(
+            f"监听 {self.options.bind}，{self.options.workers}个工作进程（{self.options.interface}"
+            + (f"，每个进程{self.options.threads}个线程" if self.options.interface == 'wsgi' else '')
+            + ('，SO_REUSEPORT' if self.options.reuse_port else '') + '）'
+        )
+
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        os.set_blocking(self._wakeup_r, False)
+        os.set_blocking(self._wakeup_w, False)
+        signal.set_wakeup_fd(self._wakeup_w)
+        for signum in self.SIGNALS:
+            signal.signal(signum, self._on_signal)
+
+        self._spawn_missing()
+        try:
+            while True:
+                try:
+                    select.select([self._wakeup_r], [], [], 1.0)
+                except InterruptedError:
+                    pass
+                self._drain_wakeup()
+                self._reap()
+                signals, self._signals = self._signals, []
+                if signal.SIGQUIT in signals:
+                    self._stop(graceful=False)
+                    break
+                if signal.SIGTERM in signals or signal.SIGINT in signals or self.exit_code:
+                    self._stop(graceful=True)
+                    break
+                if signal.SIGHUP in signals:
+                    self._reload()
+                self._kill_overdue()
+                self._spawn_missing()
+        finally:
+            self._close_listeners()
+        return self.exit_code
+
+    def _close_listeners(self):
+        for sock in self.listeners:
+            sock.close()
+
+    def _on_signal(self, signum, frame):
+        if signum != signal.SIGCHLD:
+            self._signals.append(signum)
+
+    def _drain_wakeup(self):
+        try:
+            while os.read(self._wakeup_r, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def _current(self):
+        return [w for w in self.workers.values() if w.generation == self.generation and w.retiring_since is None]
+
+    def _spawn_missing(self):
+        if time.monotonic() < self._respawn_after:
+            return
+        occupied = {worker.slot for worker in self._current()}
+        for slot in range(self.options.workers):
+            if slot not in occupied:
+                self._spawn(slot)
+
+    def _spawn(self, slot):
+        # 共享套接字时所有工作进程使用同一个
+        listener = self.listeners[slot if self.options.reuse_port else 0]
+        pid = os.fork()
+        if pid:
+            self.workers[pid] = Worker(pid, self.generation, slot)
+            return
+        # 工作进程
+        code = 1
+        try:
+            signal.set_wakeup_fd(-1)
+            for signum in self.SIGNALS:
+                signal.signal(signum, signal.SIG_DFL)
+            os.close(self._wakeup_r)
+            os.close(self._wakeup_w)
+            for sock in self.listeners:
+                if sock is not listener:
+                    sock.close()
+            code = run_worker(listener, self.options, self.pid)
+        except SystemExit as e:
+            code = e.code if isinstance(e.code, int) else 1
+        except BaseException:
+            logger.exception("工作进程异常退出")
+        finally:
+            # os._exit不执行atexit注册的退出处理（如保存指标快照），在这里执行
+            atexit._run_exitfuncs()
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)
+
+    def _reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            worker = self.workers.pop(pid, None)
+            if worker is None:
+                continue
+            code = os.waitstatus_to_exitcode(status)
+            if code == WORKER_BOOT_ERROR:
+                logger.error(f"工作进程{pid}无法加载应用，停止服务")
+                self.exit_code = WORKER_BOOT_ERROR
+            elif worker.retiring_since is None and code != 0:
+                logger.warning(f"工作进程{pid}异常退出（{code}），重新启动")
+                if time.monotonic() - worker.started < MIN_WORKER_LIFETIME:
+                    self._respawn_after = time.monotonic() + MIN_WORKER_LIFETIME
+
+    def _retire(self, worker, signum=signal.SIGTERM):
+        if worker.retiring_since is None:
+            worker.retiring_since = time.monotonic()
+        try:
+            os.kill(worker.pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def _reload(self):
+        """平滑重载：先启动新一代工作进程，再让旧进程处理完当前请求后退出"""
+        logger.info("重新加载工作进程")
+        old = list(self.workers.values())
+        self.generation += 1
+        self._respawn_after = 0.0
+        self._spawn_missing()
+        for worker in old:
+            self._retire(worker)
+
+    def _kill_overdue(self):
+        now = time.monotonic()
+        for worker in list(self.workers.values()):
+            if worker.retiring_since is not None and now - worker.retiring_since > self.options.graceful_timeout:
+                logger.warning(f"工作进程{worker.pid}未在{self.options.graceful_timeout}秒内退出，强制结束")
+                self._retire(worker, signal.SIGKILL)
+
+    def _stop(self, graceful):
+        logger.info("正在停止服务" if graceful else "立即停止服务")
+        # 工作进程停止accept后套接字随之关闭，新连接被拒绝而不是在队列中等待
+        self._close_listeners()
+        for worker in list(self.workers.values()):
+            self._retire(worker, signal.SIGTERM if graceful else signal.SIGQUIT)
+        while self.workers:
+            self._kill_overdue()
+            self._reap()
+            try:
+                select.select([self._wakeup_r], [], [], 0.2)
+            except InterruptedError:
+                pass
+            self._drain_wakeup()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='GFinder多进程服务器')
+    parser.add_argument('--bind', default='0.0.0.0:8000', help='监听地址，host:port')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='工作进程数，默认为CPU核数')
+    parser.add_argument('--threads', type=int, default=4, help='WSGI模式下每个工作进程的线程数')
+    parser.add_argument('--interface', choices=('wsgi', 'asgi'), default='wsgi',
+                        help='wsgi使用内置服务器，asgi在每个工作进程中运行uvicorn')
+    parser.add_argument('--max-requests', type=int, default=0, help='工作进程处理多少个请求后重启，0为不重启')
+    parser.add_argument('--max-requests-jitter', type=int, default=0, help='max-requests的随机增量上限')
+    parser.add_argument('--keep-alive', type=float, default=2, help='持久连接的空闲超时秒数')
+    parser.add_argument('--graceful-timeout', type=float, default=30, help='停止或重载时等待请求完成的秒数')
+    parser.add_argument('--backlog', type=int, default=1024, help='监听队列长度')
+    parser.add_argument('--no-reuse-port', dest='reuse_port', action='store_false',
+                        help='不使用SO_REUSEPORT，所有工作进程共享一个监听套接字')
+    return parser
+
+
+def main(argv=None):
+    options = build_parser().parse_args(argv)
+    options.workers = max(1, options.workers)
+    options.threads = max(1, options.threads)
+    options.reuse_port = options.reuse_port and reuse_port_supported()
+    _setup_logging()
+
+    if BASE_DIR not in sys.path:
+        sys.path.insert(0, BASE_DIR)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gfinder.settings')
+    os.environ.setdefault('GFINDER_DEBUG', '0')
+
+    if not hasattr(os, 'fork'):
+        # Windows：在当前进程中运行单个工作进程
+        host, port = parse_bind(options.bind)
+        return run_worker(create_socket(host, port, backlog=options.backlog), options)
+    try:
+        return Arbiter(options).run()
+    except OSError as e:
+        if e.errno == errno.EADDRINUSE:
+            logger.error(f"地址已被占用: {options.bind}")
+            return 1
+        raise
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,99 @@
+"""
+支持sendfile的WSGI服务器
+
+在Django开发服务器的基础上实现wsgi.file_wrapper的零拷贝发送：
+FileResponse（包括单段Range响应）通过os.sendfile直接从文件发送到套接字，
+文件内容不经过Python进程的用户态缓冲区。
+"""
+import io
+import os
+import select
+import socketserver
+
+from django.core.servers import basehttp
+
+# 单次sendfile调用发送的最大字节数
+SENDFILE_BLOCK = 1 << 30
+
+
+class SendfileServerHandler(basehttp.ServerHandler):
+    """使用os.sendfile发送文件响应的ServerHandler"""
+
+    def sendfile(self):
+        if not hasattr(os, 'sendfile'):
+            return False
+        try:
+            in_fd = self.result.filelike.fileno()
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            return False
+        length = self.headers.get('Content-Length')
+        if length is None or self.environ['REQUEST_METHOD'] == 'HEAD':
+            return False
+
+        # 从文件当前位置开始发送Content-Length个字节（单段Range已定位到起始位置）
+        offset = os.lseek(in_fd, 0, os.SEEK_CUR)
+        remaining = int(length)
+        if not self.headers_sent:
+            self.send_headers()
+        self._flush()
+
+        sock = self.request_handler.connection
+        out_fd = sock.fileno()
+        while remaining > 0:
+            try:
+                sent = os.sendfile(out_fd, in_fd, offset, min(remaining, SENDFILE_BLOCK))
+            except BlockingIOError:
+                # 套接字设置了超时（内部为非阻塞），等待可写
+                select.select([], [sock], [])
+                continue
+            if sent == 0:
+                # 文件在发送期间被截断
+                break
+            offset += sent
+            remaining -= sent
+            self.bytes_sent += sent
+        return True
+
+
+class SendfileRequestHandler(basehttp.WSGIRequestHandler):
+    """使用SendfileServerHandler处理请求"""
+
+    # 响应头和响应体分两次写入套接字，开启Nagle算法时小响应的后一次写入要等待客户端的延迟确认（约40毫秒）
+    disable_nagle_algorithm = True
+
+    def handle_one_request(self):
+        self.raw_requestline = self.rfile.readline(65537)
+        if len(self.raw_requestline) > 65536:
+            self.requestline = ""
+            self.request_version = ""
+            self.command = ""
+            self.send_error(414)
+            return
+
+        if not self.parse_request():
+            return
+
+        handler = SendfileServerHandler(
+            self.rfile, self.wfile, self.get_stderr(), self.get_environ()
+        )
+        handler.request_handler = self
+        handler.run(self.server.get_app())
+
+
+def make_server(addr, port, wsgi_handler, request_handler=SendfileRequestHandler, threading=True):
+    """创建（多线程）WSGI服务器，返回尚未开始服务的服务器对象"""
+    if threading:
+        server_cls = type('WSGIServer', (socketserver.ThreadingMixIn, basehttp.WSGIServer), {})
+    else:
+        server_cls = basehttp.WSGIServer
+    httpd = server_cls((addr, port), request_handler)
+    if threading:
+        httpd.daemon_threads = True
+    httpd.set_app(wsgi_handler)
+    return httpd
+
+
+def run(addr, port, wsgi_handler, threading=True):
+    """启动支持sendfile的WSGI服务器"""
+    httpd = make_server(addr, port, wsgi_handler, threading=threading)
+    httpd.serve_forever()
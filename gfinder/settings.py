@@ -12,7 +12,8 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = 'django-insecure-gfinder-development-key-change-in-production'
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+# 生产模式（start.py --serve production）通过GFINDER_DEBUG=0关闭
+DEBUG = os.environ.get('GFINDER_DEBUG', '1') == '1'
 
 ALLOWED_HOSTS = ['*']
 
@@ -29,7 +30,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # 放在第一项，耗时包含其他中间件
+    'backend.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'backend.compression.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -101,6 +105,80 @@ STATICFILES_DIRS = [
 WHITENOISE_INDEX_FILE = True
 WHITENOISE_ROOT = os.path.join(BASE_DIR, 'frontend/dist')
 
+# 数据根目录，为空时Windows使用d:\data，其他系统使用/var/opt/gfinder/data
+GFINDER_ROOT_DIR = None
+
+# 下载卸载模式：None由Python发送文件，'x-accel-redirect'交给Nginx，'x-sendfile'交给Apache/lighttpd
+GFINDER_DOWNLOAD_OFFLOAD = None
+# x-accel-redirect模式下Nginx中指向数据根目录的internal location
+GFINDER_DOWNLOAD_OFFLOAD_PREFIX = '/protected/'
+
+# 是否使用异步视图，gfinder/asgi.py会默认开启；GFINDER_ASYNC_WORKERS为执行文件系统操作的线程数
+GFINDER_ASYNC_VIEWS = os.environ.get('GFINDER_ASYNC_VIEWS', '') == '1'
+GFINDER_ASYNC_WORKERS = 32
+
+# 响应压缩（zstd/brotli/gzip，按Accept-Encoding协商）：是否启用，以及压缩的最小响应字节数
+GFINDER_COMPRESSION = True
+GFINDER_COMPRESSION_MIN_SIZE = 1024
+
+# 目录列表缓存：最多缓存的目录数、条目总数上限、最长有效秒数，以及是否使用inotify主动失效
+GFINDER_LIST_CACHE_SIZE = 256
+GFINDER_LIST_CACHE_MAX_ITEMS = 1000000
+GFINDER_LIST_CACHE_TTL = 30
+GFINDER_LIST_CACHE_INOTIFY = True
+
+# 内部状态目录（上传会话等），为空时使用数据根目录旁的gfinder_state目录
+GFINDER_STATE_DIR = None
+
+# 分块上传会话无活动多少秒后过期清理
+GFINDER_UPLOAD_SESSION_TTL = 24 * 3600
+
+# 秒传：上传时记录内容的SHA-256，客户端提交哈希后可直接复用服务器上内容相同的文件。
+# GFINDER_INSTANT_UPLOAD_HARDLINK为True时使用硬链接（不占额外空间，但两个文件共享inode，
+# 在原位修改其中一个会影响另一个），否则用reflink或服务器本地复制
+GFINDER_INSTANT_UPLOAD = True
+GFINDER_INSTANT_UPLOAD_HARDLINK = False
+
+# 后台任务（复制、移动、删除）的并发数，以及已结束任务记录的保留秒数
+GFINDER_JOB_WORKERS = 4
+GFINDER_JOB_RETENTION = 24 * 3600
+
+# 复制文件夹时并发复制文件的线程数
+GFINDER_COPY_WORKERS = 8
+
+# 批量操作接口中并发执行互不相关操作的线程数
+GFINDER_BATCH_WORKERS = 8
+
+# 文件名搜索索引：是否启用、初次遍历的并发线程数、是否用inotify保持更新，
+# 以及inotify不可用（或监视数达到上限）时重新遍历的间隔秒数
+GFINDER_SEARCH_INDEX = True
+GFINDER_SEARCH_WORKERS = 8
+GFINDER_SEARCH_INOTIFY = True
+GFINDER_SEARCH_RECRAWL_INTERVAL = 3600
+
+# 缩略图：磁盘缓存上限（字节）、生成缩略图的进程数（None为CPU核数）、一次预生成的最大图片数
+GFINDER_THUMBNAIL_CACHE_SIZE = 512 * 1024 * 1024
+GFINDER_THUMBNAIL_WORKERS = None
+GFINDER_THUMBNAIL_PREFETCH_MAX = 1000
+
+# 按内容检测文件类型（python-magic）：缓存的检测结果数和批量检测的线程数
+GFINDER_MIME_CACHE_SIZE = 100000
+GFINDER_MIME_WORKERS = 8
+
+# Prometheus指标（/metrics）：是否启用，以及每个进程保存快照供其他进程汇总的间隔秒数
+GFINDER_METRICS = True
+GFINDER_METRICS_FLUSH_INTERVAL = 5
+
+# 路径解析：缓存的已打开目录fd数，文件操作相对目录fd执行（见backend/file_operations/path_resolver.py）
+GFINDER_DIRFD_CACHE_SIZE = 128
+
+# 存储后端（见backend/file_operations/storage.py）：local使用GFINDER_ROOT_DIR，memory把数据保存在进程内存中（测试用），
+# multi使用GFINDER_STORAGE_VOLUMES中的多个目录{卷名: 目录}；GFINDER_STORAGE_PLACEMENT为mount时每个卷是一个顶层目录，
+# 为hash时合并显示各卷，新的顶层文件和文件夹按名称哈希分布到各卷
+GFINDER_STORAGE_BACKEND = 'local'
+GFINDER_STORAGE_VOLUMES = {}
+GFINDER_STORAGE_PLACEMENT = 'mount'
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -0,0 +1,236 @@
+"""
+前端静态文件服务
+
+启动时把frontend/dist下构建好的文件读入内存，请求时不再stat和读取磁盘：
+- 每个文件计算强ETag，If-None-Match命中时返回304
+- 构建时生成的.br/.gz文件（或启动时在内存中压缩的版本）按Accept-Encoding直接发送，不在请求时压缩
+- Vite生成的带内容哈希的文件名（assets/index-BwQ0tZ3K.js）内容不会变化，
+  返回Cache-Control: immutable，浏览器一年内不再请求；其他文件和index.html每次向服务器验证
+- index.html直接从内存返回，不经过模板引擎
+
+重新构建前端后（index.html的修改时间变化），下一次请求index.html时重新加载。
+超过MAX_MEMORY_FILE_SIZE的文件不读入内存，仍从磁盘发送。
+"""
+import os
+import re
+import gzip
+import hashlib
+import logging
+import mimetypes
+import threading
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotAllowed, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+
+from backend import compression
+
+logger = logging.getLogger(__name__)
+
+# 读入内存的单个文件大小上限
+MAX_MEMORY_FILE_SIZE = 16 * 1024 * 1024
+
+# 没有预压缩文件时，启动时在内存中压缩的级别（只压缩一次，使用较高级别）
+PRECOMPRESS_GZIP_LEVEL = 9
+PRECOMPRESS_BROTLI_QUALITY = 11
+
+# 预压缩文件的扩展名
+_VARIANT_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+# Vite输出的带内容哈希的文件名：name-<8位哈希>.ext
+_HASHED_NAME_RE = re.compile(r'-[A-Za-z0-9_-]{8}\.[A-Za-z0-9]+$')
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+
+
+class StaticFile:
+    """内存中的静态文件及其压缩版本"""
+
+    def __init__(self, rel_path, content, content_type, cache_control):
+        self.rel_path = rel_path
+        self.content_type = content_type
+        self.cache_control = cache_control
+        digest = hashlib.sha1(content).hexdigest()[:20]
+        # 编码 -> (内容, ETag)；None为未压缩的原文
+        self.variants = {None: (content, f'"{digest}"')}
+        self._digest = digest
+
+    def add_variant(self, encoding, content):
+        if len(content) < len(self.variants[None][0]):
+            self.variants[encoding] = (content, f'"{self._digest}-{encoding}"')
+
+    @property
+    def encodings(self):
+        """可用的压缩编码，按偏好排序（brotli优先）"""
+        return [encoding for encoding in _VARIANT_SUFFIXES if encoding in self.variants]
+
+    @property
+    def size(self):
+        return sum(len(content) for content, _ in self.variants.values())
+
+
+class StaticFiles:
+    """
+    frontend/dist下全部文件的内存副本
+
+    Args:
+        root: 构建输出目录
+    """
+
+    def __init__(self, root):
+        self.root = os.path.normpath(root)
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._files = {}
+        self._large = set()
+        self._index_mtime = None
+
+    def _index_path(self):
+        return os.path.join(self.root, 'index.html')
+
+    def load(self):
+        """读取全部文件，替换当前内容"""
+        files = {}
+        large = set()
+        try:
+            index_mtime = os.stat(self._index_path()).st_mtime_ns
+        except OSError:
+            index_mtime = None
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                full_path = os.path.join(directory, name)
+                rel_path = os.path.relpath(full_path, self.root).replace(os.sep, '/')
+                if os.path.splitext(name)[1] in ('.br', '.gz') and \
+                        os.path.exists(full_path[:-len(os.path.splitext(name)[1])]):
+                    # 预压缩版本随原文件一起加载
+                    continue
+                try:
+                    if os.path.getsize(full_path) > MAX_MEMORY_FILE_SIZE:
+                        large.add(rel_path)
+                        continue
+                    files[rel_path] = self._load_file(rel_path, full_path)
+                except OSError as e:
+                    logger.warning(f"加载静态文件失败 {rel_path}: {str(e)}")
+        with self._lock:
+            self._files = files
+            self._large = large
+            self._index_mtime = index_mtime
+        logger.info(f"已加载{len(files)}个静态文件，共{sum(f.size for f in files.values())}字节")
+
+    def _load_file(self, rel_path, full_path):
+        with open(full_path, 'rb') as f:
+            content = f.read()
+        content_type = mimetypes.guess_type(rel_path)[0] or 'application/octet-stream'
+        if content_type.startswith('text/') or content_type in ('application/javascript', 'application/json'):
+            content_type += '; charset=utf-8'
+        hashed = rel_path.startswith('assets/') and _HASHED_NAME_RE.search(rel_path)
+        static_file = StaticFile(
+            rel_path, content, content_type,
+            IMMUTABLE_CACHE_CONTROL if hashed else REVALIDATE_CACHE_CONTROL,
+        )
+        for encoding, suffix in _VARIANT_SUFFIXES.items():
+            if os.path.exists(full_path + suffix):
+                with open(full_path + suffix, 'rb') as f:
+                    static_file.add_variant(encoding, f.read())
+        if compression.is_compressible(content_type) and \
+                len(content) >= getattr(settings, 'GFINDER_COMPRESSION_MIN_SIZE', 1024):
+            if 'gzip' not in static_file.variants:
+                static_file.add_variant('gzip', gzip.compress(content, PRECOMPRESS_GZIP_LEVEL, mtime=0))
+            if 'br' not in static_file.variants and compression.brotli is not None:
+                static_file.add_variant(
+                    'br', compression.brotli.compress(content, quality=PRECOMPRESS_BROTLI_QUALITY)
+                )
+        return static_file
+
+    def reload_if_changed(self):
+        """index.html的修改时间变化（前端重新构建）时重新加载"""
+        if self._index_changed():
+            with self._load_lock:
+                # 其他线程可能已经重新加载
+                if self._index_changed():
+                    self.load()
+
+    def _index_changed(self):
+        try:
+            mtime = os.stat(self._index_path()).st_mtime_ns
+        except OSError:
+            mtime = None
+        return mtime != self._index_mtime
+
+    def get(self, rel_path):
+        """
+        Returns:
+            StaticFile，文件较大未读入内存时为完整路径，不存在时为None
+        """
+        with self._lock:
+            static_file = self._files.get(rel_path)
+            if static_file is None and rel_path in self._large:
+                return os.path.join(self.root, *rel_path.split('/'))
+        return static_file
+
+
+_static_files = None
+_static_files_lock = threading.Lock()
+
+
+def get_static_files():
+    """获取进程内共享的静态文件，首次调用时加载"""
+    global _static_files
+    if _static_files is None:
+        with _static_files_lock:
+            if _static_files is None:
+                static_files = StaticFiles(os.path.join(settings.BASE_DIR, 'frontend', 'dist'))
+                static_files.load()
+                _static_files = static_files
+    return _static_files
+
+
+def _respond(request, static_file):
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponseNotAllowed(['GET', 'HEAD'])
+    if isinstance(static_file, str):
+        response = FileResponse(open(static_file, 'rb'))
+        response['Cache-Control'] = REVALIDATE_CACHE_CONTROL
+        return response
+
+    encodings = static_file.encodings
+    encoding = compression.negotiate(request.headers.get('Accept-Encoding', ''), encodings) if encodings else None
+    content, etag = static_file.variants[encoding]
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(b'' if request.method == 'HEAD' else content, content_type=static_file.content_type)
+        response['Content-Length'] = str(len(content))
+        if encoding is not None:
+            response['Content-Encoding'] = encoding
+    response['ETag'] = etag
+    response['Cache-Control'] = static_file.cache_control
+    if encodings:
+        patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
+def serve(request, path, prefix):
+    """发送prefix目录（static、assets）下的文件"""
+    static_file = get_static_files().get(f'{prefix}/{path}')
+    if static_file is None:
+        raise Http404("文件不存在")
+    return _respond(request, static_file)
+
+
+def serve_index(request, path=''):
+    """
+    SPA入口：路径是dist根目录下的文件（如favicon.ico）时发送该文件，否则返回index.html
+    """
+    static_files = get_static_files()
+    if path and '/' not in path and path != 'index.html':
+        static_file = static_files.get(path)
+        if static_file is not None:
+            return _respond(request, static_file)
+    static_files.reload_if_changed()
+    static_file = static_files.get('index.html')
+    if static_file is None:
+        raise Http404("前端未构建")
+    return _respond(request, static_file)
@@ -2,11 +2,9 @@
 URL configuration for gfinder project.
 """
 from django.urls import path, include, re_path
-from django.views.generic import TemplateView
 from django.http import HttpResponse
-from django.views.static import serve
-from django.conf import settings
-import os
+
+from . import static_files
 
 
 def health_check(request):
@@ -15,14 +13,14 @@ def health_check(request):
 
 
 urlpatterns = [
-    path('', TemplateView.as_view(template_name='index.html')),
+    path('', static_files.serve_index),
     path('', include('backend.urls')),
     path('health', health_check, name='health_check'),
     
-    # 添加直接服务static和assets目录的URL
-    re_path(r'^static/(?P<path>.*)$', serve, {'document_root': os.path.join(settings.BASE_DIR, 'frontend/dist/static')}),
-    re_path(r'^assets/(?P<path>.*)$', serve, {'document_root': os.path.join(settings.BASE_DIR, 'frontend/dist/assets')}),
+    # static和assets目录从内存中发送（gfinder/static_files.py）
+    re_path(r'^static/(?P<path>.*)$', static_files.serve, {'prefix': 'static'}),
+    re_path(r'^assets/(?P<path>.*)$', static_files.serve, {'prefix': 'assets'}),
     
     # 捕获所有其他URL并返回index.html (SPA路由)
-    re_path(r'^.*$', TemplateView.as_view(template_name='index.html')),
-]
\ No newline at end of file
+    re_path(r'^(?P<path>.*)$', static_files.serve_index),
+]
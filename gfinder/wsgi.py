@@ -8,4 +8,8 @@ from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gfinder.settings')
 
-application = get_wsgi_application()
\ No newline at end of file
+application = get_wsgi_application()
+
+# 启动时把前端构建文件读入内存
+from gfinder.static_files import get_static_files  # noqa: E402
+get_static_files()
@@ -12,10 +12,13 @@ import webbrowser
 import argparse
 import venv
 import site
+import json
 import locale
 import shutil
+import hashlib
+import importlib
 from pathlib import Path
-from typing import Optional, Tuple, Dict
+from typing import Optional, Tuple, Dict, Any, List
 
 # 中英文消息字典
 MESSAGES = {
@@ -46,9 +49,13 @@ MESSAGES = {
         'frontend_build_manual': "请手动构建前端: cd frontend && npm install && npm run build",
         'frontend_not_found': "未找到前端项目，请检查frontend目录",
         'frontend_built': "前端已构建",
+        'frontend_stale': "前端源码已修改，需要重新构建...",
+        'frontend_deps_unchanged': "前端依赖未变化，跳过npm install",
+        'requirements_changed': "requirements.txt已修改，重新安装依赖...",
         'warning_no_frontend': "警告: 前端文件未构建，可能影响系统使用",
         'build_guide': "您可以运行: python start.py --build 来构建前端",
         'starting_service': "正在启动GFinder服务，访问地址: http://localhost:{}",
+        'starting_production': "以生产模式启动（多进程，DEBUG关闭）",
         'browser_open_failed': "无法自动打开浏览器，请手动访问: http://localhost:{}",
         'django_import_failed': "导入Django失败: {}",
         'try_venv_python': "尝试使用虚拟环境Python执行...",
@@ -83,9 +90,13 @@ MESSAGES = {
         'frontend_build_manual': "Please build frontend manually: cd frontend && npm install && npm run build",
         'frontend_not_found': "Frontend project not found, please check frontend directory",
         'frontend_built': "Frontend already built",
+        'frontend_stale': "Frontend sources changed, rebuild needed...",
+        'frontend_deps_unchanged': "Frontend dependencies unchanged, skipping npm install",
+        'requirements_changed': "requirements.txt changed, reinstalling dependencies...",
         'warning_no_frontend': "Warning: Frontend files not built, may affect system usage",
         'build_guide': "You can run: python start.py --build to build the frontend",
         'starting_service': "Starting GFinder service, access at: http://localhost:{}",
+        'starting_production': "Starting in production mode (multi-process, DEBUG off)",
         'browser_open_failed': "Unable to open browser automatically, please visit: http://localhost:{}",
         'django_import_failed': "Failed to import Django: {}",
         'try_venv_python': "Trying to use virtual environment Python...",
@@ -95,6 +106,84 @@ MESSAGES = {
     }
 }
 
+class StartupCache:
+    """
+    启动状态缓存
+    
+    保存上次启动时各项环境检查的输入指纹和结果（区域设置、虚拟环境依赖、前端构建），
+    输入未变化时直接使用缓存的结果，不再启动子进程检查。
+    """
+    
+    def __init__(self, path: str, enabled: bool = True):
+        self.path = path
+        self.enabled = enabled
+        self.data: Dict[str, Any] = {}
+        if enabled:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.data = json.load(f)
+            except (OSError, ValueError):
+                self.data = {}
+    
+    def get(self, key: str) -> Optional[Any]:
+        """获取缓存的记录，不存在或禁用缓存时返回None"""
+        return self.data.get(key) if self.enabled else None
+    
+    def set(self, key: str, value: Any) -> None:
+        """保存记录（即使禁用了读取缓存，也记录本次检查的结果）"""
+        self.data[key] = value
+        tmp_path = f'{self.path}.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+
+def _mtime_ns(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+def hash_inputs(base_dir: str, names: List[str]) -> Tuple[str, int]:
+    """
+    计算文件和目录内容的哈希
+    
+    Args:
+        base_dir: 基础目录
+        names: 相对base_dir的文件或目录，目录递归包含全部文件
+        
+    Returns:
+        Tuple[str, int]: (SHA-256, 最新的修改时间ns)
+    """
+    digest = hashlib.sha256()
+    newest = 0
+    for name in names:
+        path = os.path.join(base_dir, name)
+        if os.path.isdir(path):
+            files = []
+            for directory, dirs, filenames in os.walk(path):
+                dirs[:] = sorted(d for d in dirs if d not in ('node_modules', 'dist'))
+                files.extend(os.path.join(directory, filename) for filename in sorted(filenames))
+        elif os.path.isfile(path):
+            files = [path]
+        else:
+            continue
+        for file_path in files:
+            rel_path = os.path.relpath(file_path, base_dir).replace(os.sep, '/')
+            digest.update(rel_path.encode('utf-8') + b'\0')
+            with open(file_path, 'rb') as f:
+                digest.update(hashlib.sha256(f.read()).digest())
+            newest = max(newest, os.stat(file_path).st_mtime_ns)
+    return digest.hexdigest(), newest
+
+# 启动状态缓存，--recheck时忽略缓存重新检查
+startup_cache = StartupCache(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.start_cache.json'),
+    enabled='--recheck' not in sys.argv,
+)
+
 # 检测系统是否支持中文
 def check_chinese_support() -> bool:
     """
@@ -115,14 +204,23 @@ def check_chinese_support() -> bool:
         except locale.Error:
             pass
     
-    # 检查是否有任何中文区域可用
+    # 检查是否有任何中文区域可用，结果缓存到系统的区域数据变化为止
+    fingerprint = [platform.system()] + [
+        _mtime_ns(path) for path in ('/usr/lib/locale', '/usr/lib/locale/locale-archive')
+    ]
+    cached = startup_cache.get('locale')
+    if cached and cached.get('fingerprint') == fingerprint:
+        return cached['supports_chinese']
+    
+    result = False
     try:
         output = subprocess.check_output(['locale', '-a'], text=True)
-        return any(loc.startswith('zh_') for loc in output.splitlines())
+        result = any(loc.startswith('zh_') for loc in output.splitlines())
     except (subprocess.SubprocessError, FileNotFoundError):
         pass
     
-    return False
+    startup_cache.set('locale', {'fingerprint': fingerprint, 'supports_chinese': result})
+    return result
 
 # 设置语言和编码
 supports_chinese = check_chinese_support()
@@ -300,6 +398,54 @@ def check_venv_dependencies(venv_dir: str) -> bool:
     except Exception:
         return False
 
+def venv_fingerprint(venv_dir: str) -> Dict[str, Any]:
+    """
+    虚拟环境的指纹：解释器、site-packages目录（安装或卸载包时修改时间会变化）和requirements.txt的内容
+    
+    Args:
+        venv_dir: 虚拟环境目录
+        
+    Returns:
+        Dict[str, Any]: 指纹
+    """
+    return {
+        'python': _mtime_ns(get_venv_python(venv_dir)),
+        'site_packages': _mtime_ns(get_venv_site_packages(venv_dir)),
+        'requirements': hash_inputs(os.path.dirname(os.path.abspath(__file__)), ['requirements.txt'])[0],
+    }
+
+def ensure_venv_dependencies(venv_dir: str, is_new_venv: bool) -> bool:
+    """
+    确保虚拟环境中已安装依赖
+    
+    指纹与上次检查通过时相同则不再启动Python检查；requirements.txt的内容变化时重新安装。
+    
+    Args:
+        venv_dir: 虚拟环境目录
+        is_new_venv: 是否为新创建的虚拟环境
+        
+    Returns:
+        bool: 依赖是否可用
+    """
+    fingerprint = venv_fingerprint(venv_dir)
+    cached = startup_cache.get('venv')
+    if not is_new_venv and cached == fingerprint:
+        return True
+    
+    if is_new_venv:
+        need_install = True
+    elif cached is not None and cached.get('requirements') != fingerprint['requirements']:
+        print_message('requirements_changed')
+        need_install = True
+    else:
+        need_install = not check_venv_dependencies(venv_dir)
+    
+    if need_install and not install_requirements_in_venv(venv_dir):
+        return False
+    # 安装后site-packages已变化，重新计算
+    startup_cache.set('venv', venv_fingerprint(venv_dir))
+    return True
+
 def check_npm_installed() -> Tuple[bool, str]:
     """
     检查npm是否已安装
@@ -352,10 +498,17 @@ def install_npm() -> bool:
     except subprocess.SubprocessError:
         return False
 
+# 前端构建的输入：依赖清单和源码
+FRONTEND_DEPS = ['package.json', 'package-lock.json']
+FRONTEND_SOURCES = FRONTEND_DEPS + ['src', 'public', 'index.html', 'vite.config.js']
+
 def build_frontend(force_build: bool = False) -> None:
     """
     构建前端
     
+    dist不存在、前端源码或依赖清单的内容与上次构建时不同时重新构建；
+    依赖清单未变化且node_modules存在时跳过npm install。
+    
     Args:
         force_build: 是否强制重新构建
     """
@@ -363,54 +516,114 @@ def build_frontend(force_build: bool = False) -> None:
     frontend_dir = os.path.join(base_dir, 'frontend')
     dist_dir = os.path.join(frontend_dir, 'dist')
     
+    sources_hash, sources_mtime = hash_inputs(frontend_dir, FRONTEND_SOURCES)
+    deps_hash, _ = hash_inputs(frontend_dir, FRONTEND_DEPS)
+    built = startup_cache.get('frontend')
+    
     if not os.path.exists(dist_dir) or force_build:
         print_message('frontend_build_needed')
+    elif built is None:
+        # 没有构建记录（首次使用缓存或手动构建）：dist比全部源码新时认为是最新的
+        if (_mtime_ns(os.path.join(dist_dir, 'index.html')) or 0) >= sources_mtime:
+            startup_cache.set('frontend', {'sources': sources_hash, 'deps': deps_hash})
+            print_message('frontend_built')
+            return
+        print_message('frontend_stale')
+    elif built.get('sources') != sources_hash:
+        print_message('frontend_stale')
+    else:
+        print_message('frontend_built')
+        return
+    
+    # 检查npm是否已安装
+    print_message('checking_npm')
+    npm_installed, npm_version = check_npm_installed()
+    
+    if not npm_installed:
+        print_message('npm_not_found')
         
-        # 检查npm是否已安装
-        print_message('checking_npm')
-        npm_installed, npm_version = check_npm_installed()
-        
-        if not npm_installed:
-            print_message('npm_not_found')
-            
-            if platform.system() != 'Windows':
-                # Linux自动安装npm
-                print_message('installing_npm')
-                if install_npm():
-                    print_message('npm_install_success')
-                    npm_installed, npm_version = check_npm_installed()
-                else:
-                    print_message('npm_install_failed')
+        if platform.system() != 'Windows':
+            # Linux自动安装npm
+            print_message('installing_npm')
+            if install_npm():
+                print_message('npm_install_success')
+                npm_installed, npm_version = check_npm_installed()
             else:
-                # Windows提供安装指南
-                print_message('npm_windows_guide')
-                return
+                print_message('npm_install_failed')
+        else:
+            # Windows提供安装指南
+            print_message('npm_windows_guide')
+            return
+    
+    if npm_installed:
+        print_message('npm_detected', npm_version)
         
-        if npm_installed:
-            print_message('npm_detected', npm_version)
-            
-            if os.path.exists(os.path.join(frontend_dir, 'package.json')):
-                try:
-                    if platform.system() == 'Windows':
-                        print_message('building_windows')
+        if os.path.exists(os.path.join(frontend_dir, 'package.json')):
+            install_deps = (built is None or built.get('deps') != deps_hash
+                            or not os.path.isdir(os.path.join(frontend_dir, 'node_modules')))
+            if not install_deps:
+                print_message('frontend_deps_unchanged')
+            try:
+                if platform.system() == 'Windows':
+                    print_message('building_windows')
+                    if install_deps:
                         subprocess.check_call('cd frontend && npm install', shell=True)
-                        subprocess.check_call('cd frontend && npm run build', shell=True)
-                    else:
-                        print_message('building_linux')
-                        # 确保在Linux上使用UTF-8环境变量
-                        my_env = os.environ.copy()
-                        my_env["LANG"] = "en_US.UTF-8"
-                        my_env["LC_ALL"] = "en_US.UTF-8"
-                        subprocess.check_call('cd frontend && npm install && npm run build', 
-                                             shell=True, env=my_env)
-                    print_message('frontend_build_complete')
-                except subprocess.CalledProcessError as e:
-                    print_message('frontend_build_failed', e)
-                    print_message('frontend_build_manual')
-            else:
-                print_message('frontend_not_found')
-    else:
-        print_message('frontend_built')
+                    subprocess.check_call('cd frontend && npm run build', shell=True)
+                else:
+                    print_message('building_linux')
+                    # 确保在Linux上使用UTF-8环境变量
+                    my_env = os.environ.copy()
+                    my_env["LANG"] = "en_US.UTF-8"
+                    my_env["LC_ALL"] = "en_US.UTF-8"
+                    command = 'cd frontend && npm install && npm run build' if install_deps \
+                        else 'cd frontend && npm run build'
+                    subprocess.check_call(command, shell=True, env=my_env)
+                startup_cache.set('frontend', {'sources': sources_hash, 'deps': deps_hash})
+                print_message('frontend_build_complete')
+            except subprocess.CalledProcessError as e:
+                print_message('frontend_build_failed', e)
+                print_message('frontend_build_manual')
+        else:
+            print_message('frontend_not_found')
+
+def run_production_server(args: argparse.Namespace, base_dir: Path, host: str, port: int,
+                          venv_dir: Optional[str]) -> None:
+    """
+    以生产模式启动多进程服务器（gfinder/prefork.py）
+    
+    Args:
+        args: 命令行参数
+        base_dir: 项目根目录
+        host: 监听地址
+        port: 端口号
+        venv_dir: 虚拟环境目录，不使用虚拟环境时为None
+    """
+    prefork_args = [
+        '--bind', f'{host}:{port}',
+        '--threads', str(args.threads),
+        '--interface', args.interface,
+        '--max-requests', str(args.max_requests),
+        '--max-requests-jitter', str(args.max_requests // 10),
+    ]
+    if args.workers:
+        prefork_args += ['--workers', str(args.workers)]
+    
+    try:
+        # prefork在工作进程中才导入Django，这里先确认当前解释器可以导入
+        importlib.import_module('django.core.wsgi')
+        from gfinder import prefork
+    except ImportError as e:
+        if venv_dir is None:
+            raise
+        print_message('django_import_failed', e)
+        print_message('try_venv_python')
+        python_exec = get_venv_python(venv_dir)
+        subprocess.check_call([python_exec, '-m', 'gfinder.prefork'] + prefork_args, cwd=base_dir)
+        return
+    
+    exit_code = prefork.main(prefork_args)
+    if exit_code:
+        sys.exit(exit_code)
 
 def main() -> None:
     """主函数"""
@@ -425,6 +638,14 @@ def main() -> None:
     parser.add_argument('--no-build', action='store_true', help='跳过前端构建')
     parser.add_argument('--port', type=int, default=8000, help='服务器端口号')
     parser.add_argument('--no-venv', action='store_true', help='不使用虚拟环境')
+    parser.add_argument('--recheck', action='store_true', help='忽略启动缓存，重新检查区域设置、依赖和前端构建')
+    parser.add_argument('--serve', choices=['development', 'production'], default='development',
+                        help='development使用Django开发服务器，production使用多进程服务器并关闭DEBUG')
+    parser.add_argument('--workers', type=int, default=None, help='生产模式的工作进程数，默认为CPU核数')
+    parser.add_argument('--threads', type=int, default=4, help='生产模式下每个工作进程的线程数')
+    parser.add_argument('--interface', choices=['wsgi', 'asgi'], default='wsgi',
+                        help='生产模式的服务接口，asgi需要安装uvicorn')
+    parser.add_argument('--max-requests', type=int, default=0, help='工作进程处理多少个请求后重启，0为不重启')
     args = parser.parse_args()
     
     data_dir = create_default_directory()
@@ -437,10 +658,9 @@ def main() -> None:
     else:
         is_new_venv = create_or_update_venv(venv_dir)
         
-        if is_new_venv or not check_venv_dependencies(venv_dir):
-            if not install_requirements_in_venv(venv_dir):
-                print_message('deps_install_failed')
-                return
+        if not ensure_venv_dependencies(venv_dir, is_new_venv):
+            print_message('deps_install_failed')
+            return
         
         venv_site_packages = get_venv_site_packages(venv_dir)
         if os.path.exists(venv_site_packages):
@@ -462,11 +682,14 @@ def main() -> None:
     host = '0.0.0.0'
     print_message('starting_service', port)
     
-    # 在Linux下可能不一定会自动打开浏览器
-    try:
-        webbrowser.open(f"http://localhost:{port}")
-    except Exception:
-        print_message('browser_open_failed', port)
+    if args.serve == 'production':
+        print_message('starting_production')
+    else:
+        # 在Linux下可能不一定会自动打开浏览器
+        try:
+            webbrowser.open(f"http://localhost:{port}")
+        except Exception:
+            print_message('browser_open_failed', port)
     
     os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gfinder.settings')
     
@@ -477,7 +700,9 @@ def main() -> None:
         os.environ['LC_ALL'] = 'en_US.UTF-8'
     
     try:
-        if args.no_venv:
+        if args.serve == 'production':
+            run_production_server(args, base_dir, host, port, None if args.no_venv else venv_dir)
+        elif args.no_venv:
             from django.core.management import execute_from_command_line
             execute_from_command_line(['manage.py', 'runserver', f'{host}:{port}'])
         else: